@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Post, Comment, Like, Follow, Story, Conversation, Message, Notification
+from . import ranking
+from .models import User, Post, Comment, Like, Follow, Story, Conversation, ConversationMember, Message, Notification, MediaJob
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
@@ -12,10 +13,15 @@ class CustomUserAdmin(UserAdmin):
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('user', 'caption', 'likes_count', 'comments_count', 'created_at')
-    list_filter = ('created_at',)
+    list_display = ('user', 'caption', 'status', 'likes_count', 'comments_count', 'created_at')
+    list_filter = ('status', 'created_at')
     search_fields = ('user__username', 'caption')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if obj.status != 'ready':
+            ranking.unlist([obj.pk])
+
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('user', 'post', 'text', 'likes_count', 'created_at')
@@ -25,16 +31,28 @@ class CommentAdmin(admin.ModelAdmin):
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('follower', 'following', 'created_at')
 
+class ConversationMemberInline(admin.TabularInline):
+    model = ConversationMember
+    fields = ('user', 'last_read_id')
+    raw_id_fields = ('user',)
+    extra = 0
+
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
     list_display = ('id', 'is_group', 'group_name', 'admin', 'created_at')
-    filter_horizontal = ('participants',)
+    inlines = [ConversationMemberInline]
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('sender', 'conversation', 'text', 'is_read', 'created_at')
     list_filter = ('is_read', 'created_at')
 
+@admin.register(MediaJob)
+class MediaJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'post', 'user', 'status', 'progress', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('metadata',)
+
 admin.site.register(Like)
 admin.site.register(Story)
 admin.site.register(Notification)
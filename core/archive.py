@@ -0,0 +1,102 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Message, MessageArchiveSegment, User
+from .pagination import before
+
+# Messages older than this are moved out of the hot table by archive_messages
+ARCHIVE_AFTER = timedelta(days=getattr(settings, 'MESSAGE_ARCHIVE_AFTER_DAYS', 365))
+SEGMENT_SIZE = getattr(settings, 'MESSAGE_ARCHIVE_SEGMENT_SIZE', 500)
+
+def _encode(messages):
+    rows = [
+        [m.id, m.sender_id, m.text, m.image.name if m.image else '', m.is_read, m.created_at.isoformat()]
+        for m in messages
+    ]
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode())
+
+def _decode(segment):
+    messages = []
+    for pk, sender_id, text, image, is_read, created_at in json.loads(zlib.decompress(segment.data)):
+        messages.append(Message(
+            id=pk,
+            conversation_id=segment.conversation_id,
+            sender_id=sender_id,
+            text=text,
+            image=image or None,
+            is_read=is_read,
+            created_at=datetime.fromisoformat(created_at),
+        ))
+    return messages
+
+def archive_conversation(conversation_id, cutoff, segment_size=SEGMENT_SIZE):
+    """Move a conversation's messages created before cutoff into archive segments.
+
+    Each segment is written and its messages deleted in one transaction, so a
+    message is always in exactly one of the two tiers. Returns the number moved.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Message.objects.filter(conversation_id=conversation_id, created_at__lt=cutoff)
+                .order_by('created_at', 'id')[:segment_size]
+            )
+            if not batch:
+                return moved
+            first, last = batch[0], batch[-1]
+            MessageArchiveSegment.objects.create(
+                conversation_id=conversation_id,
+                first_id=first.id,
+                first_created_at=first.created_at,
+                last_id=last.id,
+                last_created_at=last.created_at,
+                message_count=len(batch),
+                data=_encode(batch),
+            )
+            Message.objects.filter(id__in=[m.id for m in batch]).delete()
+        moved += len(batch)
+
+def archive_messages(cutoff=None, segment_size=SEGMENT_SIZE):
+    """Archive old messages of every conversation; returns {conversation_id: moved}."""
+    cutoff = cutoff or timezone.now() - ARCHIVE_AFTER
+    conversation_ids = (
+        Message.objects.filter(created_at__lt=cutoff)
+        .order_by().values_list('conversation_id', flat=True).distinct()
+    )
+    return {
+        conversation_id: archive_conversation(conversation_id, cutoff, segment_size)
+        for conversation_id in list(conversation_ids)
+    }
+
+def history(conversation_id, key, limit):
+    """Return up to limit archived messages before a decoded cursor key, newest first.
+
+    key is a (created_at, id) pair or None for the newest archived messages.
+    Only the segments needed to fill the page are read and decompressed.
+    """
+    segments = MessageArchiveSegment.objects.filter(conversation_id=conversation_id)
+    if key:
+        segments = segments.filter(before(key, 'first_created_at', 'first_id'))
+
+    messages, senders = [], {}
+    for segment in segments.order_by('-first_created_at', '-first_id').iterator():
+        rows = list(reversed(_decode(segment)))
+        if key:
+            rows = [m for m in rows if (m.created_at, m.id) < key]
+        # Messages of deleted senders are dropped before counting towards the
+        # page, otherwise a short page would look like the end of the archive
+        unseen = {m.sender_id for m in rows} - senders.keys()
+        if unseen:
+            found = User.objects.in_bulk(unseen)
+            senders.update({sender_id: found.get(sender_id) for sender_id in unseen})
+        for message in rows:
+            if senders[message.sender_id]:
+                message.sender = senders[message.sender_id]
+                messages.append(message)
+        if len(messages) >= limit:
+            break
+    return messages[:limit]
@@ -0,0 +1,170 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Subquery
+from django.db.models.functions import Coalesce
+from . import archive, outbox, realtime
+from .models import Conversation, ConversationMember, Message, User
+from .pagination import CursorPage, decode_cursor, encode_cursor, paginate
+
+MESSAGE_PAGE_SIZE = getattr(settings, 'MESSAGE_PAGE_SIZE', 50)
+# Most messages returned by one catch-up request; clients repeat while has_more
+SYNC_LIMIT = getattr(settings, 'MESSAGE_SYNC_LIMIT', 500)
+
+def direct_key(user_id, other_id):
+    low, high = sorted((user_id, other_id))
+    return f"{low}:{high}"
+
+def get_or_create_direct(user, other):
+    """Return the 1:1 conversation between two users, creating it if needed.
+
+    Looked up by the unique direct_key, so the cost does not depend on how many
+    conversations either user is in. Returns (conversation, created).
+    """
+    key = direct_key(user.id, other.id)
+    conversation = Conversation.objects.filter(direct_key=key).first()
+    if conversation:
+        return conversation, False
+    try:
+        with transaction.atomic():
+            conversation = Conversation.objects.create(is_group=False, direct_key=key)
+            conversation.participants.add(user, other)
+        return conversation, True
+    except IntegrityError:
+        # Created concurrently by the other participant
+        return Conversation.objects.get(direct_key=key), False
+
+def resolve_usernames(usernames):
+    """Look up usernames with a single IN query.
+
+    Returns (users, unknown): users in the order first requested, without
+    duplicates, and the usernames that matched nobody.
+    """
+    usernames = list(dict.fromkeys(name for name in usernames if name))
+    found = {user.username: user for user in User.objects.filter(username__in=usernames)}
+    return [found[name] for name in usernames if name in found], [name for name in usernames if name not in found]
+
+def add_members(conversation, users):
+    """Add users to a conversation with one membership query and one bulk insert.
+
+    Returns (added, already_present) as lists of users. A user added by a
+    concurrent request between the membership query and the insert makes the
+    bulk insert fail; the users are then inserted one savepoint at a time and
+    the ones that turn out to be members already are reported as present.
+    """
+    present = set(
+        ConversationMember.objects.filter(conversation=conversation, user__in=users).values_list('user_id', flat=True)
+    )
+    added = [user for user in users if user.id not in present]
+    try:
+        with transaction.atomic():
+            ConversationMember.objects.bulk_create(
+                [ConversationMember(conversation=conversation, user=user) for user in added]
+            )
+    except IntegrityError:
+        inserted = []
+        for user in added:
+            try:
+                with transaction.atomic():
+                    ConversationMember.objects.create(conversation=conversation, user=user)
+                inserted.append(user)
+            except IntegrityError:
+                present.add(user.id)
+        added = inserted
+    return added, [user for user in users if user.id in present]
+
+def _messages(conversation_id):
+    return Message.objects.filter(conversation_id=conversation_id).select_related('sender')
+
+def message_history(conversation_id, cursor=None, limit=MESSAGE_PAGE_SIZE):
+    """Return the newest messages before the cursor, oldest first for display.
+
+    Without a cursor this is the latest page of the conversation; page.next_cursor
+    continues further back in time. Once the hot table runs out the page is
+    filled from archive segments, so clients page through both tiers alike.
+    """
+    page = paginate(_messages(conversation_id), cursor, limit)
+    if not page.has_more:
+        items = page.items
+        last = items[-1] if items else None
+        key = (last.created_at, last.id) if last else decode_cursor(cursor)
+        # One extra row tells whether the archive goes back further still
+        older = archive.history(conversation_id, key, limit - len(items) + 1)
+        items = items + older
+        if len(items) > limit:
+            items = items[:limit]
+            page = CursorPage(items, encode_cursor(items[-1].created_at, items[-1].id))
+        else:
+            page = CursorPage(items)
+    page.items.reverse()
+    return page
+
+def messages_after(conversation_id, after_id, limit=SYNC_LIMIT):
+    """Return messages newer than after_id in send order, for reconnecting clients.
+
+    has_more on the returned page means the delta was capped at limit and the
+    client should ask again from the last message it received.
+    """
+    items = list(_messages(conversation_id).filter(id__gt=after_id).order_by('created_at', 'id')[:limit + 1])
+    if len(items) > limit:
+        items = items[:limit]
+        return CursorPage(items, str(items[-1].id))
+    return CursorPage(items)
+
+def record_message(conversation, message):
+    """Record a new message as the conversation's latest; two single-row UPDATEs.
+
+    Other members see it as unread because it is newer than their last_read_id,
+    so their rows are left alone; the sender's is moved up to their own message.
+    """
+    conversation.last_message_id = message.id
+    conversation.last_message_preview = (message.text or ('Sent a photo' if message.image else ''))[:100]
+    conversation.last_message_sender_id = message.sender_id
+    conversation.last_message_at = message.created_at
+    conversation.save(update_fields=[
+        'last_message_id', 'last_message_preview', 'last_message_sender', 'last_message_at', 'updated_at',
+    ])
+    ConversationMember.objects.filter(conversation=conversation, user_id=message.sender_id).update(
+        last_read_id=message.id,
+    )
+
+def send(conversation, sender, text):
+    """Post a message from sender, including the group's system messages.
+
+    Updates the conversation's last message and the sender's read position, queues
+    the notifications for the outbox worker and publishes the message to
+    connected clients once the transaction commits. Returns the message.
+    """
+    with transaction.atomic():
+        message = Message.objects.create(conversation=conversation, sender=sender, text=text)
+        record_message(conversation, message)
+        outbox.enqueue(sender, 'message', conversation=conversation)
+        transaction.on_commit(lambda: realtime.publish_message(message))
+    return message
+
+def mark_read(conversation_id, user):
+    """Mark a conversation read up to its newest message; a single-row UPDATE."""
+    newest = Message.objects.filter(conversation_id=conversation_id).values('conversation').annotate(m=Max('id')).values('m')
+    return ConversationMember.objects.filter(conversation_id=conversation_id, user=user).update(
+        last_read_id=Coalesce(Subquery(newest), F('last_read_id')),
+    )
+
+def inbox(user):
+    """Return the user's memberships, most recently active conversation first.
+
+    Conversation and last-message sender are joined in and ordered by the
+    indexed conversation.last_message_at; the other participant of each 1:1
+    conversation is loaded with one extra query as member.other_user.
+    """
+    memberships = list(
+        ConversationMember.objects.filter(user=user)
+        .select_related('conversation__last_message_sender')
+        .order_by(F('conversation__last_message_at').desc(nulls_last=True), '-conversation_id')
+    )
+    direct = [m.conversation_id for m in memberships if not m.conversation.is_group]
+    others = {}
+    if direct:
+        for other in ConversationMember.objects.filter(conversation_id__in=direct).exclude(user=user).select_related('user'):
+            others[other.conversation_id] = other.user
+    for membership in memberships:
+        membership.other_user = others.get(membership.conversation_id)
+    return memberships
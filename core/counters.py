@@ -0,0 +1,177 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Func, Max, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from .models import Comment, CommentLike, Follow, Hashtag, Like, Notification, Post, PostHashtag, User
+
+logger = logging.getLogger(__name__)
+
+# With write-behind enabled, counter deltas are collected in process memory and
+# applied in batches at most FLUSH_INTERVAL seconds later; otherwise every
+# increment is its own atomic UPDATE.
+WRITE_BEHIND = getattr(settings, 'COUNTER_WRITE_BEHIND', False)
+FLUSH_INTERVAL = getattr(settings, 'COUNTER_FLUSH_INTERVAL', 1.0)
+MAX_PENDING = getattr(settings, 'COUNTER_MAX_PENDING', 1000)
+
+def apply_deltas(model, field, deltas):
+    """Apply {pk: delta} to a counter column with one UPDATE per distinct delta.
+
+    Uses SET field = MAX(field + n, 0) so concurrent writers never lose updates
+    and a drifted counter cannot violate the column's non-negative constraint.
+    """
+    pks_by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            pks_by_delta[delta].append(pk)
+    for delta, pks in pks_by_delta.items():
+        model.objects.filter(pk__in=pks).update(**{field: Greatest(F(field) + delta, 0)})
+
+class CounterBuffer:
+    """In-memory write-behind buffer of counter deltas keyed on (model, field, pk).
+
+    A daemon thread, started with the first delta in each process, flushes
+    every flush_interval seconds, so a delta reaches the database within about
+    one interval even when no further increments arrive. Reaching max_pending
+    keys flushes immediately.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._flusher = None
+
+    def _ensure_flusher(self):
+        # Checked on every add: a forked worker inherits the object but not the thread
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._run, name='counter-flush', daemon=True)
+            self._flusher.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._pending:
+                close_old_connections()
+                self.flush()
+
+    def add(self, model, pk, field, delta):
+        with self._lock:
+            self._ensure_flusher()
+            self._pending[(model, field, pk)] += delta
+            due = len(self._pending) >= self.max_pending
+        if due:
+            self.flush()
+
+    def pending(self, model, pk, field):
+        with self._lock:
+            return self._pending.get((model, field, pk), 0)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+
+        grouped = defaultdict(dict)
+        for (model, field, pk), delta in pending.items():
+            grouped[(model, field)][pk] = delta
+        for (model, field), deltas in grouped.items():
+            try:
+                apply_deltas(model, field, deltas)
+            except Exception as e:
+                # Lost deltas are repaired by the counter reconciliation job
+                logger.error(f"Failed to flush {len(deltas)} {model.__name__}.{field} deltas: {str(e)}")
+
+buffer = CounterBuffer()
+if WRITE_BEHIND:
+    atexit.register(buffer.flush)
+
+def increment(instance, field, delta=1):
+    increment_many(instance._meta.model, field, {instance.pk: delta})
+
+def increment_many(model, field, deltas):
+    if WRITE_BEHIND:
+        for pk, delta in deltas.items():
+            buffer.add(model, pk, field, delta)
+    else:
+        apply_deltas(model, field, deltas)
+
+def current_values(model, field, pks):
+    """Return {pk: counter} for many rows, including deltas still waiting in the buffer."""
+    values = dict(model.objects.filter(pk__in=pks).values_list('pk', field))
+    if WRITE_BEHIND:
+        values = {pk: max(value + buffer.pending(model, pk, field), 0) for pk, value in values.items()}
+    return values
+
+def current_value(instance, field):
+    """Reload a counter from the database, including deltas still waiting in the buffer."""
+    instance.refresh_from_db(fields=[field])
+    value = getattr(instance, field)
+    if WRITE_BEHIND:
+        value = max(value + buffer.pending(instance._meta.model, instance.pk, field), 0)
+        setattr(instance, field, value)
+    return value
+
+# (model, counter field, source model, source foreign key, source filter) for every denormalized counter
+RECONCILED_COUNTERS = [
+    (User, 'followers_count', Follow, 'following_id', {}),
+    (User, 'following_count', Follow, 'follower_id', {}),
+    (User, 'posts_count', Post, 'user_id', {'status': 'ready'}),
+    (User, 'unread_notifications_count', Notification, 'user_id', {'is_read': False}),
+    (Post, 'likes_count', Like, 'post_id', {}),
+    (Post, 'comments_count', Comment, 'post_id', {}),
+    (Comment, 'likes_count', CommentLike, 'comment_id', {}),
+    (Hashtag, 'posts_count', PostHashtag, 'hashtag_id', {}),
+]
+
+def _source_count(source, source_field, source_filter):
+    # COUNT(*) over one row's source rows, as a correlated subquery on the counter's table
+    return Subquery(
+        source.objects.filter(**(source_filter or {}))
+        .filter(**{source_field: OuterRef('pk')})
+        .order_by()
+        .annotate(n=Func(F('pk'), function='COUNT'))
+        .values('n')
+    )
+
+def reconcile(model, field, source, source_field, source_filter=None, chunk_size=10000, dry_run=False):
+    """Recompute a counter from its source rows one primary-key range at a time.
+
+    Each chunk runs in its own transaction: one SELECT finds the rows whose
+    stored value differs from a correlated COUNT of their source rows, and one
+    UPDATE sets those rows to the COUNT as evaluated by that statement. The
+    counter is assigned, not adjusted, so a like or a buffered delta landing
+    between the two statements is never counted twice. Deltas still waiting in
+    another process's write-behind buffer are added on top when it flushes and
+    are repaired by the next run.
+    """
+    stats = {'checked': 0, 'drifted': 0, 'total_drift': 0, 'max_drift': 0}
+    last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    actual = _source_count(source, source_field, source_filter)
+
+    for start in range(0, last_pk + 1, chunk_size):
+        end = start + chunk_size
+        with transaction.atomic():
+            chunk = model.objects.filter(pk__gte=start, pk__lt=end)
+            checked = chunk.count()
+            if not checked:
+                continue
+            drifted = list(
+                chunk.select_for_update()
+                .annotate(actual=actual)
+                .exclude(**{field: F('actual')})
+                .values_list('pk', field, 'actual')
+            )
+            if drifted and not dry_run:
+                model.objects.filter(pk__in=[pk for pk, _, _ in drifted]).update(**{field: actual})
+
+        drifts = [abs(value - stored) for _, stored, value in drifted]
+        stats['checked'] += checked
+        stats['drifted'] += len(drifts)
+        stats['total_drift'] += sum(drifts)
+        stats['max_drift'] = max([stats['max_drift']] + drifts)
+    return stats
@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from . import counters, notifications
+from .models import Comment, CommentLike, Like, Post, SavedPost
+
+MAX_BATCH_ACTIONS = getattr(settings, 'MAX_BATCH_ACTIONS', 500)
+
+# action type -> (target model, relation model, relation FK, counter field, response key)
+ACTIONS = {
+    'like_post': (Post, Like, 'post_id', 'likes_count', 'liked'),
+    'save_post': (Post, SavedPost, 'post_id', None, 'saved'),
+    'like_comment': (Comment, CommentLike, 'comment_id', 'likes_count', 'liked'),
+}
+# Targets that can be acted on: posts still processing or failed count as not found
+PUBLISHED = {
+    Post: {'status': 'ready'},
+    Comment: {'post__status': 'ready'},
+}
+
+def _desired_states(operations, existing):
+    """Replay queued operations in order and return the final on/off state per target id.
+
+    An operation with an explicit 'value' sets the state; one without toggles it.
+    """
+    states = {}
+    for target_id, value in operations:
+        current = states.get(target_id, target_id in existing)
+        states[target_id] = (not current) if value is None else value
+    return states
+
+def _chunks(ids, size=500):
+    return (ids[start:start + size] for start in range(0, len(ids), size))
+
+def _insert_relations(relation, fk, user, target_ids):
+    """Insert (user, target) rows with INSERT ... ON CONFLICT DO NOTHING; returns the target ids inserted."""
+    table, column = relation._meta.db_table, relation._meta.get_field(fk.removesuffix('_id')).column
+    created_at = connection.ops.adapt_datetimefield_value(timezone.now())
+    inserted = []
+    with connection.cursor() as cursor:
+        for chunk in _chunks(target_ids):
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, {column}, created_at) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT (user_id, {column}) DO NOTHING RETURNING {column}",
+                [value for target_id in chunk for value in (user.id, target_id, created_at)],
+            )
+            inserted.extend(row[0] for row in cursor.fetchall())
+    return inserted
+
+def _delete_relations(relation, fk, user, target_ids):
+    """Delete the user's rows for target_ids with DELETE ... RETURNING; returns the target ids deleted."""
+    table, column = relation._meta.db_table, relation._meta.get_field(fk.removesuffix('_id')).column
+    deleted = []
+    with connection.cursor() as cursor:
+        for chunk in _chunks(target_ids):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE user_id = %s AND {column} IN ({', '.join(['%s'] * len(chunk))}) "
+                f"RETURNING {column}",
+                [user.id, *chunk],
+            )
+            deleted.extend(row[0] for row in cursor.fetchall())
+    return deleted
+
+def _apply(user, action, operations):
+    target_model, relation, fk, counter_field, state_key = ACTIONS[action]
+    target_ids = {target_id for target_id, _ in operations}
+
+    known = set(target_model.objects.filter(id__in=target_ids, **PUBLISHED[target_model]).values_list('id', flat=True))
+    operations = [(target_id, value) for target_id, value in operations if target_id in known]
+    existing = set(relation.objects.filter(user=user, **{f'{fk}__in': known}).values_list(fk, flat=True))
+    states = _desired_states(operations, existing)
+
+    to_create = [target_id for target_id, on in states.items() if on and target_id not in existing]
+    to_delete = [target_id for target_id, on in states.items() if not on and target_id in existing]
+
+    # RETURNING reports only the rows these statements changed, so a like or
+    # unlike made concurrently through the single endpoints is not counted twice
+    created = _insert_relations(relation, fk, user, to_create)
+    deleted = _delete_relations(relation, fk, user, to_delete)
+
+    if counter_field:
+        deltas = {target_id: 1 for target_id in created}
+        deltas.update({target_id: -1 for target_id in deleted})
+        counters.increment_many(target_model, counter_field, deltas)
+
+    if action == 'like_post' and created:
+        owners = Post.objects.filter(id__in=created).values_list('user_id', 'id')
+        notifications.notify_many(user, 'like', [(owner_id, post_id, None, None) for owner_id, post_id in owners])
+
+    results = {target_id: {state_key: on} for target_id, on in states.items()}
+    if counter_field and states:
+        for target_id, count in counters.current_values(target_model, counter_field, list(states)).items():
+            results[target_id][counter_field] = count
+    return results, sorted(target_ids - known)
+
+def apply_batch(user, actions):
+    """Apply a list of queued like/save/comment-like actions in one transaction.
+
+    Each action is a dict with 'type', 'id' and an optional boolean 'value'.
+    Returns the final per-object state for every touched object and the
+    actions that could not be applied.
+    """
+    operations = {action: [] for action in ACTIONS}
+    errors = []
+    for index, item in enumerate(actions[:MAX_BATCH_ACTIONS]):
+        action = item.get('type') if isinstance(item, dict) else None
+        try:
+            target_id = int(item.get('id'))
+        except (AttributeError, TypeError, ValueError):
+            target_id = None
+        if action not in ACTIONS or target_id is None:
+            errors.append({'index': index, 'error': 'Invalid action'})
+            continue
+        # Only JSON booleans: bool('false') would turn the state on
+        value = item.get('value')
+        if value is not None and not isinstance(value, bool):
+            errors.append({'index': index, 'error': 'value must be true or false'})
+            continue
+        operations[action].append((target_id, value))
+
+    if len(actions) > MAX_BATCH_ACTIONS:
+        errors.append({'index': MAX_BATCH_ACTIONS, 'error': f'Only the first {MAX_BATCH_ACTIONS} actions were applied'})
+
+    results = {}
+    with transaction.atomic():
+        for action, action_operations in operations.items():
+            if not action_operations:
+                continue
+            results[action], missing = _apply(user, action, action_operations)
+            errors.extend({'type': action, 'id': target_id, 'error': 'Not found'} for target_id in missing)
+    return results, errors
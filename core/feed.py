@@ -0,0 +1,146 @@
+from django.conf import settings
+from . import images
+from .models import Follow, FeedItem, Like, Post, PostHashtag, PostScore, PulledPost, SavedPost
+from .pagination import PAGE_SIZE, CursorPage, before, decode_cursor, encode_cursor, paginate
+
+# Posts by authors with at least this many followers are not fanned out on
+# write; they are recorded as PulledPost and merged into readers' timelines at
+# read time instead. The choice is made once per post, so an author crossing
+# the threshold in either direction leaves their earlier posts where they are.
+FANOUT_MAX_FOLLOWERS = getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 10000)
+# How many recent posts of a newly followed account are copied into the inbox
+BACKFILL_SIZE = getattr(settings, 'FEED_BACKFILL_SIZE', 50)
+BATCH_SIZE = 1000
+
+def is_celebrity(user):
+    return user.followers_count >= FANOUT_MAX_FOLLOWERS
+
+def _bulk_insert(items):
+    FeedItem.objects.bulk_create(items, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+def fan_out_post(post):
+    """Write a new post into its author's inbox and every follower's inbox.
+
+    A celebrity's post goes to the author's inbox only and is recorded as pulled.
+    """
+    recipients = [post.user_id]
+    if is_celebrity(post.user):
+        PulledPost.objects.get_or_create(post=post, defaults={'author_id': post.user_id, 'created_at': post.created_at})
+    else:
+        recipients.extend(
+            Follow.objects.filter(following_id=post.user_id)
+            .values_list('follower_id', flat=True)
+            .iterator(chunk_size=BATCH_SIZE)
+        )
+
+    batch = []
+    for user_id in recipients:
+        batch.append(FeedItem(user_id=user_id, post_id=post.id, author_id=post.user_id, created_at=post.created_at))
+        if len(batch) >= BATCH_SIZE:
+            _bulk_insert(batch)
+            batch = []
+    if batch:
+        _bulk_insert(batch)
+
+def _pushed_posts(author_id):
+    # An author's posts that were fanned out on write, newest first
+    return Post.objects.filter(user_id=author_id, status='ready', pulled__isnull=True).order_by('-created_at', '-id')
+
+def backfill_follow(follower, followed):
+    """Copy the most recent fanned-out posts of a newly followed account into the follower's inbox."""
+    recent = _pushed_posts(followed.id).values_list('id', 'created_at')[:BACKFILL_SIZE]
+    _bulk_insert([
+        FeedItem(user_id=follower.id, post_id=post_id, author_id=followed.id, created_at=created_at)
+        for post_id, created_at in recent
+    ])
+
+def prune_unfollow(follower, unfollowed):
+    FeedItem.objects.filter(user=follower, author=unfollowed).delete()
+
+def rebuild_feed(user):
+    """Rebuild a user's inbox from scratch from their own and followed authors' recent posts."""
+    FeedItem.objects.filter(user=user).delete()
+    authors = [user.id]
+    authors.extend(Follow.objects.filter(follower=user).values_list('following_id', flat=True))
+    items = []
+    for author_id in authors:
+        recent = _pushed_posts(author_id).values_list('id', 'created_at')[:BACKFILL_SIZE]
+        items.extend(
+            FeedItem(user_id=user.id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, created_at in recent
+        )
+    _bulk_insert(items)
+
+def home_feed(user, cursor=None, limit=PAGE_SIZE):
+    """Return a page of a user's home timeline, newest first.
+
+    Reads the user's inbox with a single index range scan and merges in the
+    recent pulled posts of followed accounts, which were never fanned out. The
+    followed accounts are matched by a subquery, so only the celebrities among
+    them, the only authors with pulled posts, are ever read.
+    """
+    key = decode_cursor(cursor)
+    items = FeedItem.objects.filter(user=user)
+    if key:
+        items = items.filter(before(key, pk_field='post_id'))
+    entries = list(items.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:limit + 1])
+
+    following = Follow.objects.filter(follower=user).values('following_id')
+    pulled = PulledPost.objects.filter(author_id__in=following, post__status='ready')
+    if key:
+        pulled = pulled.filter(before(key, pk_field='post_id'))
+    entries.extend(pulled.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:limit + 1])
+    entries = sorted(set(entries), reverse=True)
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_cursor(*entries[-1])
+
+    post_ids = [post_id for _, post_id in entries]
+    posts = Post.objects.select_related('user').in_bulk(post_ids)
+    return CursorPage([posts[post_id] for post_id in post_ids if post_id in posts], next_cursor)
+
+def explore_feed(cursor=None, limit=PAGE_SIZE):
+    """Return a page of trending posts from the precomputed PostScore table.
+
+    Falls back to newest-first until the scores have been computed at least once.
+    """
+    if not PostScore.objects.exists():
+        return paginate(Post.objects.filter(status='ready').select_related('user'), cursor, limit)
+
+    # Only ready posts have scores (see ranking.unlist), so no status join is needed
+    scores = PostScore.objects.select_related('post__user')
+    page = paginate(scores, cursor, limit, order_field='score', pk_field='post_id')
+    page.items = [score.post for score in page.items]
+    return page
+
+def tag_feed(hashtag, cursor=None, limit=PAGE_SIZE):
+    """Return a page of a hashtag's posts, newest first, as a range scan of PostHashtag."""
+    page = paginate(
+        PostHashtag.objects.filter(hashtag=hashtag, post__status='ready').select_related('post__user'),
+        cursor, limit, pk_field='post_id'
+    )
+    page.items = [link.post for link in page.items]
+    return page
+
+def annotate_posts(posts, viewer):
+    """Attach the viewer's liked/saved state to a page of posts.
+
+    Costs one query per relation regardless of page size, so templates can read
+    post.is_liked_by_user and post.is_saved_by_user without per-post lookups.
+    Callers are expected to have loaded authors with select_related('user').
+    Image derivatives for the posts and their authors' avatars come in one more
+    query.
+    """
+    post_ids = [post.id for post in posts]
+    liked = saved = set()
+    if post_ids:
+        liked = set(Like.objects.filter(user=viewer, post_id__in=post_ids).values_list('post_id', flat=True))
+        saved = set(SavedPost.objects.filter(user=viewer, post_id__in=post_ids).values_list('post_id', flat=True))
+
+    for post in posts:
+        post.is_liked_by_user = post.id in liked
+        post.is_saved_by_user = post.id in saved
+    images.attach([(post, 'image') for post in posts] + [(post.user, 'profile_picture') for post in posts])
+    return posts
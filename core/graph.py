@@ -0,0 +1,185 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+import numpy as np
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from .models import Follow, FollowChange, User
+from .pagination import paginate
+from .snapshots import Snapshot
+
+# Full reload interval; follows made since the last load are read from the database
+REFRESH_SECONDS = getattr(settings, 'FOLLOW_GRAPH_REFRESH_SECONDS', 300)
+# How long a change is remembered for; a snapshot older than this is not trusted at all
+CHANGE_TTL = 2 * REFRESH_SECONDS
+# Allowance for the clocks of workers on different hosts
+CLOCK_SKEW = 1.0
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+def _edges(ids):
+    """Return (src, dst) positions in the sorted ids array of every follow between users in ids."""
+    edges = Follow.objects.values_list('follower_id', 'following_id').iterator(chunk_size=50000)
+    pairs = np.fromiter((value for edge in edges for value in edge), dtype=np.int64).reshape(-1, 2)
+    src = np.searchsorted(ids, pairs[:, 0])
+    dst = np.searchsorted(ids, pairs[:, 1])
+    valid = (src < len(ids)) & (dst < len(ids))
+    valid[valid] &= (ids[src[valid]] == pairs[valid, 0]) & (ids[dst[valid]] == pairs[valid, 1])
+    return src[valid], dst[valid]
+
+def _csr(src, dst, size):
+    """Return (indptr, indices): the neighbours of position i are indices[indptr[i]:indptr[i + 1]], sorted."""
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=size), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32)
+
+def _at(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+def _sorted_ids(queryset, field):
+    return np.array(sorted(queryset.values_list(field, flat=True)), dtype=np.int64)
+
+class FollowGraph(Snapshot):
+    """Follow graph held as CSR adjacency arrays, in both directions.
+
+    Users map to dense positions in a sorted id array; each direction stores an
+    offsets array and an int32 array of neighbour positions sorted per row, so
+    an edge costs 8 bytes. Every follow and unfollow records in FollowChange the
+    time each side last changed (see changed), and a row changed
+    since this worker's snapshot was taken is answered from the indexed Follow
+    table instead, so all workers see a follow as soon as it is made.
+    """
+
+    refresh_seconds = REFRESH_SECONDS
+    label = 'follow graph'
+
+    def __init__(self):
+        super().__init__()
+        self._ids = _EMPTY
+        self._out_ptr = self._in_ptr = np.zeros(1, dtype=np.int64)
+        self._out = self._in = np.empty(0, dtype=np.int32)
+        # Wall-clock time the snapshot was read from, comparable across workers
+        self._taken_at = float('-inf')
+
+    def load(self):
+        taken_at = time.time()
+        ids = np.fromiter(User.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=50000), dtype=np.int64)
+        # Edges to users created after the id snapshot are picked up by the next reload
+        src, dst = _edges(ids)
+        # No worker trusts a snapshot older than CHANGE_TTL, so older changes are moot
+        FollowChange.objects.filter(changed_at__lt=_at(taken_at - CHANGE_TTL)).delete()
+
+        out_ptr, out = _csr(src, dst, len(ids))
+        in_ptr, into = _csr(dst, src, len(ids))
+        with self._lock:
+            self._ids = ids
+            self._out_ptr, self._out = out_ptr, out
+            self._in_ptr, self._in = in_ptr, into
+            self._taken_at = taken_at
+            self.loaded_at = time.monotonic()
+        return len(out)
+
+    def _stale(self, *rows):
+        """Return the (direction, user_id) rows changed since the snapshot was taken."""
+        self._ensure_loaded()
+        taken_at = self._taken_at
+        if time.time() - taken_at > CHANGE_TTL:
+            return set(rows)
+        match = Q()
+        for direction, user_id in rows:
+            match |= Q(direction=direction, user_id=user_id)
+        return set(
+            FollowChange.objects.filter(match, changed_at__gte=_at(taken_at - CLOCK_SKEW)).values_list('direction', 'user_id')
+        )
+
+    def _position(self, user_id):
+        position = int(np.searchsorted(self._ids, user_id))
+        if position < len(self._ids) and self._ids[position] == user_id:
+            return position
+        return None
+
+    def _row(self, indptr, indices, user_id):
+        with self._lock:
+            position = self._position(user_id)
+            return _EMPTY if position is None else self._ids[indices[indptr[position]:indptr[position + 1]]]
+
+    def _following(self, user_id, stale):
+        if ('out', user_id) in stale:
+            return _sorted_ids(Follow.objects.filter(follower_id=user_id), 'following_id')
+        return self._row(self._out_ptr, self._out, user_id)
+
+    def changed(self, follower_id, following_id):
+        """Announce a follow or unfollow, after it is committed, to every worker's graph.
+
+        One upsert into FollowChange, which unlike a cache never evicts a change
+        that some worker's snapshot has not seen yet.
+        """
+        now = timezone.now()
+        FollowChange.objects.bulk_create(
+            [
+                FollowChange(user_id=follower_id, direction='out', changed_at=now),
+                FollowChange(user_id=following_id, direction='in', changed_at=now),
+            ],
+            update_conflicts=True, unique_fields=['user', 'direction'], update_fields=['changed_at'],
+        )
+
+    def following(self, user_id):
+        """Sorted array of the ids user_id follows."""
+        return self._following(user_id, self._stale(('out', user_id)))
+
+    def followers(self, user_id):
+        """Sorted array of the ids following user_id."""
+        if self._stale(('in', user_id)):
+            return _sorted_ids(Follow.objects.filter(following_id=user_id), 'follower_id')
+        return self._row(self._in_ptr, self._in, user_id)
+
+    def is_following(self, follower_id, following_id):
+        if self._stale(('out', follower_id)):
+            return Follow.objects.filter(follower_id=follower_id, following_id=following_id).exists()
+        row = self._row(self._out_ptr, self._out, follower_id)
+        at = int(np.searchsorted(row, following_id))
+        return at < len(row) and row[at] == following_id
+
+    def following_among(self, user_id, user_ids):
+        """Return the subset of user_ids that user_id follows."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        if self._stale(('out', user_id)):
+            return set(Follow.objects.filter(follower_id=user_id, following_id__in=user_ids).values_list('following_id', flat=True))
+        candidates = np.array(user_ids, dtype=np.int64)
+        return set(candidates[np.isin(candidates, self._row(self._out_ptr, self._out, user_id))].tolist())
+
+    def followed_by(self, viewer_id, user_id):
+        """Sorted array of the accounts viewer_id follows that also follow user_id."""
+        stale = self._stale(('out', viewer_id), ('in', user_id))
+        following = self._following(viewer_id, stale)
+        if ('in', user_id) in stale:
+            # Only the viewer's side is needed, however many followers user_id has
+            return _sorted_ids(Follow.objects.filter(following_id=user_id, follower_id__in=following.tolist()), 'follower_id')
+        return np.intersect1d(following, self._row(self._in_ptr, self._in, user_id), assume_unique=True)
+
+    def mutual(self, user_id, other_id):
+        """Sorted array of the ids both users follow."""
+        stale = self._stale(('out', user_id), ('out', other_id))
+        return np.intersect1d(self._following(user_id, stale), self._following(other_id, stale), assume_unique=True)
+
+follows = FollowGraph()
+
+def _follow_page(queryset, related, viewer, cursor):
+    """Page through Follow rows newest first with the viewer's follow state on each.
+
+    viewer_follows is an EXISTS subquery on the page query itself, so a page is
+    one query no matter how many accounts the list holds.
+    """
+    queryset = queryset.select_related(related).annotate(
+        viewer_follows=Exists(Follow.objects.filter(follower=viewer, following=OuterRef(related)))
+    )
+    return paginate(queryset, cursor)
+
+def followers_page(user, viewer, cursor=None):
+    return _follow_page(Follow.objects.filter(following=user), 'follower', viewer, cursor)
+
+def following_page(user, viewer, cursor=None):
+    return _follow_page(Follow.objects.filter(follower=user), 'following', viewer, cursor)
@@ -0,0 +1,141 @@
+import logging
+import os
+from io import BytesIO
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps, features
+from .models import ImageDerivative
+
+logger = logging.getLogger(__name__)
+
+# Target width in pixels and whether the derivative is a centred square crop.
+# Square sizes serve avatars and grids, the others keep the original aspect ratio.
+SIZES = {
+    'thumb': (150, True),
+    'grid': (600, True),
+    'feed': (640, False),
+    'full': (1080, False),
+}
+# Derivatives interchangeable in one srcset: same crop, different resolutions
+FAMILIES = {
+    'thumb': ('thumb', 'grid'),
+    'grid': ('thumb', 'grid'),
+    'feed': ('feed', 'full'),
+    'full': ('feed', 'full'),
+}
+# Default sizes attribute per requested size, matching the CSS layout
+DISPLAY_SIZES = {
+    'thumb': '150px',
+    'grid': '(max-width: 735px) 33vw, 300px',
+    'feed': '(max-width: 640px) 100vw, 470px',
+    'full': '(max-width: 1080px) 100vw, 600px',
+}
+FORMAT = getattr(settings, 'IMAGE_DERIVATIVE_FORMAT', 'webp' if features.check('webp') else 'jpeg')
+QUALITY = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', 80)
+
+def _flatten(image):
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+def _resize(image, width, square):
+    """Scale image down to width (never up), centre-cropping to a square if asked."""
+    if square:
+        side = min(width, image.width, image.height)
+        return ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+def generate(field_file):
+    """Write every derivative of an uploaded image and record them; returns the rows.
+
+    Replaces derivatives from an earlier upload to the same name. Unreadable
+    images are logged and skipped so the original keeps being served.
+    """
+    if not field_file:
+        return []
+    try:
+        with field_file.open('rb') as handle:
+            source = _flatten(Image.open(handle))
+    except (OSError, Image.DecompressionBombError):
+        logger.warning(f"Could not read image {field_file.name} for derivatives", exc_info=True)
+        return []
+
+    stem = os.path.splitext(os.path.basename(field_file.name))[0]
+    derivatives = []
+    for size, (width, square) in SIZES.items():
+        image = _resize(source, width, square)
+        buffer = BytesIO()
+        image.save(buffer, FORMAT.upper(), quality=QUALITY, optimize=True)
+        derivative = ImageDerivative(
+            source=field_file.name, size=size, format=FORMAT,
+            width=image.width, height=image.height, bytes=buffer.tell(),
+        )
+        derivative.file.save(f"{stem}_{size}.{FORMAT}", ContentFile(buffer.getvalue()), save=False)
+        derivatives.append(derivative)
+
+    with transaction.atomic():
+        stale = ImageDerivative.objects.filter(source=field_file.name, format=FORMAT)
+        paths = list(stale.values_list('file', flat=True))
+        stale.delete()
+        ImageDerivative.objects.bulk_create(derivatives)
+        # Old files go only once the rows pointing at them are gone for good
+        transaction.on_commit(lambda: _delete_files(paths))
+    return derivatives
+
+def _delete_files(paths):
+    storage = ImageDerivative._meta.get_field('file').storage
+    for path in paths:
+        try:
+            storage.delete(path)
+        except OSError:
+            logger.warning(f"Could not delete stale derivative {path}", exc_info=True)
+
+def discard(field_file):
+    """Delete the derivative files and rows of an image that is being thrown away."""
+    derivatives = ImageDerivative.objects.filter(source=field_file.name)
+    for derivative in derivatives:
+        derivative.file.delete(save=False)
+    derivatives.delete()
+
+def _lookup(names):
+    found = {name: {} for name in names}
+    for derivative in ImageDerivative.objects.filter(source__in=names, format=FORMAT):
+        found[derivative.source][derivative.size] = derivative
+    return found
+
+def attach(fields):
+    """Load derivatives for (instance, field_name) pairs in one query.
+
+    The srcset tag reads them from the instance instead of querying per image.
+    """
+    fields = [(instance, name) for instance, name in fields if getattr(instance, name)]
+    found = _lookup({getattr(instance, name).name for instance, name in fields})
+    for instance, name in fields:
+        instance.__dict__.setdefault('_image_derivatives', {})[name] = found[getattr(instance, name).name]
+
+def derivatives_for(field_file):
+    """Return {size: ImageDerivative} for an image field, querying only if not attached."""
+    instance, name = field_file.instance, field_file.field.name
+    cached = instance.__dict__.setdefault('_image_derivatives', {})
+    if name not in cached:
+        cached[name] = _lookup([field_file.name])[field_file.name]
+    return cached[name]
+
+def srcset(field_file, size):
+    """Return (src, srcset) for displaying an image at size; srcset is '' without derivatives."""
+    derivatives = derivatives_for(field_file)
+    if size not in derivatives:
+        return field_file.url, ''
+    candidates = sorted(
+        {derivatives[name].width: derivatives[name] for name in FAMILIES[size] if name in derivatives}.values(),
+        key=lambda derivative: derivative.width,
+    )
+    return derivatives[size].file.url, ', '.join(f"{d.file.url} {d.width}w" for d in candidates)
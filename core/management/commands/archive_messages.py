@@ -0,0 +1,20 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.archive import ARCHIVE_AFTER, SEGMENT_SIZE, archive_messages
+
+class Command(BaseCommand):
+    help = "Move old messages out of the hot message table into compressed archive segments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=ARCHIVE_AFTER.days,
+                            help='Archive messages created more than this many days ago')
+        parser.add_argument('--segment-size', type=int, default=SEGMENT_SIZE, help='Messages per archive segment')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        moved = archive_messages(cutoff, options['segment_size'])
+        total = sum(moved.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total} messages from {len(moved)} conversations created before {cutoff:%Y-%m-%d}"
+        ))
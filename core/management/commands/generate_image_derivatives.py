@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from core import images
+from core.models import ImageDerivative, Post, Story, User
+
+class Command(BaseCommand):
+    help = "Create resized derivatives for uploaded images that do not have them yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        done = set() if options['force'] else set(
+            ImageDerivative.objects.filter(format=images.FORMAT).values_list('source', flat=True).distinct()
+        )
+        generated = 0
+        for model, field in ((Post, 'image'), (Story, 'image'), (User, 'profile_picture')):
+            queryset = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).only('id', field)
+            for instance in queryset.iterator(chunk_size=500):
+                field_file = getattr(instance, field)
+                if field_file.name in done:
+                    continue
+                if images.generate(field_file):
+                    generated += 1
+                done.add(field_file.name)
+        self.stdout.write(self.style.SUCCESS(f"Generated derivatives for {generated} images"))
@@ -0,0 +1,64 @@
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import django
+from django.core.management.base import BaseCommand
+from core import uploads
+
+class Command(BaseCommand):
+    help = "Validate uploaded post media and generate derivatives in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='Worker processes')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Process the current backlog and exit')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        # Spawned workers set Django up from scratch and open their own database
+        # connections instead of inheriting ours
+        context = multiprocessing.get_context('spawn')
+        pool = ProcessPoolExecutor(workers, mp_context=context, initializer=django.setup)
+        try:
+            while True:
+                requeued = uploads.requeue_stale()
+                if requeued:
+                    self.stdout.write(f"Requeued {requeued} stale jobs")
+
+                job_ids = uploads.claim(workers * 2)
+                if job_ids:
+                    results, pool = self.run_jobs(pool, job_ids, workers, context)
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Processed {len(job_ids)} jobs: {results['done']} done, {results['failed']} failed, "
+                        f"{results['queued']} requeued, {results['error']} left for the stale job check"
+                    ))
+                    continue
+
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            pool.shutdown()
+
+    def run_jobs(self, pool, job_ids, workers, context):
+        """Run claimed jobs; a job that raises or kills its worker never stops the loop."""
+        results = Counter()
+        futures = {pool.submit(uploads.process, job_id): job_id for job_id in job_ids}
+        broken = False
+        for future, job_id in futures.items():
+            try:
+                results[future.result()] += 1
+            except BrokenProcessPool:
+                broken = True
+                results['error'] += 1
+            except Exception as e:
+                self.stderr.write(f"Media job {job_id} raised {e!r}")
+                results['error'] += 1
+
+        if broken:
+            self.stderr.write("A media worker died; starting a new pool")
+            pool.shutdown(wait=False)
+            pool = ProcessPoolExecutor(workers, mp_context=context, initializer=django.setup)
+        return results, pool
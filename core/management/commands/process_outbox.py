@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from core.outbox import drain, lag
+
+class Command(BaseCommand):
+    help = "Drain the notification outbox into Notification rows (run a single worker)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Events per transaction')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the current backlog and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            pending, age = lag()
+            if pending:
+                self.stdout.write(f"Outbox lag: {pending} events, oldest {age:.1f}s")
+
+            processed = 0
+            while True:
+                drained = drain(options['batch_size'])
+                processed += drained
+                if drained < options['batch_size']:
+                    break
+            if processed:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} events"))
+
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from core.feed import rebuild_feed
+from core.models import User
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from the Follow and Post tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild these users (default: everyone)')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        count = 0
+        for user in users.iterator():
+            rebuild_feed(user)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} feeds"))
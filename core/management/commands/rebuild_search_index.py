@@ -0,0 +1,14 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.search import fts_enabled, rebuild
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text index over post captions and alt text"
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            raise CommandError("The full-text index is only available on SQLite")
+
+        started = time.monotonic()
+        count = rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} posts in {time.monotonic() - started:.2f}s"))
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from core.ranking import last_refresh, refresh_scores
+
+class Command(BaseCommand):
+    help = "Fold new likes, comments, saves and shares into the trending PostScore table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Discard existing scores and rebuild from all activity')
+
+    def handle(self, *args, **options):
+        since = None if options['full'] else last_refresh()
+        started = time.monotonic()
+        updated = refresh_scores(full=options['full'])
+        elapsed = time.monotonic() - started
+
+        window = f"since {since:%Y-%m-%d %H:%M:%S}" if since else "from all activity"
+        self.stdout.write(self.style.SUCCESS(f"Scored {updated} posts {window} in {elapsed:.2f}s"))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_feeditem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='core.post')),
+                ('score', models.FloatField()),
+                ('updated_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score', '-post'], name='core_postsc_score_2d0a12_idx')],
+            },
+        ),
+    ]
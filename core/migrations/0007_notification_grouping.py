@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_groups(apps, schema_editor):
+    Notification = apps.get_model('core', 'Notification')
+    Notification.objects.update(updated_at=models.F('created_at'))
+    for notification in Notification.objects.only('id', 'from_user_id').iterator():
+        Notification.objects.filter(pk=notification.pk).update(latest_actors=[notification.from_user_id])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_postscore'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='notification',
+            options={'ordering': ['-updated_at']},
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='latest_actors',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_groups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:15
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    Notification = apps.get_model('core', 'Notification')
+    unread = (
+        Notification.objects.filter(user=models.OuterRef('pk'), is_read=False)
+        .values('user')
+        .annotate(n=models.Count('pk'))
+        .values('n')
+    )
+    User.objects.update(unread_notifications_count=Coalesce(models.Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_outboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_notifications_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_members(apps, schema_editor):
+    ConversationMember = apps.get_model('core', 'ConversationMember')
+    Message = apps.get_model('core', 'Message')
+    messages = Message.objects.filter(conversation=models.OuterRef('conversation'))
+    unread = messages.filter(is_read=False).exclude(sender=models.OuterRef('user'))
+    last = messages.order_by('-created_at', '-id')
+    ConversationMember.objects.update(
+        unread_count=Coalesce(
+            models.Subquery(unread.values('conversation').annotate(n=models.Count('pk')).values('n')), 0
+        ),
+        last_read_id=Coalesce(
+            models.Subquery(
+                messages.filter(models.Q(is_read=True) | models.Q(sender=models.OuterRef('user')))
+                .values('conversation').annotate(m=models.Max('pk')).values('m')
+            ), 0
+        ),
+        last_message_preview=Coalesce(models.Subquery(last.values(preview=Substr('text', 1, 100))[:1]), models.Value('')),
+        last_message_sender=models.Subquery(last.values('sender')[:1]),
+        last_message_at=models.Subquery(last.values('created_at')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_message_history_index'),
+    ]
+
+    operations = [
+        # Adopt the existing auto-created participants table as the through model
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ConversationMember',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='core.conversation')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'core_conversation_participants',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='conversations', through='core.ConversationMember', through_fields=('conversation', 'user'), to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AlterModelTable(
+            name='conversationmember',
+            table=None,
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_members, migrations.RunPython.noop),
+    ]
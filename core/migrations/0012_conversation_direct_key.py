@@ -0,0 +1,59 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:22
+
+from collections import defaultdict
+from django.db import migrations, models
+
+
+def backfill_direct_keys(apps, schema_editor):
+    Conversation = apps.get_model('core', 'Conversation')
+    ConversationMember = apps.get_model('core', 'ConversationMember')
+    Message = apps.get_model('core', 'Message')
+    OutboxEvent = apps.get_model('core', 'OutboxEvent')
+    Share = apps.get_model('core', 'Share')
+
+    members = defaultdict(set)
+    for conversation_id, user_id in ConversationMember.objects.filter(conversation__is_group=False).values_list('conversation_id', 'user_id'):
+        members[conversation_id].add(user_id)
+
+    by_key = defaultdict(list)
+    for conversation_id, user_ids in members.items():
+        if len(user_ids) == 2:
+            low, high = sorted(user_ids)
+            by_key[f"{low}:{high}"].append(conversation_id)
+
+    for key, conversation_ids in by_key.items():
+        keep, *duplicates = sorted(conversation_ids)
+        if duplicates:
+            # Fold duplicate conversations into the oldest one
+            for model in (Message, OutboxEvent, Share):
+                model.objects.filter(conversation_id__in=duplicates).update(conversation_id=keep)
+            rows = defaultdict(list)
+            for member in ConversationMember.objects.filter(conversation_id__in=conversation_ids):
+                rows[member.user_id].append(member)
+            for user_rows in rows.values():
+                kept = next(member for member in user_rows if member.conversation_id == keep)
+                latest = max(user_rows, key=lambda member: (member.last_message_at is not None, member.last_message_at or 0))
+                kept.unread_count = sum(member.unread_count for member in user_rows)
+                kept.last_read_id = max(member.last_read_id for member in user_rows)
+                kept.last_message_preview = latest.last_message_preview
+                kept.last_message_sender_id = latest.last_message_sender_id
+                kept.last_message_at = latest.last_message_at
+                kept.save()
+            Conversation.objects.filter(id__in=duplicates).delete()
+        Conversation.objects.filter(id=keep).update(direct_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_conversation_member'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='direct_key',
+            field=models.CharField(blank=True, max_length=41, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_direct_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_conversation_direct_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_id', models.BigIntegerField()),
+                ('first_created_at', models.DateTimeField()),
+                ('last_id', models.BigIntegerField()),
+                ('last_created_at', models.DateTimeField()),
+                ('message_count', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='core.conversation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['conversation', '-first_created_at', '-first_id'], name='core_messag_convers_6d0df0_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:30
+
+from django.db import migrations
+
+# External-content FTS5 index over Post.caption and Post.alt_text. Triggers keep
+# it in step with every insert, update and delete on core_post, including bulk
+# and admin writes; other database backends fall back to LIKE queries.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE core_post_fts USING fts5(
+        caption, alt_text,
+        content='core_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER core_post_fts_insert AFTER INSERT ON core_post BEGIN
+        INSERT INTO core_post_fts(rowid, caption, alt_text) VALUES (new.id, new.caption, new.alt_text);
+    END
+    """,
+    """
+    CREATE TRIGGER core_post_fts_delete AFTER DELETE ON core_post BEGIN
+        INSERT INTO core_post_fts(core_post_fts, rowid, caption, alt_text) VALUES ('delete', old.id, old.caption, old.alt_text);
+    END
+    """,
+    """
+    CREATE TRIGGER core_post_fts_update AFTER UPDATE OF caption, alt_text ON core_post BEGIN
+        INSERT INTO core_post_fts(core_post_fts, rowid, caption, alt_text) VALUES ('delete', old.id, old.caption, old.alt_text);
+        INSERT INTO core_post_fts(rowid, caption, alt_text) VALUES (new.id, new.caption, new.alt_text);
+    END
+    """,
+    "INSERT INTO core_post_fts(core_post_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS core_post_fts_insert",
+    "DROP TRIGGER IF EXISTS core_post_fts_delete",
+    "DROP TRIGGER IF EXISTS core_post_fts_update",
+    "DROP TABLE IF EXISTS core_post_fts",
+]
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_messagearchivesegment'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.6 on 2026-10-17 15:27
+
+import re
+from collections import Counter
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+HASHTAG_RE = re.compile(r'(?<![\w&#])#(\w{1,100})')
+
+
+def backfill_hashtags(apps, schema_editor):
+    Hashtag = apps.get_model('core', 'Hashtag')
+    Post = apps.get_model('core', 'Post')
+    PostHashtag = apps.get_model('core', 'PostHashtag')
+
+    links = []
+    for post_id, caption, created_at in Post.objects.exclude(caption='').values_list('id', 'caption', 'created_at').iterator():
+        for name in dict.fromkeys(tag.lower() for tag in HASHTAG_RE.findall(caption)):
+            links.append((name, post_id, created_at))
+    if not links:
+        return
+
+    counts = Counter(name for name, _, _ in links)
+    Hashtag.objects.bulk_create([Hashtag(name=name, posts_count=count) for name, count in counts.items()], batch_size=1000)
+    ids = dict(Hashtag.objects.values_list('name', 'id'))
+    PostHashtag.objects.bulk_create(
+        [PostHashtag(hashtag_id=ids[name], post_id=post_id, created_at=created_at) for name, post_id, created_at in links],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hashtag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('like', 'Like'), ('comment', 'Comment'), ('follow', 'Follow'), ('message', 'Message'), ('mention', 'Mention')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='outboxevent',
+            name='notification_type',
+            field=models.CharField(choices=[('like', 'Like'), ('comment', 'Comment'), ('follow', 'Follow'), ('message', 'Message'), ('mention', 'Mention')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='Mention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='core.comment')),
+                ('from_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='core.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at'], name='core_mentio_user_id_0a065c_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PostHashtag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_links', to='core.hashtag')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hashtag_links', to='core.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hashtag', '-created_at', '-post'], name='core_postha_hashtag_40dac2_idx')],
+                'unique_together': {('hashtag', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_hashtags, migrations.RunPython.noop),
+    ]
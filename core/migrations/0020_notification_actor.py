@@ -0,0 +1,75 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_actors(apps, schema_editor):
+    # Older actors of existing groups were never stored; move the latest actors
+    # of unread groups, the only ones still folded into, into their own table
+    # and reopen the newest group of each kind. Message groups used to span
+    # every conversation, so they are left closed.
+    Notification = apps.get_model('core', 'Notification')
+    NotificationActor = apps.get_model('core', 'NotificationActor')
+    open_keys = set()
+    unread = Notification.objects.filter(is_read=False).exclude(notification_type='message')
+    for notification in unread.order_by('-updated_at', '-id').iterator():
+        actor_ids = notification.latest_actors or [notification.from_user_id]
+        NotificationActor.objects.bulk_create(
+            [NotificationActor(notification_id=notification.pk, actor_id=actor_id) for actor_id in actor_ids],
+            ignore_conflicts=True,
+        )
+        fields = {'actor_count': len(set(actor_ids))}
+        key = f"{notification.notification_type}:{notification.user_id}:{notification.post_id or ''}:"
+        if key not in open_keys:
+            open_keys.add(key)
+            fields['group_key'] = key
+        Notification.objects.filter(pk=notification.pk).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_mediajob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='core_notifi_user_id_d94b03_idx'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.conversation'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='group_key',
+            field=models.CharField(blank=True, max_length=80, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='notificationactor',
+            name='actor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='notificationactor',
+            name='notification',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actor_links', to='core.notification'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='notificationactor',
+            unique_together={('notification', 'actor')},
+        ),
+        migrations.RunPython(backfill_actors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('core', '0020_notification_actor'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['-followers_count'], name='core_user_followe_579f0d_idx'),
+        ),
+    ]
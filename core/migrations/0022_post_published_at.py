@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:22
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # Existing posts count as published when they were created, and the
+    # watermark starts where the old max(PostScore.updated_at) one stood
+    Post = apps.get_model('core', 'Post')
+    PostScore = apps.get_model('core', 'PostScore')
+    PostScoreState = apps.get_model('core', 'PostScoreState')
+    Post.objects.filter(status='ready').update(published_at=models.F('created_at'))
+    last = PostScore.objects.aggregate(last=models.Max('updated_at'))['last']
+    if last:
+        PostScoreState.objects.create(pk=1, refreshed_until=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_user_followers_count_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScoreState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refreshed_until', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='published_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['published_at'], name='core_post_publish_022069_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
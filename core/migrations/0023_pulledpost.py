@@ -0,0 +1,67 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_feeds(apps, schema_editor):
+    # The inboxes rebuild_feeds would build: each author's recent posts go to
+    # the author and to their followers, except for celebrity accounts, whose
+    # posts are recorded as pulled and merged in at read time
+    User = apps.get_model('core', 'User')
+    Post = apps.get_model('core', 'Post')
+    Follow = apps.get_model('core', 'Follow')
+    FeedItem = apps.get_model('core', 'FeedItem')
+    PulledPost = apps.get_model('core', 'PulledPost')
+    fanout_max = getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 10000)
+    backfill_size = getattr(settings, 'FEED_BACKFILL_SIZE', 50)
+
+    for author_id, followers_count in User.objects.values_list('id', 'followers_count').iterator():
+        posts = Post.objects.filter(user_id=author_id, status='ready').order_by('-created_at', '-id')
+        recent = list(posts.values_list('id', 'created_at')[:backfill_size])
+        if not recent:
+            continue
+        readers = [author_id]
+        if followers_count < fanout_max:
+            readers.extend(Follow.objects.filter(following_id=author_id).values_list('follower_id', flat=True))
+        else:
+            PulledPost.objects.bulk_create(
+                [
+                    PulledPost(post_id=post_id, author_id=author_id, created_at=created_at)
+                    for post_id, created_at in posts.values_list('id', 'created_at').iterator()
+                ],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+        FeedItem.objects.bulk_create(
+            [
+                FeedItem(user_id=reader_id, post_id=post_id, author_id=author_id, created_at=created_at)
+                for reader_id in readers
+                for post_id, created_at in recent
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_post_published_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PulledPost',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='pulled', serialize=False, to='core.post')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['author', '-created_at', '-post'], name='core_pulled_author__492e90_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-17 17:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Greatest
+
+
+def backfill_last_message(apps, schema_editor):
+    Conversation = apps.get_model('core', 'Conversation')
+    ConversationMember = apps.get_model('core', 'ConversationMember')
+    Message = apps.get_model('core', 'Message')
+    MessageArchiveSegment = apps.get_model('core', 'MessageArchiveSegment')
+    # Every member row carries the same last-message copy; take any one of them
+    member = ConversationMember.objects.filter(conversation=models.OuterRef('pk')).order_by('id')
+    newest = Message.objects.filter(conversation=models.OuterRef('pk')).values('conversation').annotate(m=models.Max('id')).values('m')
+    archived = MessageArchiveSegment.objects.filter(conversation=models.OuterRef('pk')).values('conversation').annotate(m=models.Max('last_id')).values('m')
+    Conversation.objects.update(
+        last_message_id=Coalesce(models.Subquery(newest), models.Subquery(archived), 0),
+        last_message_preview=Coalesce(models.Subquery(member.values('last_message_preview')[:1]), models.Value('')),
+        last_message_sender=models.Subquery(member.values('last_message_sender')[:1]),
+        last_message_at=models.Subquery(member.values('last_message_at')[:1]),
+    )
+    # Unread is now derived from last_read_id, so members with nothing unread
+    # are moved up to the newest message
+    ConversationMember.objects.filter(unread_count=0).update(
+        last_read_id=Greatest('last_read_id', models.Subquery(
+            Conversation.objects.filter(pk=models.OuterRef('conversation')).values('last_message_id')
+        )),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_pulledpost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_last_message, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='conversationmember',
+            name='last_message_at',
+        ),
+        migrations.RemoveField(
+            model_name='conversationmember',
+            name='last_message_preview',
+        ),
+        migrations.RemoveField(
+            model_name='conversationmember',
+            name='last_message_sender',
+        ),
+        migrations.RemoveField(
+            model_name='conversationmember',
+            name='unread_count',
+        ),
+    ]
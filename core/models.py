@@ -11,8 +11,15 @@ class User(AbstractUser):
     followers_count = models.PositiveIntegerField(default=0)
     following_count = models.PositiveIntegerField(default=0)
     posts_count = models.PositiveIntegerField(default=0)
+    unread_notifications_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Most followed accounts, for suggestions and the home feed's celebrity list
+            models.Index(fields=['-followers_count']),
+        ]
+    
     def __str__(self):
         return self.username
 
@@ -23,11 +30,42 @@ class Follow(models.Model):
     
     class Meta:
         unique_together = ('follower', 'following')
+        indexes = [
+            # Followers and following lists, newest follow first
+            models.Index(fields=['following', '-created_at', '-id']),
+            models.Index(fields=['follower', '-created_at', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.follower.username} follows {self.following.username}"
 
+class FollowChange(models.Model):
+    # When one side of a user's follows last changed, so every worker's
+    # in-memory FollowGraph can tell which rows of its snapshot are stale
+    DIRECTIONS = [
+        ('out', 'Following'),
+        ('in', 'Followers'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    direction = models.CharField(max_length=3, choices=DIRECTIONS)
+    changed_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        unique_together = ('user', 'direction')
+    
+    def __str__(self):
+        return f"{self.user_id} {self.direction} changed at {self.changed_at}"
+
 class Post(models.Model):
+    # Uploads stay 'processing' until the process_media worker has validated the
+    # media and written its derivatives; only 'ready' posts are listed anywhere
+    STATUSES = [
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
     video = models.FileField(upload_to='videos/', blank=True, null=True)
@@ -35,16 +73,110 @@ class Post(models.Model):
     alt_text = models.TextField(blank=True)
     hide_counts = models.BooleanField(default=False)
     disable_comments = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUSES, default='ready')
     likes_count = models.PositiveIntegerField(default=0)
     comments_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    # When the post last became 'ready'; trending picks up new posts by this
+    published_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['published_at']),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if self.status != 'ready':
+            self.published_at = None
+        elif not self.published_at:
+            self.published_at = timezone.now()
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"Post by {self.user.username} at {self.created_at}"
 
+class FeedItem(models.Model):
+    # Materialized home timeline: one row per (reader, post), written at post time
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_items')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_items')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post']),
+            models.Index(fields=['user', 'author']),
+        ]
+    
+    def __str__(self):
+        return f"Post {self.post_id} in feed of {self.user_id}"
+
+class PulledPost(models.Model):
+    # A post that was not fanned out on write because its author had too many
+    # followers at the time; merged into followers' timelines at read time
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='pulled')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', '-created_at', '-post']),
+        ]
+    
+    def __str__(self):
+        return f"Post {self.post_id} merged at read time"
+
+class PostScore(models.Model):
+    # Time-decayed engagement score, stored as log(sum(weight * e^(rate * (t - epoch))))
+    # so scores never need re-decaying: ordering by it ranks posts as of any moment.
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='score')
+    score = models.FloatField()
+    updated_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post']),
+        ]
+    
+    def __str__(self):
+        return f"Post {self.post_id} scored {self.score:.3f}"
+
+class PostScoreState(models.Model):
+    # Single row: activity before refreshed_until is folded into PostScore
+    refreshed_until = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Scores refreshed until {self.refreshed_until}"
+
+class SearchGeneration(models.Model):
+    # Per result type generation embedded in search cache keys; kept in the
+    # database because a culled cache entry would reset it and revive old results
+    kind = models.CharField(max_length=20, unique=True)
+    generation = models.PositiveBigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.kind} search generation {self.generation}"
+
+class SuggestedUser(models.Model):
+    # Top candidates to follow per user, precomputed offline by refresh_suggestions
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='suggestions')
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('user', 'suggested')
+        indexes = [
+            models.Index(fields=['user', 'rank']),
+        ]
+    
+    def __str__(self):
+        return f"Suggest {self.suggested_id} to {self.user_id}"
+
 class Like(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
@@ -77,6 +209,43 @@ class CommentLike(models.Model):
     class Meta:
         unique_together = ('user', 'comment')
 
+class Hashtag(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    posts_count = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"#{self.name}"
+
+class PostHashtag(models.Model):
+    # created_at copies the post's, so a tag page is one range scan of this index
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='post_links')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='hashtag_links')
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('hashtag', 'post')
+        indexes = [
+            models.Index(fields=['hashtag', '-created_at', '-post']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.hashtag_id} on {self.post_id}"
+
+class Mention(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mentions')
+    from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='mentions')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='mentions')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.from_user_id} mentioned {self.user_id} on {self.post_id}"
+
 class Story(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stories')
     image = models.ImageField(upload_to='stories/', blank=True, null=True)
@@ -93,12 +262,80 @@ class Story(models.Model):
     class Meta:
         ordering = ['-created_at']
 
+class ImageDerivative(models.Model):
+    # Resized copy of an uploaded image, keyed by the original's storage name so
+    # post images, story images and profile pictures share one table
+    SIZES = [
+        ('thumb', 'Thumbnail'),
+        ('grid', 'Grid'),
+        ('feed', 'Feed'),
+        ('full', 'Full'),
+    ]
+    FORMATS = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+    
+    source = models.CharField(max_length=255)
+    size = models.CharField(max_length=5, choices=SIZES)
+    format = models.CharField(max_length=4, choices=FORMATS)
+    file = models.ImageField(upload_to='derivatives/')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    bytes = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('source', 'size', 'format')
+    
+    def __str__(self):
+        return f"{self.source} ({self.size}, {self.format})"
+
+class MediaJob(models.Model):
+    # Post media waiting for, or done with, off-request processing. The upload
+    # sits in staging/ until the worker moves it onto the post.
+    STATUSES = [
+        ('queued', 'Queued'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name='media_job')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    staged_file = models.FileField(upload_to='staging/', blank=True)
+    content_type = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUSES, default='queued')
+    progress = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=255, blank=True)
+    metadata = models.JSONField(default=dict, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"Media job {self.id} for post {self.post_id} ({self.status})"
+
 class Conversation(models.Model):
-    participants = models.ManyToManyField(User, related_name='conversations')
+    participants = models.ManyToManyField(User, related_name='conversations', through='ConversationMember', through_fields=('conversation', 'user'))
     is_group = models.BooleanField(default=False)
     group_name = models.CharField(max_length=100, blank=True)
     group_image = models.ImageField(upload_to='group_images/', blank=True, null=True)
     admin = models.ForeignKey(User, on_delete=models.CASCADE, related_name='admin_conversations', null=True, blank=True)
+    # "<lower user id>:<higher user id>" for 1:1 conversations, so each pair has at most one
+    direct_key = models.CharField(max_length=41, unique=True, null=True, blank=True)
+    # Newest message, shared by every member's inbox row and kept current by
+    # conversations.record_message; a plain id so archiving it leaves the preview
+    last_message_id = models.BigIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=100, blank=True)
+    last_message_sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -117,16 +354,55 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender.username} in {self.conversation.id}"
 
+class MessageArchiveSegment(models.Model):
+    # A run of old messages of one conversation, moved out of core_message by
+    # the archive_messages command and stored as zlib-compressed JSON
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='archive_segments')
+    first_id = models.BigIntegerField()
+    first_created_at = models.DateTimeField()
+    last_id = models.BigIntegerField()
+    last_created_at = models.DateTimeField()
+    message_count = models.PositiveIntegerField()
+    data = models.BinaryField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['conversation', '-first_created_at', '-first_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.message_count} archived messages in {self.conversation_id}"
+
+class ConversationMember(models.Model):
+    # Per-member read position; only the sender's row changes when a message is sent
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='members')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_memberships')
+    last_read_id = models.BigIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('conversation', 'user')
+    
+    def __str__(self):
+        return f"{self.user_id} in conversation {self.conversation_id}"
+    
+    @property
+    def has_unread(self):
+        return self.conversation.last_message_id > self.last_read_id
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
         ('like', 'Like'),
         ('comment', 'Comment'),
         ('follow', 'Follow'),
         ('message', 'Message'),
+        ('mention', 'Mention'),
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -134,11 +410,55 @@ class Notification(models.Model):
     notification_type = models.CharField(max_length=10, choices=NOTIFICATION_TYPES)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
+    conversation = models.ForeignKey('Conversation', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
     is_read = models.BooleanField(default=False)
+    # Repeated events of the same kind are folded into one row: from_user is the
+    # most recent actor, latest_actors the ids of the last few and actor_count
+    # the number of distinct actors, each recorded once in NotificationActor.
+    # group_key names the (recipient, type, post, conversation) group while the
+    # row still takes new events and is cleared once it is read or goes idle.
+    actor_count = models.PositiveIntegerField(default=1)
+    latest_actors = models.JSONField(default=list, blank=True)
+    group_key = models.CharField(max_length=80, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['user', '-updated_at', '-id']),
+        ]
+    
+    @property
+    def others_count(self):
+        return self.actor_count - 1
+
+class NotificationActor(models.Model):
+    # One row per distinct actor of a grouped notification
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actor_links')
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        unique_together = ('notification', 'actor')
+    
+    def __str__(self):
+        return f"{self.actor_id} in notification {self.notification_id}"
+
+class OutboxEvent(models.Model):
+    # Notification work written in the same transaction as the request's own
+    # writes and turned into Notification rows later by the process_outbox worker.
+    # Recipients are either a single user or every other member of a conversation.
+    from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    notification_type = models.CharField(max_length=10, choices=Notification.NOTIFICATION_TYPES)
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.notification_type} event from {self.from_user_id}"
 
 class SavedPost(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='saved_posts')
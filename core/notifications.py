@@ -0,0 +1,163 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from . import counters
+from .models import Notification, NotificationActor, User
+
+# Events of the same (recipient, type, post, conversation) within this window share one row
+GROUP_WINDOW = timedelta(hours=getattr(settings, 'NOTIFICATION_GROUP_WINDOW_HOURS', 24))
+LATEST_ACTORS = 3
+
+def _group_key(notification_type, recipient_id, post_id, conversation_id):
+    return f"{notification_type}:{recipient_id}:{post_id or ''}:{conversation_id or ''}"
+
+def _open_groups(keys):
+    return {notification.group_key: notification for notification in Notification.objects.filter(group_key__in=keys)}
+
+def _add_actor(notification_ids, actor_id, now):
+    """Record actor_id on each notification and return the ids it was new to.
+
+    A single INSERT ... ON CONFLICT DO NOTHING per chunk: the unique
+    (notification, actor) pair turns a repeat actor into a no-op, and RETURNING
+    reports only the rows this statement actually added, even under concurrency.
+    """
+    table = NotificationActor._meta.db_table
+    created_at = connection.ops.adapt_datetimefield_value(now)
+    added = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(notification_ids), 500):
+            chunk = notification_ids[start:start + 500]
+            params = [value for notification_id in chunk for value in (notification_id, actor_id, created_at)]
+            cursor.execute(
+                f"INSERT INTO {table} (notification_id, actor_id, created_at) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT (notification_id, actor_id) DO NOTHING RETURNING notification_id",
+                params,
+            )
+            added.extend(row[0] for row in cursor.fetchall())
+    return added
+
+def _start_groups(targets, from_user, notification_type, now):
+    """Insert a new group for each {group_key: target} and return {group_key: id} for those created.
+
+    One INSERT ... ON CONFLICT (group_key) DO NOTHING per chunk, so a group
+    started concurrently is skipped instead of failing the batch and RETURNING
+    names exactly the rows this statement wrote.
+    """
+    table = Notification._meta.db_table
+    timestamp = connection.ops.adapt_datetimefield_value(now)
+    latest_actors = Notification._meta.get_field('latest_actors').get_db_prep_value([from_user.id], connection)
+    keys = list(targets)
+    created = {}
+    with connection.cursor() as cursor:
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            params = []
+            for key in chunk:
+                recipient_id, post_id, comment_id, conversation_id = targets[key]
+                params.extend((
+                    recipient_id, from_user.id, notification_type, post_id, comment_id, conversation_id,
+                    False, 0, latest_actors, key, timestamp, timestamp,
+                ))
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, from_user_id, notification_type, post_id, comment_id, "
+                f"conversation_id, is_read, actor_count, latest_actors, group_key, created_at, updated_at) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(chunk))} "
+                f"ON CONFLICT (group_key) DO NOTHING RETURNING group_key, id",
+                params,
+            )
+            created.update(cursor.fetchall())
+    return created
+
+def notify_many(from_user, notification_type, targets):
+    """Record one event from from_user for each (recipient_id, post_id, comment_id, conversation_id) target.
+
+    Each event is folded into the recipient's open group of the same type, post
+    and conversation if there is one, otherwise a new group is started. Groups
+    idle for longer than GROUP_WINDOW are closed first. Missing groups are
+    inserted in one batch and the actor is added with one insert into
+    NotificationActor; actor_count is bumped only where that insert added a
+    row, so concurrent events neither lose nor double count actors, and the
+    unique group_key keeps them from starting duplicate groups. The query count
+    does not depend on the number of recipients.
+    """
+    targets = {
+        _group_key(notification_type, recipient_id, post_id, conversation_id): (recipient_id, post_id, comment_id, conversation_id)
+        for recipient_id, post_id, comment_id, conversation_id in targets
+        if recipient_id != from_user.id
+    }
+    if not targets:
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        Notification.objects.filter(group_key__in=targets, updated_at__lt=now - GROUP_WINDOW).update(group_key=None)
+        groups = _open_groups(targets)
+
+        changed = list(groups.values())
+        missing = {key: targets[key] for key in targets.keys() - groups.keys()}
+        created = _start_groups(missing, from_user, notification_type, now)
+        raced = missing.keys() - created.keys()
+        if raced:
+            # Started by a concurrent event since the lookup; fold into those groups
+            concurrent = {group.group_key: group for group in Notification.objects.filter(group_key__in=raced)}
+            groups.update(concurrent)
+            changed.extend(concurrent.values())
+
+        # Folding into an existing unread row leaves the unread count unchanged
+        unread = {}
+        for key in created:
+            recipient_id = targets[key][0]
+            unread[recipient_id] = unread.get(recipient_id, 0) + 1
+
+        added = _add_actor([group.pk for group in groups.values()] + list(created.values()), from_user.id, now)
+        if added:
+            Notification.objects.filter(pk__in=added).update(actor_count=F('actor_count') + 1)
+
+        for group in changed:
+            comment_id = targets[group.group_key][2]
+            group.latest_actors = ([from_user.id] + [a for a in group.latest_actors if a != from_user.id])[:LATEST_ACTORS]
+            group.from_user = from_user
+            group.comment_id = comment_id or group.comment_id
+            group.updated_at = now
+        if changed:
+            Notification.objects.bulk_update(changed, ['from_user', 'comment', 'latest_actors', 'updated_at'])
+        if unread:
+            counters.increment_many(User, 'unread_notifications_count', unread)
+
+def notify(user, from_user, notification_type, post=None, comment=None, conversation=None):
+    notify_many(from_user, notification_type, [(
+        user.id,
+        post.id if post else None,
+        comment.id if comment else None,
+        conversation.id if conversation else None,
+    )])
+
+def attach_actors(notifications):
+    """Load the latest actors of a page of notifications with a single query.
+
+    Sets notification.actors to a list of User objects, most recent first.
+    """
+    actor_ids = {actor_id for notification in notifications for actor_id in notification.latest_actors}
+    users = User.objects.in_bulk(actor_ids) if actor_ids else {}
+    for notification in notifications:
+        notification.actors = [users[actor_id] for actor_id in notification.latest_actors if actor_id in users]
+    return notifications
+
+def mark_read(user, notification_ids=None):
+    """Mark some or all of a user's notifications read with a single UPDATE.
+
+    The cached unread counter is lowered by the number of rows actually changed,
+    so notifications arriving concurrently are not lost from the badge.
+    """
+    unread = Notification.objects.filter(user=user, is_read=False)
+    if notification_ids is not None:
+        unread = unread.filter(id__in=notification_ids)
+    # Reading a group closes it, so the next event starts a new unread row
+    changed = unread.update(is_read=True, group_key=None)
+    if changed:
+        counters.increment(user, 'unread_notifications_count', -changed)
+        user.unread_notifications_count = max(user.unread_notifications_count - changed, 0)
+    return changed
@@ -0,0 +1,63 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+from . import notifications
+from .models import Conversation, OutboxEvent, User
+
+def enqueue(from_user, notification_type, recipient=None, conversation=None, post=None, comment=None):
+    """Record notification work for the worker; costs a single INSERT in the request."""
+    return OutboxEvent.objects.create(
+        from_user=from_user,
+        notification_type=notification_type,
+        recipient=recipient,
+        conversation=conversation,
+        post=post,
+        comment=comment,
+    )
+
+def drain(batch_size=500):
+    """Turn the oldest batch of outbox events into notifications.
+
+    Conversation members for the whole batch are loaded with one query, events
+    from the same sender and type are folded into one notify_many call, and the
+    events are deleted in the same transaction that writes their notifications.
+    Returns the number of events processed.
+    """
+    with transaction.atomic():
+        events = list(OutboxEvent.objects.order_by('id')[:batch_size])
+        if not events:
+            return 0
+
+        conversation_ids = {event.conversation_id for event in events if event.conversation_id}
+        members = defaultdict(list)
+        if conversation_ids:
+            memberships = Conversation.participants.through.objects.filter(conversation_id__in=conversation_ids)
+            for conversation_id, user_id in memberships.values_list('conversation_id', 'user_id'):
+                members[conversation_id].append(user_id)
+
+        targets = defaultdict(list)
+        for event in events:
+            if event.conversation_id:
+                recipient_ids = members[event.conversation_id]
+            else:
+                recipient_ids = [event.recipient_id] if event.recipient_id else []
+            targets[(event.from_user_id, event.notification_type)].extend(
+                (recipient_id, event.post_id, event.comment_id, event.conversation_id) for recipient_id in recipient_ids
+            )
+
+        senders = User.objects.in_bulk({from_user_id for from_user_id, _ in targets})
+        for (from_user_id, notification_type), event_targets in targets.items():
+            if from_user_id in senders:
+                notifications.notify_many(senders[from_user_id], notification_type, event_targets)
+
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+    return len(events)
+
+def lag():
+    """Return (pending events, age in seconds of the oldest pending event)."""
+    stats = OutboxEvent.objects.aggregate(oldest=Min('created_at'))
+    pending = OutboxEvent.objects.count()
+    if not stats['oldest']:
+        return pending, 0.0
+    return pending, (timezone.now() - stats['oldest']).total_seconds()
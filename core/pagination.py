@@ -0,0 +1,76 @@
+import base64
+from datetime import datetime
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+
+PAGE_SIZE = getattr(settings, 'PAGE_SIZE', 20)
+
+class CursorPage:
+    """One page of a keyset-paginated list."""
+
+    def __init__(self, items, next_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def encode_cursor(value, pk):
+    value = value.isoformat() if isinstance(value, datetime) else repr(float(value))
+    raw = f"{value}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, value_type=datetime):
+    """Return the (value, pk) pair in a cursor, or None if it is missing or malformed.
+
+    A cursor whose value is not a value_type, such as a score cursor sent to a
+    newest-first list, counts as malformed so the caller starts from page one.
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, pk = raw.rsplit('|', 1)
+        try:
+            value = float(value)
+        except ValueError:
+            value = datetime.fromisoformat(value)
+        if not isinstance(value, value_type):
+            return None
+        return value, int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def before(key, order_field='created_at', pk_field='id'):
+    """Filter for rows strictly after a decoded cursor in descending (order_field, pk) order."""
+    value, pk = key
+    return Q(**{f'{order_field}__lt': value}) | Q(**{order_field: value, f'{pk_field}__lt': pk})
+
+def paginate(queryset, cursor=None, page_size=PAGE_SIZE, order_field='created_at', pk_field='id'):
+    """Return the page of a queryset that follows the cursor, newest first.
+
+    Rows are ordered on (order_field, pk_field) descending and the next page
+    starts strictly after the last row, so deep pages cost the same as the
+    first one.
+    """
+    queryset = queryset.order_by(f'-{order_field}', f'-{pk_field}')
+    field = queryset.model._meta.get_field(order_field)
+    key = decode_cursor(cursor, datetime if isinstance(field, models.DateTimeField) else float)
+    if key:
+        queryset = queryset.filter(before(key, order_field, pk_field))
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, order_field), getattr(last, pk_field))
+    return CursorPage(items, next_cursor)
@@ -0,0 +1,119 @@
+from datetime import datetime, timezone as dt_timezone
+import math
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Comment, Like, Post, PostScore, PostScoreState, SavedPost, Share
+
+# Engagement weights per activity type; a post's own publication counts as one event
+# so fresh posts can surface before anyone has interacted with them.
+WEIGHTS = getattr(settings, 'TRENDING_WEIGHTS', {
+    'post': 1.0,
+    'like': 1.0,
+    'comment': 3.0,
+    'save': 4.0,
+    'share': 5.0,
+})
+HALF_LIFE_HOURS = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24)
+DECAY_RATE = math.log(2) / (HALF_LIFE_HOURS * 3600)
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+BATCH_SIZE = 5000
+
+# (kind, model, post field, event time field); posts only count once their
+# media is processed, so a post's own event is the moment it was published
+ACTIVITY_SOURCES = [
+    ('post', Post, 'id', 'published_at'),
+    ('like', Like, 'post_id', 'created_at'),
+    ('comment', Comment, 'post_id', 'created_at'),
+    ('save', SavedPost, 'post_id', 'created_at'),
+    ('share', Share, 'post_id', 'created_at'),
+]
+
+def last_refresh():
+    return PostScoreState.objects.filter(pk=1).values_list('refreshed_until', flat=True).first()
+
+def _load_activity(since, until):
+    """Return parallel arrays of (post_id, log-contribution) for every event in [since, until)."""
+    post_ids, contributions = [], []
+    for kind, model, post_field, time_field in ACTIVITY_SOURCES:
+        events = model.objects.filter(**{f'{time_field}__lt': until})
+        if kind == 'post':
+            events = events.filter(status='ready')
+        if since:
+            events = events.filter(**{f'{time_field}__gte': since})
+        rows = list(events.values_list(post_field, time_field).iterator(chunk_size=BATCH_SIZE))
+        if not rows:
+            continue
+
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        seconds = np.fromiter(((row[1] - EPOCH).total_seconds() for row in rows), dtype=np.float64, count=len(rows))
+        post_ids.append(ids)
+        contributions.append(math.log(WEIGHTS[kind]) + DECAY_RATE * seconds)
+
+    if not post_ids:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(post_ids), np.concatenate(contributions)
+
+def unlist(post_ids):
+    """Drop the scores of posts that are no longer published.
+
+    Only ready posts are scored, so explore can read PostScore in index order
+    without joining core_post to check the status.
+    """
+    PostScore.objects.filter(post_id__in=post_ids).delete()
+
+def _fold(post_ids, contributions, until):
+    """Combine new log-contributions with the stored scores; returns the number of rows written."""
+    unique_ids, inverse = np.unique(post_ids, return_inverse=True)
+    scores = np.full(len(unique_ids), -np.inf)
+    np.logaddexp.at(scores, inverse, contributions)
+
+    updated = 0
+    for start in range(0, len(unique_ids), BATCH_SIZE):
+        ids = unique_ids[start:start + BATCH_SIZE]
+        batch = scores[start:start + BATCH_SIZE]
+
+        existing = dict(PostScore.objects.filter(post_id__in=ids.tolist()).values_list('post_id', 'score'))
+        if existing:
+            previous = np.array([existing.get(post_id, -np.inf) for post_id in ids.tolist()])
+            batch = np.logaddexp(batch, previous)
+
+        # Events may refer to posts deleted or not yet published; only score live posts
+        live = set(Post.objects.filter(id__in=ids.tolist(), status='ready').values_list('id', flat=True))
+        rows = [
+            PostScore(post_id=post_id, score=score, updated_at=until)
+            for post_id, score in zip(ids.tolist(), batch.tolist())
+            if post_id in live
+        ]
+        PostScore.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['post'],
+            update_fields=['score', 'updated_at'],
+        )
+        updated += len(rows)
+    return updated
+
+def refresh_scores(full=False):
+    """Fold activity since the previous refresh into PostScore.
+
+    Scores live in log space relative to a fixed epoch, so existing rows are
+    combined with new events via logaddexp without decaying the whole table.
+    The watermark is kept in PostScoreState rather than read back from the
+    scores, so unlisting posts never moves it. Returns the number of posts
+    whose score changed.
+    """
+    until = timezone.now()
+    with transaction.atomic():
+        if full:
+            PostScore.objects.all().delete()
+            since = None
+        else:
+            since = last_refresh()
+
+        post_ids, contributions = _load_activity(since, until)
+        updated = _fold(post_ids, contributions, until) if len(post_ids) else 0
+        # Moves forward with the scores it describes, or not at all
+        PostScoreState.objects.update_or_create(pk=1, defaults={'refreshed_until': until})
+    return updated
@@ -0,0 +1,255 @@
+import asyncio
+import json
+import logging
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from importlib import import_module
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Max
+from django.http import HttpRequest
+from django.utils.module_loading import import_string
+from .models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+BROKER_BACKEND = getattr(settings, 'REALTIME_BROKER', 'core.realtime.DatabaseBroker')
+SUBSCRIPTION_QUEUE_SIZE = 100
+# Seconds a long-poll request waits for a new message before returning empty
+POLL_TIMEOUT = getattr(settings, 'REALTIME_POLL_TIMEOUT', 25)
+# Seconds a client served by a WSGI worker waits before polling again; the
+# request returns at once rather than hold the worker thread
+WSGI_POLL_INTERVAL = getattr(settings, 'REALTIME_WSGI_POLL_INTERVAL', 3)
+# How often DatabaseBroker checks for new messages
+DATABASE_POLL_INTERVAL = getattr(settings, 'REALTIME_DATABASE_POLL_INTERVAL', 0.5)
+WEBSOCKET_PATH = re.compile(r'^/ws/messages/(?P<conversation_id>\d+)/$')
+
+def conversation_channel(conversation_id):
+    return f"conversation:{conversation_id}"
+
+def message_payload(message):
+    return {
+        'id': message.id,
+        'conversation_id': message.conversation_id,
+        'sender_id': message.sender_id,
+        'sender': message.sender.username,
+        'sender_avatar': message.sender.profile_picture.url if message.sender.profile_picture else None,
+        'text': message.text,
+        'image': message.image.url if message.image else None,
+        'created_at': message.created_at.strftime('%H:%M'),
+        'timestamp': message.created_at.isoformat()
+    }
+
+class Subscription:
+    """A subscriber's bounded queue, bound to the event loop that created it."""
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def deliver(self, payload):
+        # Called from any thread; hand the payload to the subscriber's loop
+        try:
+            self.loop.call_soon_threadsafe(self._put, payload)
+        except RuntimeError:
+            self.close()
+
+    def _put(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            logger.warning(f"Dropping realtime payload for slow subscriber on {self.channel}")
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class Broker(ABC):
+    """Pub/sub interface used to push new messages to connected clients.
+
+    publish() is synchronous so request handlers can call it directly;
+    subscribe() must be called from a running event loop.
+    """
+
+    @abstractmethod
+    def publish(self, channel, payload):
+        """Announce payload to the subscribers of channel."""
+
+    @abstractmethod
+    def subscribe(self, channel):
+        """Return a Subscription receiving the payloads published on channel."""
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        """Stop delivering to subscription."""
+
+class InMemoryBroker(Broker):
+    """Single-process broker; publishers and subscribers must share a process.
+
+    Only suitable when one ASGI process serves both the HTTP views that send
+    messages and the websockets, as under runserver or in tests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(payload)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+class DatabaseBroker(InMemoryBroker):
+    """Cross-process broker that uses the message table as its transport.
+
+    publish() does nothing: whichever process saved the message, one poller
+    thread per subscribing process reads messages newer than the last one it
+    saw for every conversation with a local subscriber, in a single indexed
+    query every DATABASE_POLL_INTERVAL seconds, and hands them to those
+    subscribers. Messages are delivered in id order, so a transaction that
+    commits after one with a higher id can be missed; clients catch up through
+    get-messages on reconnect.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._last_id = None
+        self._poller = None
+
+    def publish(self, channel, payload):
+        pass
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        with self._lock:
+            if self._poller is None or not self._poller.is_alive():
+                self._poller = threading.Thread(target=self._run, name='realtime-poll', daemon=True)
+                self._poller.start()
+        return subscription
+
+    def _run(self):
+        while True:
+            time.sleep(DATABASE_POLL_INTERVAL)
+            try:
+                close_old_connections()
+                self.poll()
+            except DatabaseError:
+                logger.warning("Realtime poll failed", exc_info=True)
+
+    def poll(self):
+        with self._lock:
+            conversation_ids = [int(channel.split(':', 1)[1]) for channel in self._subscribers]
+        if not conversation_ids:
+            # Nobody is listening; start from the newest message when someone does
+            self._last_id = None
+            return
+        if self._last_id is None:
+            self._last_id = Message.objects.aggregate(last=Max('id'))['last'] or 0
+            return
+
+        messages = list(
+            Message.objects.filter(id__gt=self._last_id, conversation_id__in=conversation_ids)
+            .select_related('sender').order_by('id')[:500]
+        )
+        for message in messages:
+            super().publish(conversation_channel(message.conversation_id), message_payload(message))
+        if messages:
+            self._last_id = messages[-1].id
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(BROKER_BACKEND)()
+    return _broker
+
+def publish_message(message):
+    get_broker().publish(conversation_channel(message.conversation_id), message_payload(message))
+
+def _header(scope, name):
+    for key, value in scope.get('headers', []):
+        if key.decode('latin1').lower() == name:
+            return value.decode('latin1')
+    return None
+
+def _session_user_id(scope):
+    cookie = SimpleCookie(_header(scope, 'cookie') or '')
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    # Resolved exactly as for an HTTP request, so sessions invalidated by a
+    # password change and deactivated accounts are refused
+    request = HttpRequest()
+    request.session = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value)
+    user = get_user(request)
+    return user.pk if user.is_authenticated else None
+
+def _is_member(user_id, conversation_id):
+    return Conversation.objects.filter(id=conversation_id, participants__id=user_id).exists()
+
+def _same_origin(scope):
+    origin, host = _header(scope, 'origin'), _header(scope, 'host')
+    return origin is None or (host is not None and origin.split('://', 1)[-1] == host)
+
+async def websocket_application(scope, receive, send):
+    """Push new messages of one conversation to an authenticated member.
+
+    Serves /ws/messages/<conversation_id>/ using the Django session cookie for
+    authentication; the client only listens, messages are still sent over HTTP.
+    """
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+
+    match = WEBSOCKET_PATH.match(scope['path'])
+    user_id = await sync_to_async(_session_user_id)(scope) if match else None
+    if not user_id or not _same_origin(scope) or not await sync_to_async(_is_member)(user_id, int(match['conversation_id'])):
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+
+    await send({'type': 'websocket.accept'})
+    subscription = get_broker().subscribe(conversation_channel(match['conversation_id']))
+
+    async def forward():
+        while True:
+            payload = await subscription.get()
+            await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+    forwarder = asyncio.ensure_future(forward())
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+    finally:
+        forwarder.cancel()
+        subscription.close()
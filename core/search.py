@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F, Q
+from .models import Post, SearchGeneration
+
+logger = logging.getLogger(__name__)
+
+MAX_TERMS = 8
+# bm25 column weights: a caption match counts for more than an alt text match
+CAPTION_WEIGHT = 2.0
+ALT_TEXT_WEIGHT = 1.0
+
+def fts_enabled():
+    # The core_post_fts index and its sync triggers only exist on SQLite
+    return connection.vendor == 'sqlite'
+
+def match_expression(query):
+    """Turn free text into an FTS5 query matching every word as a prefix.
+
+    Words are quoted, so FTS5 operators typed by users are searched for literally.
+    Returns None when the query has no searchable words.
+    """
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def search_posts(query, limit=10):
+    """Return up to limit posts whose caption or alt text matches query, best first."""
+    if not fts_enabled():
+        return list(
+            Post.objects.filter(Q(caption__icontains=query) | Q(alt_text__icontains=query), status='ready')
+            .select_related('user')[:limit]
+        )
+
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            # Filter on status before the LIMIT so unpublished matches cannot shorten the page
+            "SELECT core_post_fts.rowid FROM core_post_fts JOIN core_post ON core_post.id = core_post_fts.rowid "
+            "WHERE core_post_fts MATCH %s AND core_post.status = 'ready' "
+            "ORDER BY bm25(core_post_fts, %s, %s), core_post_fts.rowid DESC LIMIT %s",
+            [expression, CAPTION_WEIGHT, ALT_TEXT_WEIGHT, limit],
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+    posts = Post.objects.select_related('user').in_bulk(ids)
+    return [posts[pk] for pk in ids if pk in posts]
+
+def rebuild():
+    """Re-index every post from core_post; returns the number of posts indexed."""
+    if not fts_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO core_post_fts(core_post_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO core_post_fts(core_post_fts) VALUES ('optimize')")
+    return Post.objects.count()
+
+class SearchCache:
+    """Two-level cache for search responses, keyed on result type and normalized query.
+
+    A bounded per-process LRU answers repeated queries without running the
+    search and sits in front of a Django cache shared by all workers (alias None
+    disables the shared tier). Keys embed a per-type generation number kept in
+    SearchGeneration; invalidate() bumps it, so every worker stops serving older
+    results within generation_ttl seconds and stale entries simply age out.
+    The generation lives in the database rather than the cache, where culling
+    could reset it and bring results cached under an older number back.
+    """
+
+    def __init__(self, size, ttl, alias=None, generation_ttl=1.0):
+        self.size = size
+        self.ttl = ttl
+        self.alias = alias
+        self.generation_ttl = generation_ttl
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = 0
+
+    @staticmethod
+    def normalize(query):
+        return ' '.join(query.lower().split())
+
+    def _shared(self):
+        return caches[self.alias] if self.alias else None
+
+    def generation(self, kind):
+        """Current generation of kind, re-read from the database at most every generation_ttl seconds."""
+        now = time.monotonic()
+        with self._lock:
+            generation, expires = self._generations.get(kind, (0, 0))
+        if expires <= now:
+            generation = SearchGeneration.objects.filter(kind=kind).values_list('generation', flat=True).first() or 0
+            with self._lock:
+                self._generations[kind] = (generation, now + self.generation_ttl)
+        return generation
+
+    def invalidate(self, kind):
+        """Bump the generation of kind for every worker; a single UPDATE once the row exists."""
+        if not SearchGeneration.objects.filter(kind=kind).update(generation=F('generation') + 1):
+            SearchGeneration.objects.bulk_create([SearchGeneration(kind=kind)], ignore_conflicts=True)
+            SearchGeneration.objects.filter(kind=kind).update(generation=F('generation') + 1)
+        with self._lock:
+            # The next lookup in this worker re-reads the bumped generation
+            self._generations.pop(kind, None)
+
+    def get_or_set(self, kind, query, compute):
+        """Return the cached response for query, calling compute() on a miss."""
+        digest = hashlib.md5(self.normalize(query).encode()).hexdigest()
+        key = f'search:{kind}:{self.generation(kind)}:{digest}'
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+        if entry and entry[0] > now:
+            self._count('hits')
+            return entry[1]
+
+        shared = self._shared()
+        value = shared.get(key) if shared is not None else None
+        if value is not None:
+            self._count('shared_hits')
+        else:
+            self._count('misses')
+            value = compute()
+            if shared is not None:
+                shared.set(key, value, self.ttl)
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return value
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+            lookups = self.hits + self.shared_hits + self.misses
+        if lookups % 1000 == 0:
+            logger.info(f"Search cache: {self.stats()}")
+
+    def stats(self):
+        """Hit and miss counters of this worker since it started, for tuning size and ttl."""
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+        }
+
+cache = SearchCache(
+    size=getattr(settings, 'SEARCH_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'SEARCH_CACHE_TTL', 30),
+    alias=getattr(settings, 'SEARCH_CACHE_ALIAS', 'default'),
+)
@@ -0,0 +1,46 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from django.db import DatabaseError, connection
+
+logger = logging.getLogger(__name__)
+
+class Snapshot(ABC):
+    """In-memory copy of database state that each worker reloads periodically.
+
+    Subclasses build their data in load() and set loaded_at when it is in
+    place; lookups call _ensure_loaded() first. Only the first load blocks
+    requests; later reloads run in a background thread, one at a time, while
+    the previous snapshot keeps being served.
+    """
+
+    # Seconds after which a snapshot is reloaded, and a name for logs and threads
+    refresh_seconds = 300
+    label = 'snapshot'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self.loaded_at = None
+
+    @abstractmethod
+    def load(self):
+        """Read a fresh snapshot from the database and swap it in under _lock."""
+
+    def _reload(self):
+        try:
+            self.load()
+        except DatabaseError:
+            logger.warning(f"{self.label.capitalize()} reload failed; serving the previous snapshot", exc_info=True)
+        finally:
+            connection.close()
+            self._load_lock.release()
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None:
+            with self._load_lock:
+                if self.loaded_at is None:
+                    self.load()
+        elif time.monotonic() - self.loaded_at > self.refresh_seconds and self._load_lock.acquire(blocking=False):
+            threading.Thread(target=self._reload, name=f"{self.label.replace(' ', '-')}-reload", daemon=True).start()
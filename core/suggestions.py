@@ -0,0 +1,117 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from . import graph
+from .models import Follow, SuggestedUser, User
+
+# Stored candidates per user; enough to survive a few follows between refreshes
+TOP_K = getattr(settings, 'SUGGESTIONS_PER_USER', 30)
+# Score = MUTUAL_WEIGHT * accounts you follow that follow them + log1p(followers)
+MUTUAL_WEIGHT = getattr(settings, 'SUGGESTIONS_MUTUAL_WEIGHT', 3.0)
+# Accounts following more than this many are skipped as the middle hop; they
+# say little about any one follower and would blow up the candidate arrays
+MAX_HOP_DEGREE = getattr(settings, 'SUGGESTIONS_MAX_HOP_DEGREE', 1000)
+BATCH_SIZE = 1000
+
+def _load_graph():
+    """Load the follow graph between active users as CSR arrays over dense indices 0..n-1.
+
+    Returns (user_ids, followers, indptr, indices): the following of the user at
+    index i are indices[indptr[i]:indptr[i + 1]]. Built the same way as the
+    shared FollowGraph, but over active users only.
+    """
+    rows = list(User.objects.filter(is_active=True).order_by('id').values_list('id', 'followers_count'))
+    user_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    followers = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    # Edges touching inactive users are dropped along with them
+    src, dst = graph._edges(user_ids)
+    indptr, indices = graph._csr(src, dst, len(user_ids))
+    return user_ids, followers, indptr, indices
+
+def _expand(indptr, indices, rows):
+    """Return (owner, neighbour) arrays listing the out-edges of every row in rows."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    total = int(lengths.sum())
+    owners = np.repeat(rows, lengths)
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+    return owners, indices[offsets]
+
+def _top_candidates(batch, indptr, indices, followers, popular, top_k):
+    """Score second-degree accounts for a batch of user indices.
+
+    Returns parallel arrays (user, candidate, mutual_count, score) holding at
+    most top_k candidates per user, best first within each user.
+    """
+    n = len(followers)
+    users, following = _expand(indptr, indices, batch)
+    # Two hops: who the accounts I follow are following, through ordinary accounts only
+    degree = indptr[following + 1] - indptr[following]
+    hop = degree <= MAX_HOP_DEGREE
+    _, candidates = _expand(indptr, indices, following[hop])
+    owners = np.repeat(users[hop], degree[hop])
+
+    # Popular accounts give users with few second-degree connections something too
+    fill_users = np.repeat(batch, len(popular))
+    fill = np.tile(popular, len(batch))
+
+    keys = np.concatenate([owners * n + candidates, fill_users * n + fill])
+    weights = np.concatenate([np.ones(len(owners)), np.zeros(len(fill))])
+    keys, inverse = np.unique(keys, return_inverse=True)
+    mutual = np.bincount(inverse, weights=weights).astype(np.int64)
+    user, candidate = keys // n, keys % n
+
+    # Never suggest yourself or someone you already follow
+    followed = np.isin(keys, users * n + following)
+    keep = (candidate != user) & ~followed
+    user, candidate, mutual = user[keep], candidate[keep], mutual[keep]
+    score = MUTUAL_WEIGHT * mutual + np.log1p(followers[candidate])
+
+    order = np.lexsort((-score, user))
+    user, candidate, mutual, score = user[order], candidate[order], mutual[order], score[order]
+    group_start = np.searchsorted(user, user, side='left')
+    keep = np.arange(len(user)) - group_start < top_k
+    return user[keep], candidate[keep], mutual[keep], score[keep]
+
+def refresh_suggestions(batch_size=BATCH_SIZE, top_k=TOP_K):
+    """Recompute SuggestedUser for every active user; returns the number of rows written."""
+    user_ids, followers, indptr, indices = _load_graph()
+    if not len(user_ids):
+        return 0
+    popular = np.argsort(-followers, kind='stable')[:top_k + 1]
+
+    written = 0
+    for start in range(0, len(user_ids), batch_size):
+        batch = np.arange(start, min(start + batch_size, len(user_ids)))
+        user, candidate, mutual, score = _top_candidates(batch, indptr, indices, followers, popular, top_k)
+
+        rows, rank, previous = [], 0, None
+        for u, c, m, s in zip(user.tolist(), candidate.tolist(), mutual.tolist(), score.tolist()):
+            rank = rank + 1 if u == previous else 0
+            previous = u
+            rows.append(SuggestedUser(
+                user_id=int(user_ids[u]), suggested_id=int(user_ids[c]), rank=rank, score=s, mutual_count=m,
+            ))
+        with transaction.atomic():
+            SuggestedUser.objects.filter(user_id__in=user_ids[batch].tolist()).delete()
+            SuggestedUser.objects.bulk_create(rows, batch_size=5000)
+        written += len(rows)
+    return written
+
+def suggested_for(user, limit):
+    """Return up to limit users to suggest, skipping anyone followed since the last refresh.
+
+    One indexed query on (user, rank), filtered against the follow graph; users
+    not covered by the last refresh get the most followed accounts instead.
+    """
+    rows = list(SuggestedUser.objects.filter(user=user).select_related('suggested').order_by('rank'))
+    followed = graph.follows.following_among(user.id, [row.suggested_id for row in rows])
+    rows = [row for row in rows if row.suggested_id not in followed][:limit]
+    if rows:
+        for row in rows:
+            row.suggested.mutual_count = row.mutual_count
+        return [row.suggested for row in rows]
+
+    following = Follow.objects.filter(follower=user).values('following')
+    popular = User.objects.filter(is_active=True).exclude(id=user.id).exclude(id__in=following)
+    return list(popular.order_by('-followers_count')[:limit])
@@ -0,0 +1,48 @@
+import re
+from . import counters, notifications
+from .models import Hashtag, Mention, PostHashtag, User
+
+HASHTAG_RE = re.compile(r'(?<![\w&#])#(\w{1,100})')
+MENTION_RE = re.compile(r'(?<![\w@])@(\w[\w.+-]{0,149})')
+
+def extract_hashtags(text):
+    """Return the distinct lower-cased hashtags in text, in order of appearance."""
+    return list(dict.fromkeys(tag.lower() for tag in HASHTAG_RE.findall(text or '')))
+
+def extract_mentions(text):
+    """Return the distinct @usernames in text, in order of appearance."""
+    names = (name.rstrip('.') for name in MENTION_RE.findall(text or ''))
+    return list(dict.fromkeys(name for name in names if name))
+
+def link_hashtags(post, text):
+    """Attach the hashtags in text to post; a constant number of queries per call."""
+    names = extract_hashtags(text)
+    if not names:
+        return []
+
+    Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+    hashtags = {tag.name: tag for tag in Hashtag.objects.filter(name__in=names)}
+    linked = set(PostHashtag.objects.filter(post=post, hashtag__in=hashtags.values()).values_list('hashtag_id', flat=True))
+    new = [tag for tag in hashtags.values() if tag.id not in linked]
+    PostHashtag.objects.bulk_create(
+        [PostHashtag(hashtag=tag, post=post, created_at=post.created_at) for tag in new],
+        ignore_conflicts=True,
+    )
+    counters.increment_many(Hashtag, 'posts_count', {tag.id: 1 for tag in new})
+    return [hashtags[name] for name in names if name in hashtags]
+
+def record_mentions(from_user, text, post, comment=None):
+    """Store and notify the users @mentioned in text, resolved with one IN query."""
+    usernames = extract_mentions(text)
+    if not usernames:
+        return []
+
+    user_ids = list(User.objects.filter(username__in=usernames).exclude(id=from_user.id).values_list('id', flat=True))
+    Mention.objects.bulk_create([
+        Mention(user_id=user_id, from_user=from_user, post=post, comment=comment) for user_id in user_ids
+    ])
+    notifications.notify_many(
+        from_user, 'mention',
+        [(user_id, post.id, comment.id if comment else None, None) for user_id in user_ids],
+    )
+    return user_ids
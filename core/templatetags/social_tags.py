@@ -0,0 +1,42 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+from core import images
+from core.tags import HASHTAG_RE, MENTION_RE
+
+register = template.Library()
+
+@register.filter
+def linkify(text):
+    """Escape text and turn #hashtags and @mentions into links."""
+    def hashtag(match):
+        return format_html(
+            '<a href="{}" class="caption-link">#{}</a>',
+            reverse('core:tag_posts', args=[match.group(1).lower()]), match.group(1)
+        )
+
+    def mention(match):
+        username = match.group(1).rstrip('.')
+        if not username:
+            return match.group(0)
+        return format_html(
+            '<a href="{}" class="caption-link">@{}</a>{}',
+            reverse('core:profile', args=[username]), username, match.group(1)[len(username):]
+        )
+
+    text = HASHTAG_RE.sub(hashtag, escape(text))
+    return mark_safe(MENTION_RE.sub(mention, text))
+
+@register.simple_tag
+def srcset(image, size, sizes=None):
+    """Emit src, srcset and sizes attributes for an uploaded image at a derivative size.
+
+    Falls back to the original file for images uploaded before derivatives existed.
+    """
+    src, candidates = images.srcset(image, size)
+    if not candidates:
+        return format_html('src="{}"', src)
+    return format_html(
+        'src="{}" srcset="{}" sizes="{}"', src, candidates, sizes or images.DISPLAY_SIZES[size]
+    )
@@ -0,0 +1,1194 @@
+import asyncio
+import io
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from core import conversations, counters, engagement, feed, graph, images, notifications, outbox, ranking, realtime, search, suggestions, tags, typeahead, uploads
+from core.models import Conversation, ConversationMember, FeedItem, Follow, Hashtag, ImageDerivative, Like, MediaJob, Message, Notification, OutboxEvent, Post, PostScore, PulledPost, SavedPost, SuggestedUser, User
+from core.templatetags.social_tags import linkify, srcset
+
+class PostSearchIndexTests(TestCase):
+    """The FTS index must follow core_post through every migration that rebuilds it."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='pw')
+
+    def test_triggers_survive_migrations(self):
+        if not search.fts_enabled():
+            self.skipTest('FTS5 index is SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'core_post'")
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(triggers, {'core_post_fts_insert', 'core_post_fts_delete', 'core_post_fts_update'})
+
+    def test_new_posts_are_searchable(self):
+        post = Post.objects.create(user=self.user, caption='hello from the beach')
+        self.assertEqual(search.search_posts('hello'), [post])
+
+    def test_edits_and_deletes_reach_the_index(self):
+        post = Post.objects.create(user=self.user, caption='hello')
+        Post.objects.filter(id=post.id).update(caption='goodbye')
+        self.assertEqual(search.search_posts('hello'), [])
+        self.assertEqual(search.search_posts('goodbye'), [post])
+
+        post.delete()
+        self.assertEqual(search.search_posts('goodbye'), [])
+
+    def test_unpublished_posts_are_not_returned(self):
+        Post.objects.create(user=self.user, caption='hello', status='processing')
+        self.assertEqual(search.search_posts('hello'), [])
+
+    def test_unpublished_matches_do_not_shorten_the_page(self):
+        post = Post.objects.create(user=self.user, caption='hello')
+        for _ in range(3):
+            Post.objects.create(user=self.user, caption='hello', status='processing')
+        self.assertEqual(search.search_posts('hello', limit=1), [post])
+
+class PostSearchMigrationTests(TransactionTestCase):
+    """Regression test for 0019: rebuilding core_post must not leave new posts unindexed."""
+
+    def tearDown(self):
+        call_command('migrate', 'core', verbosity=0)
+
+    def test_posts_created_after_migrating_are_found_through_fts(self):
+        if not search.fts_enabled():
+            self.skipTest('FTS5 index is SQLite only')
+        # Replay every migration from before 0019 rebuilt core_post
+        call_command('migrate', 'core', '0018', verbosity=0)
+        call_command('migrate', 'core', verbosity=0)
+
+        user = User.objects.create_user(username='author', password='pw')
+        post = Post.objects.create(user=user, caption='sunset over the harbour')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT rowid FROM core_post_fts WHERE core_post_fts MATCH %s", ['harbour'])
+            self.assertEqual([row[0] for row in cursor.fetchall()], [post.id])
+        self.assertEqual(search.search_posts('harbour'), [post])
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': tempfile.mkdtemp(),
+}})
+class SearchCacheTests(TestCase):
+
+    def test_invalidation_reaches_other_workers(self):
+        # Two workers, each with its own in-process tier over the shared cache
+        this, other = search.SearchCache(16, 30, 'default', 0), search.SearchCache(16, 30, 'default', 0)
+        self.assertEqual(other.get_or_set('users', 'al', lambda: ['alice']), ['alice'])
+
+        this.invalidate('users')
+        self.assertEqual(other.get_or_set('users', 'al', lambda: ['alice', 'alan']), ['alice', 'alan'])
+
+    def test_generations_survive_a_cleared_cache(self):
+        this = search.SearchCache(16, 30, 'default', 0)
+        self.assertEqual(this.get_or_set('posts', 'sea', lambda: ['old']), ['old'])
+        this.invalidate('posts')
+        this.invalidate('posts')
+        caches['default'].clear()
+
+        other = search.SearchCache(16, 30, 'default', 0)
+        self.assertEqual(other.generation('posts'), 2)
+        self.assertEqual(other.get_or_set('posts', 'sea', lambda: ['new']), ['new'])
+
+    def test_stats_are_exposed_to_staff(self):
+        user = User.objects.create_user(username='alan', password='pw')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get('/ajax/search-cache-stats/').status_code, 302)
+
+        User.objects.filter(id=user.id).update(is_staff=True)
+        with mock.patch.object(search, 'cache', search.SearchCache(16, 30, 'default', 0)) as cache:
+            cache.get_or_set('posts', 'sea', lambda: [])
+            cache.get_or_set('posts', 'SEA ', lambda: [])
+            stats = self.client.get('/ajax/search-cache-stats/').json()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+    def test_user_search_reads_the_index_directly(self):
+        User.objects.create_user(username='alice', password='pw')
+        self.client.force_login(User.objects.create_user(username='alan', password='pw'))
+        typeahead.index.load()
+        with mock.patch.object(search.cache, 'get_or_set') as cached:
+            response = self.client.post('/ajax/search-users/', {'query': 'al'})
+        cached.assert_not_called()
+        self.assertEqual([user['username'] for user in response.json()['results']], ['alice'])
+
+class MentionTests(TestCase):
+
+    def test_punctuation_after_at_sign_is_not_a_mention(self):
+        self.assertEqual(tags.extract_mentions('wait @... what @. @bob.'), ['bob'])
+
+    def test_linkify_leaves_bare_at_signs_alone(self):
+        html = linkify('so @... anyway @bob')
+        self.assertIn('so @... anyway', html)
+        self.assertIn('href="/profile/bob/"', html)
+
+class TypeaheadTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pw', followers_count=1)
+        self.alan = User.objects.create_user(username='alan', password='pw', followers_count=5)
+        User.objects.create_user(username='bob', password='pw', first_name='Alfred')
+        self.index = typeahead.UserIndex()
+        self.index.load()
+
+    def test_matches_are_ranked_by_followers(self):
+        self.assertEqual([user['username'] for user in self.index.search('AL')], ['alan', 'alice', 'bob'])
+        self.assertEqual([user['username'] for user in self.index.search('ali')], ['alice'])
+
+    def test_whole_prefix_range_is_ranked(self):
+        User.objects.bulk_create([User(username=f'sam{i:02}') for i in range(10)])
+        User.objects.create_user(username='samzz_star', password='pw', followers_count=50000)
+        self.index.load()
+        with self.assertNumQueries(0):
+            results = self.index.search('sam', limit=3)
+        self.assertEqual([user['username'] for user in results], ['samzz_star', 'sam00', 'sam01'])
+        self.assertEqual(results[0]['followers_count'], 50000)
+        self.assertEqual([user['username'] for user in self.index.search('al', limit=1)], ['alan'])
+
+    def test_edits_are_searchable_before_the_next_reload(self):
+        self.alice.username = 'zed'
+        self.alice.save()
+        self.index.update(self.alice)
+        self.index.update(User.objects.create_user(username='alma', password='pw'))
+        self.index.remove(self.alan.id)
+
+        self.assertEqual([user['username'] for user in self.index.search('al')], ['bob', 'alma'])
+        self.assertEqual([user['username'] for user in self.index.search('z')], ['zed'])
+
+class CounterBufferTests(TransactionTestCase):
+
+    def test_deltas_are_flushed_without_further_increments(self):
+        user = User.objects.create_user(username='author', password='pw')
+        buffer = counters.CounterBuffer(flush_interval=0.05)
+        buffer.add(User, user.pk, 'followers_count', 2)
+
+        deadline = time.monotonic() + 5
+        while user.followers_count != 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+            user.refresh_from_db()
+        self.assertEqual(user.followers_count, 2)
+
+class ReconcileCountersTests(TestCase):
+
+    def test_drifted_counters_are_recomputed_and_reported(self):
+        author = User.objects.create_user(username='author', password='pw')
+        fans = [User.objects.create_user(username=f'fan{i}', password='pw') for i in range(3)]
+        post = Post.objects.create(user=author, caption='hello')
+        for fan in fans:
+            Like.objects.create(user=fan, post=post)
+        Post.objects.filter(id=post.id).update(likes_count=7)
+
+        out = io.StringIO()
+        call_command('reconcile_counters', '--only', 'post.likes_count', stdout=out)
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 3)
+        self.assertIn('Post.likes_count: 1/1 rows drifted (total 4, max 4)', out.getvalue())
+
+    def test_dry_run_reports_without_fixing(self):
+        author = User.objects.create_user(username='author', password='pw')
+        User.objects.filter(id=author.id).update(followers_count=2)
+
+        stats = counters.reconcile(User, 'followers_count', Follow, 'following_id', dry_run=True)
+        self.assertEqual(stats, {'checked': 1, 'drifted': 1, 'total_drift': 2, 'max_drift': 2})
+        author.refresh_from_db()
+        self.assertEqual(author.followers_count, 2)
+
+class SnapshotReloadTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pw')
+        self.bob = User.objects.create_user(username='bob', password='pw')
+
+    def assertReloadsOnceInBackground(self, snapshot, read, refresh_seconds):
+        snapshot.load()
+        snapshot.loaded_at -= refresh_seconds + 1
+        with mock.patch('threading.Thread') as thread:
+            first, second = read(), read()
+        thread.assert_called_once()
+        self.assertEqual(first, second)
+
+    def test_stale_user_index_reloads_once_in_the_background(self):
+        index = typeahead.UserIndex()
+        self.assertReloadsOnceInBackground(index, lambda: index.search('al'), typeahead.REFRESH_SECONDS)
+
+    def test_stale_follow_graph_reloads_once_in_the_background(self):
+        follows = graph.FollowGraph()
+        self.assertReloadsOnceInBackground(follows, lambda: follows.following(self.alice.id).tolist(), graph.REFRESH_SECONDS)
+
+    def test_follows_made_during_a_reload_are_kept(self):
+        follows = graph.FollowGraph()
+        csr = graph._csr
+
+        def follow_midway(*args):
+            Follow.objects.get_or_create(follower=self.alice, following=self.bob)
+            follows.changed(self.alice.id, self.bob.id)
+            return csr(*args)
+
+        with mock.patch.object(graph, '_csr', side_effect=follow_midway):
+            follows.load()
+        self.assertEqual(follows.following(self.alice.id).tolist(), [self.bob.id])
+
+class FollowGraphTests(TestCase):
+
+    def setUp(self):
+        self.alice, self.bob, self.carol = (User.objects.create_user(username=name, password='pw') for name in ('alice', 'bob', 'carol'))
+        Follow.objects.create(follower=self.alice, following=self.bob)
+        Follow.objects.create(follower=self.alice, following=self.carol)
+        Follow.objects.create(follower=self.bob, following=self.carol)
+        self.follows = graph.FollowGraph()
+        self.follows.load()
+
+    def test_lookups(self):
+        self.assertTrue(self.follows.is_following(self.alice.id, self.bob.id))
+        self.assertFalse(self.follows.is_following(self.bob.id, self.alice.id))
+        self.assertEqual(self.follows.following_among(self.alice.id, [self.bob.id, self.carol.id, self.alice.id]), {self.bob.id, self.carol.id})
+        self.assertEqual(self.follows.mutual(self.alice.id, self.bob.id).tolist(), [self.carol.id])
+        self.assertEqual(self.follows.followed_by(self.alice.id, self.carol.id).tolist(), [self.bob.id])
+
+    def test_changes_made_through_another_worker_are_seen(self):
+        other = graph.FollowGraph()
+        Follow.objects.filter(follower=self.bob, following=self.carol).delete()
+        other.changed(self.bob.id, self.carol.id)
+        Follow.objects.create(follower=self.carol, following=self.alice)
+        other.changed(self.carol.id, self.alice.id)
+
+        self.assertEqual(self.follows.followed_by(self.alice.id, self.carol.id).tolist(), [])
+        self.assertEqual(self.follows.followers(self.alice.id).tolist(), [self.carol.id])
+        self.assertTrue(self.follows.is_following(self.carol.id, self.alice.id))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+        'OPTIONS': {'MAX_ENTRIES': 50},
+    }})
+    def test_changes_survive_a_full_cache(self):
+        Follow.objects.create(follower=self.carol, following=self.alice)
+        graph.FollowGraph().changed(self.carol.id, self.alice.id)
+        # Far more entries than the cache holds, as busy search traffic would write
+        cache = caches['default']
+        for i in range(400):
+            cache.set(f'filler:{i}', i)
+        self.assertTrue(self.follows.is_following(self.carol.id, self.alice.id))
+        self.assertEqual(self.follows.followers(self.alice.id).tolist(), [self.carol.id])
+
+    def test_snapshot_older_than_the_announcements_is_not_trusted(self):
+        Follow.objects.create(follower=self.carol, following=self.alice)
+        self.follows._taken_at -= graph.CHANGE_TTL + 1
+        self.assertTrue(self.follows.is_following(self.carol.id, self.alice.id))
+
+class FollowListTests(TestCase):
+
+    def setUp(self):
+        self.star, self.viewer = (User.objects.create_user(username=name, password='pw') for name in ('star', 'viewer'))
+        self.fans = User.objects.bulk_create([User(username=f'fan{i:02}') for i in range(25)])
+        for fan in self.fans:
+            Follow.objects.create(follower=fan, following=self.star)
+        for fan in self.fans[::5]:
+            Follow.objects.create(follower=self.viewer, following=fan)
+        self.client.force_login(self.viewer)
+
+    def fetch(self, url, cursor=None):
+        params = {'cursor': cursor} if cursor else {}
+        return self.client.get(url, params, headers={'X-Requested-With': 'XMLHttpRequest'}).json()
+
+    def test_followers_page_newest_first_and_continue_from_the_cursor(self):
+        newest_first = [fan.username for fan in reversed(self.fans)]
+        first = self.fetch('/followers/star/')
+        self.assertEqual([u['username'] for u in first['users']], newest_first[:20])
+        second = self.fetch('/followers/star/', first['next_cursor'])
+        self.assertEqual([u['username'] for u in second['users']], newest_first[20:])
+        self.assertIsNone(second['next_cursor'])
+
+        followed = {fan.username for fan in self.fans[::5]}
+        for user in first['users'] + second['users']:
+            self.assertEqual(user['following'], user['username'] in followed)
+
+    def test_following_page_newest_first(self):
+        for fan in self.fans[:3]:
+            Follow.objects.create(follower=self.star, following=fan)
+        page = self.fetch('/following/star/')
+        self.assertEqual([u['username'] for u in page['users']], ['fan02', 'fan01', 'fan00'])
+        self.assertEqual([u['following'] for u in page['users']], [False, False, True])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_a_page_is_one_query(self):
+        with self.assertNumQueries(1):
+            page = graph.followers_page(self.star, self.viewer)
+            self.assertEqual(len(page.items), 20)
+            [follow.follower.username for follow in page.items]
+
+class NotificationGroupingTests(TestCase):
+
+    def test_actor_count_counts_distinct_actors(self):
+        author = User.objects.create_user(username='author', password='pw')
+        post = Post.objects.create(user=author, caption='hello')
+        actors = [User.objects.create_user(username=f'fan{i}', password='pw') for i in range(5)]
+        for actor in actors + actors[:2]:
+            notifications.notify(author, actor, 'comment', post=post)
+
+        notification = Notification.objects.get(user=author)
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.latest_actors, [actors[1].id, actors[0].id, actors[4].id])
+
+    def test_group_started_concurrently_is_folded_into(self):
+        author, first, second = (User.objects.create_user(username=name, password='pw') for name in ('author', 'first', 'second'))
+        post = Post.objects.create(user=author, caption='hello')
+        notifications.notify(author, first, 'like', post=post)
+
+        # The lookup runs before the concurrent event's group commits
+        with mock.patch.object(notifications, '_open_groups', return_value={}):
+            notifications.notify(author, second, 'like', post=post)
+            notifications.notify(author, second, 'like', post=post)
+
+        notification = Notification.objects.get(user=author)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.latest_actors, [second.id, first.id])
+        author.refresh_from_db()
+        self.assertEqual(author.unread_notifications_count, 1)
+
+    def test_messages_are_grouped_per_conversation(self):
+        me, alice, bob = (User.objects.create_user(username=name, password='pw') for name in ('me', 'alice', 'bob'))
+        with_alice, _ = conversations.get_or_create_direct(me, alice)
+        with_bob, _ = conversations.get_or_create_direct(me, bob)
+        notifications.notify(me, alice, 'message', conversation=with_alice)
+        notifications.notify(me, alice, 'message', conversation=with_alice)
+        notifications.notify(me, bob, 'message', conversation=with_bob)
+
+        grouped = dict(Notification.objects.filter(user=me).values_list('conversation_id', 'actor_count'))
+        self.assertEqual(grouped, {with_alice.id: 1, with_bob.id: 1})
+
+    def test_reading_a_group_starts_a_new_one(self):
+        author, fan = (User.objects.create_user(username=name, password='pw') for name in ('author', 'fan'))
+        notifications.notify(author, fan, 'follow')
+        notifications.mark_read(author)
+        notifications.notify(author, fan, 'follow')
+
+        self.assertEqual(Notification.objects.filter(user=author).count(), 2)
+        self.assertEqual(Notification.objects.filter(user=author, is_read=False).count(), 1)
+
+class NotificationInboxTests(TestCase):
+
+    def setUp(self):
+        self.author, self.fan = (User.objects.create_user(username=name, password='pw') for name in ('author', 'fan'))
+        posts = [Post.objects.create(user=self.author, caption=f'post {i}') for i in range(25)]
+        for post in posts:
+            notifications.notify(self.author, self.fan, 'like', post=post)
+        # Distinct timestamps, newest for the last post
+        start = timezone.now() - timedelta(hours=1)
+        for i, post in enumerate(posts):
+            Notification.objects.filter(post=post).update(updated_at=start + timedelta(seconds=i))
+        self.newest_first = [Notification.objects.get(post=post).id for post in reversed(posts)]
+        self.client.force_login(self.author)
+
+    def test_inbox_pages_follow_the_cursor(self):
+        first = self.client.post('/ajax/notifications/').json()
+        self.assertEqual([n['id'] for n in first['notifications']], self.newest_first[:20])
+        self.assertEqual(first['unread_count'], 25)
+
+        second = self.client.post('/ajax/notifications/', {'cursor': first['next_cursor']}).json()
+        self.assertEqual([n['id'] for n in second['notifications']], self.newest_first[20:])
+        self.assertIsNone(second['next_cursor'])
+
+    def test_marking_read_lowers_the_unread_counter(self):
+        response = self.client.post('/ajax/mark-notifications-read/', {'notification_ids': self.newest_first[:2]}).json()
+        self.assertEqual((response['marked'], response['unread_count']), (2, 23))
+
+        # Already read notifications are not counted twice
+        response = self.client.post('/ajax/mark-notifications-read/').json()
+        self.assertEqual((response['marked'], response['unread_count']), (23, 0))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.unread_notifications_count, 0)
+        self.assertFalse(Notification.objects.filter(user=self.author, is_read=False).exists())
+
+    def test_invalid_ids_are_rejected(self):
+        response = self.client.post('/ajax/mark-notifications-read/', {'notification_ids': ['abc']})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(Notification.objects.filter(is_read=True).exists())
+
+    def test_listing_reports_the_buffered_unread_count(self):
+        with mock.patch.object(counters, 'WRITE_BEHIND', True):
+            counters.increment(self.author, 'unread_notifications_count', -5)
+            unread = self.client.post('/ajax/notifications/').json()['unread_count']
+            counters.buffer.flush()
+        self.assertEqual(unread, 20)
+
+class SuggestionTests(TestCase):
+
+    def setUp(self):
+        self.me, self.friend, self.fof, self.stranger = (
+            User.objects.create_user(username=name, password='pw') for name in ('me', 'friend', 'fof', 'stranger')
+        )
+        Follow.objects.create(follower=self.me, following=self.friend)
+        Follow.objects.create(follower=self.friend, following=self.fof)
+
+    def test_command_stores_friends_of_friends(self):
+        out = io.StringIO()
+        call_command('refresh_suggestions', '--top', '3', stdout=out)
+        self.assertRegex(out.getvalue(), r'Stored \d+ suggestions in ')
+
+        rows = SuggestedUser.objects.filter(user=self.me).order_by('rank')
+        self.assertEqual([(row.suggested_id, row.mutual_count) for row in rows], [(self.fof.id, 1), (self.stranger.id, 0)])
+        self.assertEqual(suggestions.suggested_for(self.me, 5), [self.fof, self.stranger])
+
+    def test_accounts_following_too_many_are_not_a_hop(self):
+        with mock.patch.object(suggestions, 'MAX_HOP_DEGREE', 0):
+            suggestions.refresh_suggestions(top_k=3)
+        self.assertEqual(SuggestedUser.objects.get(user=self.me, suggested=self.fof).mutual_count, 0)
+
+    def test_fallback_skips_inactive_accounts(self):
+        User.objects.filter(id=self.fof.id).update(is_active=False, followers_count=10)
+        self.assertEqual(suggestions.suggested_for(self.me, 5), [self.stranger])
+
+class ProfileTests(TestCase):
+
+    def test_follow_button_reflects_follows_made_elsewhere(self):
+        viewer = User.objects.create_user(username='viewer', password='pw')
+        User.objects.create_user(username='star', password='pw')
+        graph.follows.load()
+        # Followed through another worker, with its own copy of the graph
+        star = User.objects.get(username='star')
+        Follow.objects.create(follower=viewer, following=star)
+        graph.FollowGraph().changed(viewer.id, star.id)
+
+        self.client.force_login(viewer)
+        response = self.client.get('/profile/star/')
+        self.assertTrue(response.context['is_following'])
+
+class DirectKeyMigrationTests(TransactionTestCase):
+    """0012 folds duplicate 1:1 conversations of a pair into the oldest one."""
+
+    before = [('core', '0011_conversation_member')]
+    after = [('core', '0012_conversation_direct_key')]
+
+    def tearDown(self):
+        call_command('migrate', 'core', verbosity=0)
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_duplicate_direct_conversations_are_merged(self):
+        apps = self.migrate(self.before)
+        User, Conversation = apps.get_model('core', 'User'), apps.get_model('core', 'Conversation')
+        Member, Message = apps.get_model('core', 'ConversationMember'), apps.get_model('core', 'Message')
+        ann, ben, cat = (User.objects.create(username=name) for name in ('ann', 'ben', 'cat'))
+
+        def conversation(*users, is_group=False):
+            created = Conversation.objects.create(is_group=is_group)
+            for user in users:
+                Member.objects.create(conversation=created, user=user)
+            return created
+
+        oldest, duplicate, other = conversation(ann, ben), conversation(ben, ann), conversation(ann, cat)
+        group = conversation(ann, ben, is_group=True)
+        Message.objects.create(conversation=oldest, sender=ann, text='first')
+        Message.objects.create(conversation=duplicate, sender=ben, text='second')
+        Member.objects.filter(conversation=oldest, user=ben).update(unread_count=1, last_read_id=0)
+        Member.objects.filter(conversation=duplicate, user=ann).update(unread_count=1)
+        Member.objects.filter(conversation=duplicate).update(last_message_preview='second', last_message_sender=ben, last_message_at=timezone.now())
+
+        apps = self.migrate(self.after)
+        Conversation, Member = apps.get_model('core', 'Conversation'), apps.get_model('core', 'ConversationMember')
+        Message = apps.get_model('core', 'Message')
+        self.assertFalse(Conversation.objects.filter(id=duplicate.id).exists())
+        self.assertEqual(
+            dict(Conversation.objects.values_list('id', 'direct_key')),
+            {oldest.id: f'{ann.id}:{ben.id}', other.id: f'{ann.id}:{cat.id}', group.id: None},
+        )
+        self.assertEqual(list(Message.objects.filter(conversation_id=oldest.id).values_list('text', flat=True)), ['first', 'second'])
+        merged = {m.user_id: m for m in Member.objects.filter(conversation_id=oldest.id)}
+        self.assertEqual(set(merged), {ann.id, ben.id})
+        self.assertEqual((merged[ann.id].unread_count, merged[ben.id].unread_count), (1, 1))
+        self.assertEqual(merged[ann.id].last_message_preview, 'second')
+
+class GroupMemberTests(TestCase):
+
+    def test_member_added_concurrently_is_reported_as_present(self):
+        admin = User.objects.create_user(username='admin', password='pw')
+        racer, newcomer = (User.objects.create_user(username=name, password='pw') for name in ('racer', 'newcomer'))
+        conversation, _ = conversations.get_or_create_direct(admin, racer)
+
+        # The membership query runs before the concurrent add of racer commits
+        missed = mock.patch.object(ConversationMember.objects, 'filter', return_value=ConversationMember.objects.none())
+        with missed:
+            added, present = conversations.add_members(conversation, [racer, newcomer])
+        self.assertEqual((added, present), ([newcomer], [racer]))
+        self.assertEqual(ConversationMember.objects.filter(conversation=conversation).count(), 3)
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.ann, self.ben, self.cat = (User.objects.create_user(username=name, password='pw') for name in ('ann', 'ben', 'cat'))
+
+    def test_drain_turns_events_into_notifications(self):
+        group = Conversation.objects.create(is_group=True, group_name='Trip', admin=self.ann)
+        conversations.add_members(group, [self.ann, self.ben, self.cat])
+        outbox.enqueue(self.ann, 'message', conversation=group)
+        outbox.enqueue(self.ann, 'follow', recipient=self.ben)
+
+        self.assertEqual(outbox.drain(), 2)
+        self.assertFalse(OutboxEvent.objects.exists())
+        received = Notification.objects.values_list('user__username', 'notification_type', 'conversation_id')
+        self.assertEqual(
+            sorted(received),
+            [('ben', 'follow', None), ('ben', 'message', group.id), ('cat', 'message', group.id)],
+        )
+        self.assertEqual(outbox.drain(), 0)
+
+    def test_drain_processes_batches_in_order(self):
+        first = outbox.enqueue(self.ann, 'follow', recipient=self.ben)
+        outbox.enqueue(self.cat, 'follow', recipient=self.ben)
+        self.assertEqual(outbox.drain(batch_size=1), 1)
+        self.assertEqual(list(OutboxEvent.objects.values_list('from_user', flat=True)), [self.cat.id])
+        self.assertFalse(OutboxEvent.objects.filter(id=first.id).exists())
+        self.assertEqual(outbox.drain(batch_size=1), 1)
+        self.assertEqual(Notification.objects.get(user=self.ben).actor_count, 2)
+
+    def test_drain_query_count_does_not_grow_with_the_group(self):
+        for size in (5, 50):
+            members = User.objects.bulk_create([User(username=f'member{size}_{i}') for i in range(size)])
+            group = Conversation.objects.create(is_group=True, group_name=f'Group {size}', admin=self.ann)
+            conversations.add_members(group, [self.ann] + members)
+            outbox.enqueue(self.ann, 'message', conversation=group)
+            # Events, members, sender, idle groups, open groups, group insert, actor
+            # insert, actor_count, unread counter and event delete, plus savepoints
+            with self.assertNumQueries(14):
+                self.assertEqual(outbox.drain(), 1)
+            self.assertEqual(Notification.objects.filter(conversation=group).count(), size)
+        self.assertEqual(User.objects.get(username='member50_0').unread_notifications_count, 1)
+
+    def test_failed_drain_leaves_the_events_for_a_retry(self):
+        outbox.enqueue(self.ann, 'follow', recipient=self.ben)
+        failing = mock.patch.object(outbox.notifications, 'notify_many', side_effect=OperationalError('database is locked'))
+        with failing, self.assertRaises(OperationalError):
+            outbox.drain()
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+
+        self.assertEqual(outbox.drain(), 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertTrue(Notification.objects.filter(user=self.ben, from_user=self.ann, notification_type='follow').exists())
+
+class GetMessagesTests(TestCase):
+
+    def setUp(self):
+        self.ann, self.ben = (User.objects.create_user(username=name, password='pw') for name in ('ann', 'ben'))
+        self.conversation, _ = conversations.get_or_create_direct(self.ann, self.ben)
+        # Created in one statement, so most share a timestamp and pages rely on the id tiebreak
+        Message.objects.bulk_create([Message(conversation=self.conversation, sender=self.ann, text=f'm{i}') for i in range(120)])
+        self.ids = list(Message.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        self.url = f'/ajax/get-messages/{self.conversation.id}/'
+        self.client.force_login(self.ben)
+
+    def ids_of(self, response):
+        return [message['id'] for message in response['messages']]
+
+    def test_before_cursor_pages_back_through_history(self):
+        latest = self.client.get(self.url).json()
+        self.assertEqual(self.ids_of(latest), self.ids[70:])
+        self.assertTrue(latest['has_more'])
+
+        older = self.client.get(self.url, {'before': latest['next_cursor']}).json()
+        self.assertEqual(self.ids_of(older), self.ids[20:70])
+
+        oldest = self.client.get(self.url, {'before': older['next_cursor']}).json()
+        self.assertEqual(self.ids_of(oldest), self.ids[:20])
+        self.assertFalse(oldest['has_more'])
+
+    def test_after_returns_only_newer_messages(self):
+        response = self.client.get(self.url, {'after': self.ids[99]}).json()
+        self.assertEqual(self.ids_of(response), self.ids[100:])
+        self.assertFalse(response['has_more'])
+        self.assertEqual(self.ids_of(self.client.get(self.url, {'after': self.ids[-1]}).json()), [])
+
+    def test_after_is_capped_and_continues(self):
+        page = conversations.messages_after(self.conversation.id, self.ids[99], limit=15)
+        self.assertEqual([m.id for m in page.items], self.ids[100:115])
+        self.assertTrue(page.has_more)
+        page = conversations.messages_after(self.conversation.id, int(page.next_cursor), limit=15)
+        self.assertEqual([m.id for m in page.items], self.ids[115:])
+        self.assertFalse(page.has_more)
+
+    def test_bad_after_and_outsiders_are_rejected(self):
+        self.assertFalse(self.client.get(self.url, {'after': 'x'}).json()['success'])
+        self.client.force_login(User.objects.create_user(username='outsider', password='pw'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+class MessageArchiveTests(TestCase):
+
+    def setUp(self):
+        self.ann, self.ben = (User.objects.create_user(username=name, password='pw') for name in ('ann', 'ben'))
+        self.conversation, _ = conversations.get_or_create_direct(self.ann, self.ben)
+        for i in range(30):
+            Message.objects.create(conversation=self.conversation, sender=(self.ann, self.ben)[i % 2], text=f'm{i}', is_read=i < 25)
+        old = list(Message.objects.order_by('id').values_list('id', flat=True)[:20])
+        Message.objects.filter(id__in=old).update(created_at=timezone.now() - timedelta(days=400))
+        self.original = self.rows(Message.objects.order_by('created_at', 'id'))
+
+    def rows(self, messages):
+        return [(m.id, m.sender_id, m.text, m.is_read, m.created_at) for m in messages]
+
+    def history(self, page_size=8):
+        # Page back from the newest message the way the client scrolls
+        messages, cursor = [], None
+        while True:
+            page = conversations.message_history(self.conversation.id, cursor, page_size)
+            messages = page.items + messages
+            if not page.has_more:
+                return messages
+            cursor = page.next_cursor
+
+    def archive(self):
+        call_command('archive_messages', '--segment-size', '7', stdout=io.StringIO())
+
+    def test_archived_messages_read_back_unchanged(self):
+        self.archive()
+        self.assertEqual(Message.objects.count(), 10)
+        self.assertEqual(
+            list(self.conversation.archive_segments.order_by('first_id').values_list('message_count', flat=True)),
+            [7, 7, 6],
+        )
+        self.assertEqual(self.rows(self.history()), self.original)
+        self.assertEqual(self.rows(self.history(page_size=50)), self.original)
+
+        # Archiving again finds nothing left to move
+        self.archive()
+        self.assertEqual(self.conversation.archive_segments.count(), 3)
+
+    def test_messages_of_deleted_senders_are_dropped(self):
+        self.archive()
+        self.ben.delete()
+        history = self.history()
+        self.assertEqual(self.rows(history), [row for row in self.original if row[1] == self.ann.id])
+        self.assertTrue(all(message.sender == self.ann for message in history))
+
+class GroupMessageTests(TestCase):
+
+    def test_leaving_a_group_sends_a_message(self):
+        admin, member = (User.objects.create_user(username=name, password='pw') for name in ('admin', 'member'))
+        group = Conversation.objects.create(is_group=True, group_name='Trip', admin=admin)
+        group.participants.add(admin, member)
+        Conversation.objects.filter(id=group.id).update(updated_at=group.updated_at - timedelta(days=1))
+
+        self.client.force_login(member)
+        with mock.patch.object(realtime, 'publish_message') as publish, self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/ajax/leave-group/', {'conversation_id': group.id})
+
+        self.assertEqual(publish.call_args.args[0].text, 'member left the group')
+        self.assertGreater(Conversation.objects.get(id=group.id).updated_at, group.updated_at)
+        self.assertTrue(OutboxEvent.objects.filter(from_user=member, conversation=group).exists())
+
+class InboxTests(TestCase):
+
+    def setUp(self):
+        self.ann, self.ben, self.cat = (User.objects.create_user(username=name, password='pw') for name in ('ann', 'ben', 'cat'))
+        self.group = Conversation.objects.create(is_group=True, group_name='Trip', admin=self.ann)
+        conversations.add_members(self.group, [self.ann, self.ben, self.cat])
+        self.direct, _ = conversations.get_or_create_direct(self.ann, self.ben)
+
+    def membership(self, conversation, user):
+        return ConversationMember.objects.select_related('conversation').get(conversation=conversation, user=user)
+
+    def test_sending_only_moves_the_senders_read_position(self):
+        conversations.send(self.group, self.ann, 'hello')
+        message = conversations.send(self.group, self.ben, 'hi')
+        self.assertEqual(self.membership(self.group, self.ben).last_read_id, message.id)
+        self.assertLess(self.membership(self.group, self.ann).last_read_id, message.id)
+        self.assertEqual(self.membership(self.group, self.cat).last_read_id, 0)
+        self.assertFalse(self.membership(self.group, self.ben).has_unread)
+        self.assertTrue(self.membership(self.group, self.cat).has_unread)
+
+        conversations.mark_read(self.group.id, self.cat)
+        self.assertFalse(self.membership(self.group, self.cat).has_unread)
+
+    def test_mark_read_endpoint_validates_the_conversation(self):
+        conversations.send(self.group, self.ann, 'hello')
+        self.client.force_login(self.cat)
+        url = '/ajax/mark-conversation-read/'
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.post(url, {'conversation_id': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.post(url, {'conversation_id': self.direct.id}).status_code, 404)
+
+        self.assertTrue(self.client.post(url, {'conversation_id': self.group.id}).json()['success'])
+        self.assertFalse(self.membership(self.group, self.cat).has_unread)
+
+    def test_inbox_is_ordered_by_the_last_message(self):
+        conversations.send(self.group, self.ann, 'first')
+        conversations.send(self.direct, self.ben, 'second')
+        memberships = conversations.inbox(self.ann)
+        self.assertEqual([m.conversation_id for m in memberships], [self.direct.id, self.group.id])
+        self.assertEqual(memberships[0].other_user, self.ben)
+        self.assertEqual(memberships[0].conversation.last_message_sender, self.ben)
+        self.assertEqual(memberships[0].conversation.last_message_preview, 'second')
+
+        conversations.send(self.group, self.cat, 'third')
+        self.assertEqual([m.conversation_id for m in conversations.inbox(self.ann)], [self.group.id, self.direct.id])
+
+        self.client.force_login(self.ann)
+        self.assertContains(self.client.get('/messages/'), 'third')
+
+class SharePostTests(TestCase):
+
+    def test_sharing_to_a_conversation_sends_a_message(self):
+        sender = User.objects.create_user(username='sender', password='pw')
+        friend = User.objects.create_user(username='friend', password='pw')
+        post = Post.objects.create(user=friend, caption='hello')
+        conversation, _ = conversations.get_or_create_direct(sender, friend)
+
+        self.client.force_login(sender)
+        with mock.patch.object(realtime, 'publish_message') as publish, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/ajax/share-post/', {
+                'post_id': post.id, 'share_type': 'message', 'conversation_id': conversation.id,
+            })
+        self.assertTrue(response.json()['success'])
+
+        message = publish.call_args.args[0]
+        self.assertEqual(message.text, 'Shared a post by @friend')
+        member = ConversationMember.objects.select_related('conversation').get(conversation=conversation, user=friend)
+        self.assertEqual((member.has_unread, member.conversation.last_message_preview), (True, message.text))
+        self.assertTrue(OutboxEvent.objects.filter(from_user=sender, conversation=conversation).exists())
+
+class WebSocketAuthTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='member', password='pw')
+        self.client.force_login(self.user)
+
+    def scope(self):
+        cookie = self.client.cookies[settings.SESSION_COOKIE_NAME]
+        return {'headers': [(b'cookie', f'{cookie.key}={cookie.value}'.encode())]}
+
+    def test_logged_in_session_is_accepted(self):
+        self.assertEqual(realtime._session_user_id(self.scope()), self.user.pk)
+
+    def test_session_is_refused_after_password_change(self):
+        self.user.set_password('new')
+        self.user.save()
+        self.assertIsNone(realtime._session_user_id(self.scope()))
+
+    def test_session_is_refused_for_inactive_user(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(realtime._session_user_id(self.scope()))
+
+class DatabaseBrokerTests(TestCase):
+
+    def setUp(self):
+        self.sender, self.member = (User.objects.create_user(username=name, password='pw') for name in ('sender', 'member'))
+        self.conversation, _ = conversations.get_or_create_direct(self.sender, self.member)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, broker):
+        async def subscribe():
+            return broker.subscribe(realtime.conversation_channel(self.conversation.id))
+        with mock.patch.object(realtime.threading, 'Thread'):
+            return self.loop.run_until_complete(subscribe())
+
+    def test_messages_saved_by_another_process_reach_subscribers(self):
+        broker = realtime.DatabaseBroker()
+        subscription = self.subscribe(broker)
+        broker.poll()
+
+        # Saved through a WSGI worker, whose broker never sees the subscriber
+        message = Message.objects.create(conversation=self.conversation, sender=self.sender, text='hi')
+        broker.poll()
+        payload = self.loop.run_until_complete(subscription.get(timeout=1))
+        self.assertEqual((payload['id'], payload['text']), (message.id, 'hi'))
+
+    def test_wsgi_long_poll_answers_at_once(self):
+        self.client.force_login(self.member)
+        response = self.client.get(f'/ajax/poll-messages/{self.conversation.id}/?after=0')
+        self.assertEqual(response.json(), {'success': True, 'messages': [], 'retry_after': realtime.WSGI_POLL_INTERVAL})
+
+class PostDetailTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pw')
+        self.viewer = User.objects.create_user(username='viewer', password='pw')
+        self.post = Post.objects.create(user=self.author, caption='soon', status='processing')
+
+    def test_unpublished_post_is_hidden_from_others(self):
+        self.client.force_login(self.viewer)
+        self.assertEqual(self.client.get(f'/post/{self.post.id}/').status_code, 404)
+
+    def test_author_sees_placeholder_while_processing(self):
+        self.client.force_login(self.author)
+        response = self.client.get(f'/post/{self.post.id}/')
+        self.assertContains(response, 'Your post is still processing')
+
+class UnpublishedPostTests(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='pw')
+        self.fan = User.objects.create_user(username='fan', password='pw')
+        self.post = Post.objects.create(user=self.author, caption='soon', status='processing')
+
+    def test_author_comment_does_not_put_post_on_hashtag_page(self):
+        self.client.force_login(self.author)
+        self.client.post('/ajax/add-comment/', {'post_id': self.post.id, 'text': '#secret'})
+        self.assertFalse(Hashtag.objects.filter(name='secret', posts_count__gt=0).exists())
+
+        hashtag = Hashtag.objects.create(name='later')
+        tags.link_hashtags(self.post, '#later')
+        self.assertEqual(feed.tag_feed(hashtag).items, [])
+
+    def test_unpublished_post_cannot_be_liked(self):
+        self.client.force_login(self.fan)
+        self.assertEqual(self.client.post('/ajax/like-post/', {'post_id': self.post.id}).status_code, 404)
+
+        results, errors = engagement.apply_batch(self.fan, [{'type': 'like_post', 'id': self.post.id}])
+        self.assertEqual(errors, [{'type': 'like_post', 'id': self.post.id, 'error': 'Not found'}])
+        self.assertFalse(Like.objects.exists())
+
+class BatchActionTests(TestCase):
+
+    def test_only_boolean_values_are_accepted(self):
+        user = User.objects.create_user(username='fan', password='pw')
+        post = Post.objects.create(user=user, caption='hello')
+        results, errors = engagement.apply_batch(user, [
+            {'type': 'like_post', 'id': post.id, 'value': 'false'},
+            {'type': 'like_post', 'id': post.id, 'value': 0},
+        ])
+        self.assertEqual(errors, [
+            {'index': 0, 'error': 'value must be true or false'},
+            {'index': 1, 'error': 'value must be true or false'},
+        ])
+        self.assertFalse(Like.objects.exists())
+
+    def test_concurrent_likes_and_unlikes_are_not_counted_twice(self):
+        user = User.objects.create_user(username='fan', password='pw')
+        liked, unliked = (Post.objects.create(user=user, caption=caption) for caption in ('liked', 'unliked'))
+        Like.objects.create(user=user, post=unliked)
+        Post.objects.filter(id=unliked.id).update(likes_count=1)
+
+        # Both rows change through the single endpoints after the batch read them
+        desired_states = engagement._desired_states
+
+        def other_request_first(operations, existing):
+            Like.objects.create(user=user, post=liked)
+            Post.objects.filter(id=liked.id).update(likes_count=1)
+            Like.objects.filter(post=unliked).delete()
+            Post.objects.filter(id=unliked.id).update(likes_count=0)
+            return desired_states(operations, existing)
+
+        with mock.patch.object(engagement, '_desired_states', side_effect=other_request_first):
+            results, errors = engagement.apply_batch(user, [
+                {'type': 'like_post', 'id': liked.id, 'value': True},
+                {'type': 'like_post', 'id': unliked.id, 'value': False},
+            ])
+        self.assertEqual(results['like_post'], {
+            liked.id: {'liked': True, 'likes_count': 1},
+            unliked.id: {'liked': False, 'likes_count': 0},
+        })
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        fan, author = (User.objects.create_user(username=name, password='pw') for name in ('fan', 'author'))
+        for size in (10, 100):
+            Post.objects.bulk_create([Post(user=author, caption=f'{size} {i}') for i in range(size)])
+            posts = list(Post.objects.filter(caption__startswith=f'{size} ').values_list('id', flat=True))
+            likes = [{'type': 'like_post', 'id': post_id} for post_id in posts]
+            with self.assertNumQueries(16):
+                results, errors = engagement.apply_batch(fan, likes)
+            self.assertEqual(errors, [])
+            self.assertTrue(all(result == {'liked': True, 'likes_count': 1} for result in results['like_post'].values()))
+
+            with self.assertNumQueries(7):
+                engagement.apply_batch(fan, [dict(like, value=False) for like in likes])
+            self.assertFalse(Like.objects.filter(post_id__in=posts).exists())
+            self.assertEqual(set(Post.objects.filter(id__in=posts).values_list('likes_count', flat=True)), {0})
+
+class AnnotatePostsTests(TestCase):
+
+    def setUp(self):
+        self.viewer, self.author = (User.objects.create_user(username=name, password='pw') for name in ('viewer', 'author'))
+
+    def page(self, size):
+        Post.objects.bulk_create([Post(user=self.author, image=f'posts/{i}.jpg') for i in range(size)])
+        return list(Post.objects.select_related('user').order_by('id')[:size])
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        # Liked ids, saved ids and image derivatives, whatever the page size
+        for size in (1, 10):
+            Post.objects.all().delete()
+            posts = self.page(size)
+            with self.assertNumQueries(3):
+                feed.annotate_posts(posts, self.viewer)
+
+    def test_marks_liked_and_saved_posts(self):
+        first, second = self.page(2)
+        Like.objects.create(user=self.viewer, post=first)
+        SavedPost.objects.create(user=self.viewer, post=second)
+        feed.annotate_posts([first, second], self.viewer)
+        self.assertEqual((first.is_liked_by_user, first.is_saved_by_user), (True, False))
+        self.assertEqual((second.is_liked_by_user, second.is_saved_by_user), (False, True))
+
+class HomeFeedTests(TestCase):
+
+    def setUp(self):
+        self.reader, self.author = (User.objects.create_user(username=name, password='pw') for name in ('reader', 'author'))
+        Follow.objects.create(follower=self.reader, following=self.author)
+        User.objects.filter(id=self.author.id).update(followers_count=1)
+        self.author.refresh_from_db()
+        graph.follows.load()
+
+    def publish(self, caption):
+        post = Post.objects.create(user=self.author, caption=caption)
+        feed.fan_out_post(post)
+        return post
+
+    def test_posts_are_fanned_out_to_followers(self):
+        post = self.publish('hello')
+        self.assertEqual(set(FeedItem.objects.filter(post=post).values_list('user_id', flat=True)), {self.reader.id, self.author.id})
+        self.assertEqual(feed.home_feed(self.reader).items, [post])
+
+    def test_celebrity_posts_are_merged_at_read_time(self):
+        pushed = self.publish('before')
+        with mock.patch.object(feed, 'FANOUT_MAX_FOLLOWERS', 1):
+            pulled = self.publish('famous')
+            self.assertFalse(FeedItem.objects.filter(user=self.reader, post=pulled).exists())
+            self.assertEqual(feed.home_feed(self.reader).items, [pulled, pushed])
+
+        # The author has dropped back below the threshold
+        self.assertEqual(feed.home_feed(self.reader).items, [pulled, pushed])
+
+    def test_pages_continue_across_inbox_and_pulled_posts(self):
+        posts = []
+        for i in range(5):
+            with mock.patch.object(feed, 'FANOUT_MAX_FOLLOWERS', 1 if i % 2 else 10000):
+                posts.append(self.publish(f'post {i}'))
+        first = feed.home_feed(self.reader, limit=3)
+        second = feed.home_feed(self.reader, first.next_cursor, limit=3)
+        self.assertEqual(first.items + second.items, posts[::-1])
+        self.assertIsNone(second.next_cursor)
+
+    def test_pulled_posts_query_does_not_grow_with_following(self):
+        others = User.objects.bulk_create([User(username=f'other{i}') for i in range(500)])
+        Follow.objects.bulk_create([Follow(follower=self.reader, following=other) for other in others])
+        with mock.patch.object(feed, 'FANOUT_MAX_FOLLOWERS', 1):
+            pulled = self.publish('famous')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(feed.home_feed(self.reader).items, [pulled])
+        self.assertEqual(len(queries), 3)
+        sql = next(query['sql'] for query in queries if 'core_pulledpost' in query['sql'])
+        self.assertIn('core_follow', sql)
+        self.assertLess(len(sql), 1000)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        newcomer = User.objects.create_user(username='newcomer', password='pw')
+        pushed = self.publish('pushed')
+        with mock.patch.object(feed, 'FANOUT_MAX_FOLLOWERS', 1):
+            pulled = self.publish('pulled')
+
+        feed.backfill_follow(newcomer, self.author)
+        self.assertEqual(list(FeedItem.objects.filter(user=newcomer).values_list('post_id', flat=True)), [pushed.id])
+
+        feed.prune_unfollow(self.reader, self.author)
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+        self.assertTrue(PulledPost.objects.filter(post=pulled).exists())
+
+    def test_rebuild_skips_pulled_posts(self):
+        pushed = self.publish('pushed')
+        with mock.patch.object(feed, 'FANOUT_MAX_FOLLOWERS', 1):
+            self.publish('pulled')
+        feed.rebuild_feed(self.reader)
+        self.assertEqual(list(FeedItem.objects.filter(user=self.reader).values_list('post_id', flat=True)), [pushed.id])
+
+class CursorTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='pw')
+        self.client.force_login(self.user)
+        for i in range(25):
+            Post.objects.create(user=self.user, caption=f'post {i}')
+
+    def test_newest_first_cursor_restarts_a_scored_list(self):
+        cursor = feed.explore_feed().next_cursor
+        ranking.refresh_scores(full=True)
+        self.assertEqual(len(feed.explore_feed(cursor).items), 20)
+
+    def test_score_cursor_restarts_newest_first_lists(self):
+        ranking.refresh_scores(full=True)
+        cursor = feed.explore_feed().next_cursor
+        self.assertEqual(self.client.get(f'/profile/author/?cursor={cursor}').status_code, 200)
+        self.assertEqual(self.client.get(f'/notifications/?cursor={cursor}').status_code, 200)
+        self.assertEqual(feed.home_feed(self.user, cursor).next_cursor, None)
+
+        other = User.objects.create_user(username='other', password='pw')
+        conversation, _ = conversations.get_or_create_direct(self.user, other)
+        response = self.client.get(f'/ajax/get-messages/{conversation.id}/?before={cursor}')
+        self.assertTrue(response.json()['success'])
+
+class ExploreTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='pw')
+
+    def test_only_published_posts_are_scored_and_listed(self):
+        ready = Post.objects.create(user=self.user, caption='ready')
+        pending = Post.objects.create(user=self.user, caption='pending', status='processing')
+        ranking.refresh_scores(full=True)
+        self.assertEqual(feed.explore_feed().items, [ready])
+
+        # Published after the refresh that skipped it
+        Post.objects.filter(id=pending.id).update(status='ready', published_at=timezone.now())
+        ranking.refresh_scores()
+        self.assertCountEqual(feed.explore_feed().items, [ready, pending])
+
+    def test_failed_post_leaves_explore(self):
+        post = Post.objects.create(user=self.user, caption='gone', status='processing')
+        Post.objects.create(user=self.user, caption='stays')
+        Post.objects.filter(id=post.id).update(status='ready', published_at=timezone.now())
+        ranking.refresh_scores(full=True)
+
+        uploads._fail(MediaJob(post=post), 'Processing failed')
+        self.assertNotIn(post, feed.explore_feed().items)
+
+    def test_post_published_long_after_creation_is_scored(self):
+        ranking.refresh_scores(full=True)
+        post = Post.objects.create(user=self.user, caption='late', status='processing')
+        Post.objects.filter(id=post.id).update(created_at=timezone.now() - timedelta(days=3))
+
+        Post.objects.filter(id=post.id).update(status='ready', published_at=timezone.now())
+        ranking.refresh_scores()
+        self.assertEqual(feed.explore_feed().items, [post])
+
+    def test_unlisting_the_newest_scores_keeps_the_watermark(self):
+        old = Post.objects.create(user=self.user, caption='old')
+        ranking.refresh_scores(full=True)
+        refreshed = ranking.last_refresh()
+        new = Post.objects.create(user=self.user, caption='new')
+        ranking.refresh_scores()
+
+        ranking.unlist([new.id])
+        self.assertGreater(ranking.last_refresh(), refreshed)
+        score = PostScore.objects.get(post=old).score
+        ranking.refresh_scores()
+        self.assertEqual(PostScore.objects.get(post=old).score, score)
+        self.assertFalse(PostScore.objects.filter(post=new).exists())
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageDerivativeTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='author', password='pw')
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 800)).save(buffer, 'JPEG')
+        self.post = Post.objects.create(user=user, image=SimpleUploadedFile('photo.jpg', buffer.getvalue()))
+
+    def test_generates_every_size(self):
+        derivatives = {d.size: d for d in images.generate(self.post.image)}
+        self.assertEqual(set(derivatives), set(images.SIZES))
+        self.assertEqual((derivatives['thumb'].width, derivatives['thumb'].height), (150, 150))
+        self.assertEqual((derivatives['grid'].width, derivatives['grid'].height), (600, 600))
+        self.assertEqual((derivatives['feed'].width, derivatives['feed'].height), (640, 427))
+        self.assertEqual((derivatives['full'].width, derivatives['full'].height), (1080, 720))
+        for derivative in derivatives.values():
+            self.assertTrue(derivative.file.storage.exists(derivative.file.name))
+
+    def test_regenerating_deletes_the_old_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            old = images.generate(self.post.image)
+        with self.captureOnCommitCallbacks(execute=True):
+            new = images.generate(self.post.image)
+        self.assertEqual(ImageDerivative.objects.count(), len(images.SIZES))
+        for derivative in old:
+            self.assertFalse(derivative.file.storage.exists(derivative.file.name))
+        for derivative in new:
+            self.assertTrue(derivative.file.storage.exists(derivative.file.name))
+
+    def test_srcset_tag_lists_the_family(self):
+        derivatives = {d.size: d for d in images.generate(self.post.image)}
+        feed, full = derivatives['feed'], derivatives['full']
+        self.assertEqual(
+            srcset(self.post.image, 'feed'),
+            f'src="{feed.file.url}" srcset="{feed.file.url} 640w, {full.file.url} 1080w" '
+            f'sizes="{images.DISPLAY_SIZES["feed"]}"',
+        )
+
+    def test_srcset_tag_falls_back_to_the_original(self):
+        self.assertEqual(srcset(self.post.image, 'feed'), f'src="{self.post.image.url}"')
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class MediaJobTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='author', password='pw')
+
+    def enqueue(self, data, content_type='image/jpeg'):
+        post = Post.objects.create(user=self.user, status='processing')
+        uploads.enqueue(post, SimpleUploadedFile('upload.jpg', data, content_type))
+        return uploads.claim(1)[0]
+
+    def jpeg(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30)).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def test_database_error_while_publishing_requeues_the_job(self):
+        job_id = self.enqueue(self.jpeg())
+        locked = mock.patch.object(uploads.feed, 'fan_out_post', side_effect=OperationalError('database is locked'))
+        with locked, self.assertLogs('core.uploads', 'WARNING'):
+            self.assertEqual(uploads.process(job_id), 'queued')
+        job = MediaJob.objects.get(id=job_id)
+        self.assertEqual((job.status, job.post.status), ('queued', 'processing'))
+
+        # Nothing the failed attempt wrote is left behind
+        self.assertFalse(ImageDerivative.objects.exists())
+
+        self.assertEqual(uploads.claim(1), [job_id])
+        self.assertEqual(uploads.process(job_id), 'done')
+        self.assertEqual(Post.objects.get(id=job.post_id).status, 'ready')
+
+    def test_only_one_copy_of_a_requeued_job_publishes(self):
+        job_id = self.enqueue(self.jpeg())
+        fan_out = uploads.feed.fan_out_post
+        second = []
+
+        def second_copy_finishes_meanwhile(post):
+            # As if the job had been requeued as stale and picked up again
+            if not second:
+                second.append(uploads.process(job_id))
+            fan_out(post)
+
+        with mock.patch.object(uploads.feed, 'fan_out_post', side_effect=second_copy_finishes_meanwhile) as fan_out_post:
+            self.assertEqual(uploads.process(job_id), 'done')
+        fan_out_post.assert_called_once()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.posts_count, 1)
+
+        post = MediaJob.objects.get(id=job_id).post
+        self.assertEqual(set(ImageDerivative.objects.values_list('source', flat=True)), {post.image.name})
+
+    def test_cleanup_error_after_publishing_keeps_the_post(self):
+        job_id = self.enqueue(self.jpeg())
+        failing = mock.patch.object(uploads.search.cache, 'invalidate', side_effect=RuntimeError('cache down'))
+        with failing, self.assertLogs('core.uploads', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(uploads.process(job_id), 'done')
+        post = MediaJob.objects.get(id=job_id).post
+        self.assertEqual(post.status, 'ready')
+        self.assertTrue(post.image.storage.exists(post.image.name))
+        self.assertTrue(ImageDerivative.objects.filter(source=post.image.name).exists())
+
+    def test_buffered_counters_are_flushed_after_each_job(self):
+        job_id = self.enqueue(self.jpeg())
+        with mock.patch.object(counters, 'WRITE_BEHIND', True):
+            self.assertEqual(uploads.process(job_id), 'done')
+            self.assertEqual(counters.buffer.pending(User, self.user.pk, 'posts_count'), 0)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.posts_count, 1)
+
+    def test_unreadable_image_fails_the_post(self):
+        job_id = self.enqueue(b'not an image')
+        self.assertEqual(uploads.process(job_id), 'failed')
+        self.assertEqual(MediaJob.objects.get(id=job_id).post.status, 'failed')
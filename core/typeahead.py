@@ -0,0 +1,206 @@
+import logging
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+import numpy as np
+from django.conf import settings
+from django.db import DatabaseError
+from .models import User
+from .snapshots import Snapshot
+
+logger = logging.getLogger(__name__)
+
+# Full reload interval; picks up edits made by other workers
+REFRESH_SECONDS = getattr(settings, 'TYPEAHEAD_REFRESH_SECONDS', 300)
+# Local edits kept beside the packed keys before forcing a reload
+MAX_PENDING = getattr(settings, 'TYPEAHEAD_MAX_PENDING', 10000)
+
+def _name_keys(username, first_name, last_name):
+    names = (username, first_name, last_name, f"{first_name} {last_name}".strip())
+    return {name.lower().encode() for name in names if name}
+
+def _display(user):
+    return (
+        user.username,
+        f"{user.first_name} {user.last_name}".strip(),
+        user.profile_picture.name if user.profile_picture else '',
+        user.followers_count,
+    )
+
+def _pack(strings):
+    offsets = array('q', [0])
+    for value in strings:
+        offsets.append(offsets[-1] + len(value))
+    return b''.join(strings), offsets
+
+class UserIndex(Snapshot):
+    """Sorted prefix index over usernames and first, last and full names.
+
+    Keys are UTF-8 encoded, sorted and packed into one bytes blob with an int64
+    offsets array, and the row of the owning user sits at the same position in
+    a parallel array. Users are rows of packed arrays too: id, followers_count
+    and a blob holding username, full name and picture, so an entry costs its
+    key bytes plus 16 and no per-user objects are kept. A lookup bisects to the
+    range of keys with the prefix and picks the most followed users from all of
+    it, without a database query. Users edited through this worker are kept in
+    a small sorted overlay until the next reload.
+    """
+
+    refresh_seconds = REFRESH_SECONDS
+    label = 'typeahead'
+
+    def __init__(self):
+        super().__init__()
+        self._blob = b''
+        self._offsets = array('q', [0])
+        self._owners = np.empty(0, dtype=np.int64)
+        self._pks = np.empty(0, dtype=np.int64)
+        self._followers = np.empty(0, dtype=np.int64)
+        self._fields = b''
+        self._field_offsets = array('q', [0])
+        # Sorted (key, pk) entries of users re-indexed since the load, with their
+        # display fields; their packed entries are hidden like those of removed users
+        self._added = []
+        self._edited = {}
+        self._hidden = set()
+        # Changes recorded while a load runs, replayed over its snapshot
+        self._during_load = None
+
+    def load(self):
+        with self._lock:
+            self._during_load = []
+        try:
+            entries, fields = [], []
+            pks, followers = array('q'), array('q')
+            rows = User.objects.filter(is_active=True).values_list(
+                'id', 'username', 'first_name', 'last_name', 'profile_picture', 'followers_count'
+            )
+            for row, (pk, username, first_name, last_name, picture, followers_count) in enumerate(rows.iterator(chunk_size=5000)):
+                entries.extend((key, row) for key in _name_keys(username, first_name, last_name))
+                pks.append(pk)
+                followers.append(followers_count)
+                fields.extend(value.encode() for value in (username, f"{first_name} {last_name}".strip(), picture or ''))
+            entries.sort()
+            blob, offsets = _pack([key for key, _ in entries])
+            owners = np.array([row for _, row in entries], dtype=np.int64)
+            field_blob, field_offsets = _pack(fields)
+            del entries, fields
+        except BaseException:
+            with self._lock:
+                self._during_load = None
+            raise
+
+        with self._lock:
+            self._blob, self._offsets, self._owners = blob, offsets, owners
+            self._pks = np.frombuffer(pks, dtype=np.int64)
+            self._followers = np.frombuffer(followers, dtype=np.int64)
+            self._fields, self._field_offsets = field_blob, field_offsets
+            self._added, self._edited, self._hidden = [], {}, set()
+            changes, self._during_load = self._during_load, None
+            for pk, keys, display in changes:
+                self._replace(pk, keys, display)
+            self.loaded_at = time.monotonic()
+        return len(pks)
+
+    def _key(self, position):
+        return self._blob[self._offsets[position]:self._offsets[position + 1]]
+
+    def _field(self, position):
+        return self._fields[self._field_offsets[position]:self._field_offsets[position + 1]].decode()
+
+    def _row(self, row):
+        username, full_name, picture = (self._field(3 * row + i) for i in range(3))
+        return int(self._pks[row]), username, full_name, picture, int(self._followers[row])
+
+    def _replace(self, pk, keys, display):
+        self._hidden.add(pk)
+        self._added = [entry for entry in self._added if entry[1] != pk]
+        self._edited.pop(pk, None)
+        if keys:
+            for key in keys:
+                insort(self._added, (key, pk))
+            self._edited[pk] = display
+        if len(self._hidden) > MAX_PENDING:
+            self.loaded_at = float('-inf')
+
+    def _record(self, pk, keys, display=None):
+        with self._lock:
+            if self.loaded_at is None and self._during_load is None:
+                return
+            self._replace(pk, keys, display)
+            if self._during_load is not None:
+                self._during_load.append((pk, keys, display))
+
+    def update(self, user):
+        """Index a new user or re-index one whose names or picture changed."""
+        if user.is_active:
+            self._record(user.pk, _name_keys(user.username, user.first_name, user.last_name), _display(user))
+        else:
+            self._record(user.pk, None)
+
+    def remove(self, user_id):
+        self._record(user_id, None)
+
+    def search(self, query, limit=10, exclude=()):
+        """Return up to limit users with a name starting with query, most followed first.
+
+        Every match is ranked, not just the first few, and users with the same
+        follower count keep key order, so shorter and exact names come first.
+        """
+        prefix = query.strip().lower().encode()
+        if not prefix:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            positions = range(len(self._owners))
+            starts_with = lambda position: self._key(position)[:len(prefix)]
+            low = bisect_left(positions, prefix, key=starts_with)
+            high = bisect_right(positions, prefix, key=starts_with)
+            rows, first = np.unique(self._owners[low:high], return_index=True)
+            skipped = self._hidden.union(exclude)
+            if skipped and len(rows):
+                keep = ~np.isin(self._pks[rows], list(skipped))
+                rows, first = rows[keep], first[keep]
+
+            # Overlay users are ranked by where their key would sit among the packed ones
+            edited = {}
+            for key, pk in self._added[bisect_left(self._added, (prefix,)):]:
+                if not key.startswith(prefix):
+                    break
+                if pk not in exclude and pk not in edited:
+                    edited[pk] = bisect_left(positions, key, key=self._key)
+
+            order = np.concatenate([-self._followers[rows], [-self._edited[pk][3] for pk in edited]]).astype(np.int64)
+            position = np.concatenate([low + first, list(edited.values())]).astype(np.int64)
+            if len(order) > limit:
+                # Only candidates at least as followed as the limit-th can make the page
+                threshold = np.partition(order, limit - 1)[limit - 1]
+                candidates = np.flatnonzero(order <= threshold)
+            else:
+                candidates = np.arange(len(order))
+            top = candidates[np.lexsort((position[candidates], order[candidates]))][:limit]
+
+            overlay = list(edited)
+            found = [
+                self._row(rows[i]) if i < len(rows) else (overlay[i - len(rows)], *self._edited[overlay[i - len(rows)]])
+                for i in top.tolist()
+            ]
+
+        storage = User._meta.get_field('profile_picture').storage
+        return [{
+            'id': pk,
+            'username': username,
+            'full_name': full_name,
+            'profile_picture': storage.url(picture) if picture else None,
+            'followers_count': followers_count,
+        } for pk, username, full_name, picture, followers_count in found]
+
+index = UserIndex()
+
+def warm():
+    """Load the index at worker start; later requests retry if the database is not ready."""
+    try:
+        count = index.load()
+        logger.info(f"Loaded {count} users into the typeahead index")
+    except DatabaseError:
+        logger.warning("Typeahead index not loaded at startup", exc_info=True)
@@ -0,0 +1,182 @@
+import logging
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.base import File
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+from . import counters, feed, images, ranking, search, tags
+from .models import MediaJob, Post
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_VIDEO_BYTES = 100 * 1024 * 1024
+# Jobs still 'processing' after this long are assumed to belong to a dead worker
+STALE_AFTER = timedelta(seconds=getattr(settings, 'MEDIA_JOB_STALE_SECONDS', 600))
+MAX_ATTEMPTS = getattr(settings, 'MEDIA_JOB_MAX_ATTEMPTS', 3)
+
+class MediaError(Exception):
+    """Media that cannot be published; the message is shown to the uploader."""
+
+def enqueue(post, media):
+    """Stage an uploaded file for a 'processing' post; a single INSERT plus the file write."""
+    return MediaJob.objects.create(post=post, user=post.user, staged_file=media, content_type=media.content_type)
+
+def claim(limit):
+    """Mark up to limit queued jobs as processing and return their ids, oldest first.
+
+    Each claim is a conditional UPDATE, so several workers can share the queue.
+    """
+    claimed = []
+    for job_id in list(MediaJob.objects.filter(status='queued').order_by('id').values_list('id', flat=True)[:limit]):
+        updated = MediaJob.objects.filter(id=job_id, status='queued').update(
+            status='processing', started_at=timezone.now(), attempts=F('attempts') + 1,
+        )
+        if updated:
+            claimed.append(job_id)
+    return claimed
+
+def requeue_stale():
+    """Return jobs abandoned by a crashed worker to the queue; returns how many were requeued."""
+    stale = MediaJob.objects.filter(status='processing', started_at__lt=timezone.now() - STALE_AFTER)
+    for job in stale.filter(attempts__gte=MAX_ATTEMPTS):
+        _fail(job, 'Processing timed out')
+    return stale.filter(attempts__lt=MAX_ATTEMPTS).update(status='queued', progress=0)
+
+def _set_progress(job, progress):
+    MediaJob.objects.filter(id=job.id).update(progress=progress)
+
+def _requeue(job):
+    MediaJob.objects.filter(id=job.id, status='processing').update(status='queued', progress=0)
+
+def _fail(job, error):
+    # A copy of the job requeued as stale may have published the post already
+    MediaJob.objects.filter(id=job.id).exclude(status='done').update(
+        status='failed', error=error[:255], staged_file='', finished_at=timezone.now(),
+    )
+    Post.objects.filter(id=job.post_id, status='processing').update(status='failed')
+    ranking.unlist([job.post_id])
+    job.staged_file.delete(save=False)
+
+def _discard(post):
+    """Delete the media and derivatives this attempt wrote, before a retry or after losing a race."""
+    try:
+        if post.image:
+            images.discard(post.image)
+            post.image.delete(save=False)
+        if post.video:
+            post.video.delete(save=False)
+    except OSError:
+        logger.warning(f"Could not delete the media written for post {post.id}", exc_info=True)
+
+def _inspect(job):
+    """Validate the staged file and return its metadata."""
+    size = job.staged_file.size
+    if job.content_type.startswith('image'):
+        if size > MAX_IMAGE_BYTES:
+            raise MediaError('Image file too large. Maximum size is 10MB.')
+        try:
+            with job.staged_file.open('rb') as handle:
+                image = Image.open(handle)
+                metadata = {
+                    'kind': 'image', 'format': image.format, 'mode': image.mode,
+                    'width': image.width, 'height': image.height, 'bytes': size,
+                }
+                image.verify()
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+            raise MediaError('The image could not be read. Please upload a JPG, PNG, GIF or WebP file.')
+        return metadata
+    if job.content_type.startswith('video'):
+        if size > MAX_VIDEO_BYTES:
+            raise MediaError('Video file too large. Maximum size is 100MB.')
+        return {'kind': 'video', 'content_type': job.content_type, 'bytes': size}
+    raise MediaError('Invalid file type. Please upload an image or video.')
+
+def _publish(job, post, metadata):
+    """Make a processed post visible: counters, hashtags, mentions and feed fan-out.
+
+    The status change is a conditional UPDATE, so when a job requeued as stale
+    is still running in another worker only the first copy to finish publishes.
+    Returns False without touching anything if this copy lost.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        published = Post.objects.filter(id=post.id, status='processing').update(
+            image=post.image.name or '', video=post.video.name or '', status='ready', published_at=now,
+        )
+        if not published:
+            return False
+        post.status, post.published_at = 'ready', now
+        counters.increment(post.user, 'posts_count')
+        tags.link_hashtags(post, post.caption)
+        tags.record_mentions(post.user, post.caption, post)
+        feed.fan_out_post(post)
+        MediaJob.objects.filter(id=job.id).update(
+            status='done', progress=100, metadata=metadata, staged_file='', finished_at=timezone.now(),
+        )
+        # The post is live once this commits, so cleanup failures must not discard its media
+        transaction.on_commit(lambda: _after_publish(job))
+    return True
+
+def _after_publish(job):
+    try:
+        job.staged_file.delete(save=False)
+        search.cache.invalidate('posts')
+    except Exception:
+        logger.warning(f"Cleanup after publishing media job {job.id} failed", exc_info=True)
+
+def process(job_id):
+    """Validate, store and publish one claimed job; returns its final status.
+
+    Runs in a process_media pool worker, never in a web request. Never raises:
+    database errors put the job back in the queue until MAX_ATTEMPTS, anything
+    else fails it.
+    """
+    try:
+        return _process(job_id)
+    finally:
+        # Spawned pool workers never run atexit, so buffered counter deltas are
+        # written at the end of every job rather than when the worker exits
+        if counters.WRITE_BEHIND:
+            counters.buffer.flush()
+
+def _process(job_id):
+    job = MediaJob.objects.select_related('post__user').get(id=job_id)
+    post = job.post
+    try:
+        metadata = _inspect(job)
+        _set_progress(job, 20)
+
+        field = post.image if metadata['kind'] == 'image' else post.video
+        with job.staged_file.open('rb') as handle:
+            field.save(os.path.basename(job.staged_file.name), File(handle), save=False)
+        _set_progress(job, 50)
+
+        if metadata['kind'] == 'image':
+            metadata['derivatives'] = len(images.generate(post.image))
+        _set_progress(job, 90)
+
+        if not _publish(job, post, metadata):
+            # Another copy of this job finished it first; report its outcome
+            _discard(post)
+            return MediaJob.objects.filter(id=job.id).values_list('status', flat=True).first()
+        return 'done'
+    except MediaError as e:
+        _fail(job, str(e))
+        return 'failed'
+    except DatabaseError:
+        logger.warning(f"Media job {job_id} hit a database error", exc_info=True)
+        _discard(post)
+        if job.attempts < MAX_ATTEMPTS:
+            _requeue(job)
+            return 'queued'
+        _fail(job, 'Processing failed. Please try uploading again.')
+        return 'failed'
+    except Exception:
+        logger.exception(f"Media job {job_id} failed")
+        _discard(post)
+        _fail(job, 'Processing failed. Please try uploading again.')
+        return 'failed'
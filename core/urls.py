@@ -12,12 +12,14 @@ urlpatterns = [
     # Main pages
     path('', views.home, name='home'),
     path('explore/', views.explore, name='explore'),
+    path('explore/tags/<str:name>/', views.tag_posts, name='tag_posts'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('edit-profile/', views.edit_profile, name='edit_profile'),
     path('settings/', views.settings, name='settings'),
     path('create-story/', views.create_story, name='create_story'),
     path('followers/<str:username>/', views.followers_list, name='followers_list'),
     path('following/<str:username>/', views.following_list, name='following_list'),
+    path('notifications/', views.notifications_view, name='notifications'),
     
     # Posts
     path('create-post/', views.create_post, name='create_post'),
@@ -33,14 +35,22 @@ urlpatterns = [
     path('ajax/follow-user/', views.follow_user, name='follow_user'),
     path('ajax/add-comment/', views.add_comment, name='add_comment'),
     path('ajax/send-message/', views.send_message, name='send_message'),
+    path('ajax/get-messages/<int:conversation_id>/', views.get_messages, name='get_messages'),
+    path('ajax/mark-conversation-read/', views.mark_conversation_read, name='mark_conversation_read'),
+    path('ajax/poll-messages/<int:conversation_id>/', views.poll_messages, name='poll_messages'),
     path('ajax/save-post/', views.save_post, name='save_post'),
     path('ajax/share-post/', views.share_post, name='share_post'),
     path('ajax/upload-progress/', views.upload_progress, name='upload_progress'),
     path('ajax/like-comment/', views.like_comment, name='like_comment'),
+    path('ajax/batch-actions/', views.batch_actions, name='batch_actions'),
     path('ajax/search/', views.search_posts, name='search_posts'),
     path('ajax/search-users/', views.search_users, name='search_users'),
+    path('ajax/search-cache-stats/', views.search_cache_stats, name='search_cache_stats'),
     path('ajax/create-conversation/', views.create_conversation, name='create_conversation'),
     path('ajax/suggested-users/', views.suggested_users, name='suggested_users'),
+    path('ajax/load-posts/', views.load_posts, name='load_posts'),
+    path('ajax/notifications/', views.get_notifications, name='get_notifications'),
+    path('ajax/mark-notifications-read/', views.mark_notifications_read, name='mark_notifications_read'),
     
     # Group management AJAX endpoints
     path('ajax/remove-group-member/', views.remove_group_member, name='remove_group_member'),
@@ -1,17 +1,22 @@
 import uuid
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Q, Count, Exists, OuterRef
-from .models import User, Post, Comment, Like, Follow, Conversation, Message, Notification, CommentLike, SavedPost, Share, Story
+from django.db import transaction
+from .models import User, Post, Comment, Like, Follow, Conversation, Message, Notification, CommentLike, SavedPost, Share, Story, Hashtag, MediaJob
+from . import conversations, counters, engagement, feed, graph, images, notifications, realtime, search, suggestions, tags, typeahead, uploads
+from .pagination import paginate
+from django.template.loader import render_to_string
 from django.core.files.storage import default_storage
-from django.http import JsonResponse, HttpResponseRedirect
+from django.http import Http404, JsonResponse, HttpResponseRedirect
 from django.core.files.base import ContentFile
+from django.core.handlers.asgi import ASGIRequest
+import asyncio
 import os
-from PIL import Image
 import json
 import logging
 from django.urls import reverse
@@ -43,6 +48,7 @@ def register_view(request):
             messages.error(request, 'Email already exists')
         else:
             user = User.objects.create_user(username=username, email=email, password=password)
+            typeahead.index.update(user)
             login(request, user)
             return redirect('core:home')
     return render(request, 'auth/register.html')
@@ -53,37 +59,52 @@ def logout_view(request):
 
 @login_required
 def home(request):
-    # Get posts from followed users
-    following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
-    posts = Post.objects.filter(Q(user__in=following_users) | Q(user=request.user))
+    # Get posts from the user's materialized timeline
+    page = feed.home_feed(request.user, cursor=request.GET.get('cursor'))
+    feed.annotate_posts(page.items, request.user)
     
-    # Get suggested users
-    suggested_users = User.objects.exclude(
-        Q(id=request.user.id) | 
-        Q(id__in=following_users)
-    )[:5]
+    # Get suggested users from the precomputed friends-of-friends table
+    suggested_users = suggestions.suggested_for(request.user, 5)
+    images.attach([(suggested, 'profile_picture') for suggested in suggested_users])
     
     context = {
-        'posts': posts,
+        'posts': page.items,
+        'next_cursor': page.next_cursor,
         'suggested_users': suggested_users,
     }
     return render(request, 'core/home.html', context)
 
 @login_required
 def explore(request):
-    posts = Post.objects.all()
-    return render(request, 'core/explore.html', {'posts': posts})
+    page = feed.explore_feed(request.GET.get('cursor'))
+    feed.annotate_posts(page.items, request.user)
+    return render(request, 'core/explore.html', {'posts': page.items, 'next_cursor': page.next_cursor})
+
+@login_required
+def tag_posts(request, name):
+    hashtag = get_object_or_404(Hashtag, name=name.lower())
+    page = feed.tag_feed(hashtag, request.GET.get('cursor'))
+    feed.annotate_posts(page.items, request.user)
+    return render(request, 'core/tag.html', {'hashtag': hashtag, 'posts': page.items, 'next_cursor': page.next_cursor})
 
 @login_required
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(user=user)
-    is_following = Follow.objects.filter(follower=request.user, following=user).exists()
+    page = paginate(Post.objects.filter(user=user, status='ready').select_related('user'), request.GET.get('cursor'))
+    feed.annotate_posts(page.items, request.user)
+    is_following = graph.follows.is_following(request.user.id, user.id)
+    
+    # Accounts the viewer follows that also follow this profile
+    followed_by_ids = graph.follows.followed_by(request.user.id, user.id) if user != request.user else []
+    followed_by = User.objects.in_bulk(followed_by_ids[:2].tolist()).values() if len(followed_by_ids) else []
     
     context = {
         'profile_user': user,
-        'posts': posts,
+        'posts': page.items,
+        'next_cursor': page.next_cursor,
         'is_following': is_following,
+        'followed_by': list(followed_by),
+        'followed_by_others': max(len(followed_by_ids) - 2, 0),
     }
     return render(request, 'core/profile.html', context)
 
@@ -98,7 +119,11 @@ def edit_profile(request):
         if 'profile_picture' in request.FILES:
             user.profile_picture = request.FILES['profile_picture']
         
-        user.save()
+        # Counters are maintained atomically elsewhere; never write them back from here
+        user.save(update_fields=['first_name', 'bio', 'website', 'profile_picture'])
+        if 'profile_picture' in request.FILES:
+            images.generate(user.profile_picture)
+        typeahead.index.update(user)
         messages.success(request, 'Profile updated successfully')
         return redirect('core:profile', username=user.username)
     
@@ -129,14 +154,11 @@ def create_post(request):
                 'caption': caption,
                 'alt_text': alt_text,
                 'hide_counts': hide_counts,
-                'disable_comments': disable_comments
+                'disable_comments': disable_comments,
+                'status': 'processing'
             }
             
-            if media.content_type.startswith('image'):
-                post_kwargs['image'] = media
-            elif media.content_type.startswith('video'):
-                post_kwargs['video'] = media
-            else:
+            if not media.content_type.startswith(('image', 'video')):
                 logger.warning(f"Invalid media type: {media.content_type}")
                 error_msg = 'Invalid file type. Please upload an image or video.'
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -144,16 +166,21 @@ def create_post(request):
                 messages.error(request, error_msg)
                 return render(request, 'core/create_post.html')
 
-            # Save post to database
-            from .models import Post
-            post = Post.objects.create(**post_kwargs)
-            logger.info(f"Post created successfully: {post.id}")
+            # Stage the upload; the process_media worker validates it, writes the
+            # derivatives and publishes the post
+            with transaction.atomic():
+                post = Post.objects.create(**post_kwargs)
+                job = uploads.enqueue(post, media)
+            logger.info(f"Post {post.id} queued as media job {job.id}")
 
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
                     'success': True,
-                    'redirect': reverse('core:home')
+                    'redirect': reverse('core:home'),
+                    'upload_id': job.id,
+                    'post_id': post.id
                 })
+            messages.info(request, 'Your post will appear once its media has been processed')
             return HttpResponseRedirect(reverse('core:home'))
 
         except Exception as e:
@@ -168,39 +195,52 @@ def create_post(request):
 
 @login_required
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    comments = Comment.objects.filter(post=post)
+    post = get_object_or_404(Post.objects.select_related('user'), id=post_id)
+    # Only the author can see a post whose media is still processing or failed
+    if post.status != 'ready' and post.user != request.user:
+        raise Http404
+    feed.annotate_posts([post], request.user)
+    comments = Comment.objects.filter(post=post).select_related('user')
     return render(request, 'core/post_detail.html', {'post': post, 'comments': comments})
 
 @login_required
-def messages_view(request):
-    conversations = Conversation.objects.filter(participants=request.user).order_by('-updated_at')
+def notifications_view(request):
+    page = paginate(
+        Notification.objects.filter(user=request.user).select_related('from_user', 'post'),
+        request.GET.get('cursor'),
+        order_field='updated_at'
+    )
+    notifications.attach_actors(page.items)
     
-    # Annotate each conversation with whether it has unread messages from others
-    for conversation in conversations:
-        has_unread = conversation.messages.filter(
-            is_read=False
-        ).exclude(sender=request.user).exists()  # Use exclude() for "not equal"
-        
-        conversation.has_unread = has_unread  # Add as an attribute for template use
+    # Opening the inbox clears the badge; the page still shows what was unread
+    notifications.mark_read(request.user)
     
-    return render(request, 'core/messages.html', {'conversations': conversations})
+    return render(request, 'core/notifications.html', {
+        'notifications': page.items,
+        'next_cursor': page.next_cursor
+    })
+
+@login_required
+def messages_view(request):
+    memberships = conversations.inbox(request.user)
+    return render(request, 'core/messages.html', {'memberships': memberships})
 
 @login_required
 def conversation_detail(request, conversation_id):
     conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
-    messages = Message.objects.filter(conversation=conversation)
+    page = conversations.message_history(conversation.id)
+    conversations.mark_read(conversation.id, request.user)
+    context = {
+        'conversation': conversation,
+        'messages': page.items,
+        'last_message_id': page.items[-1].id if page.items else 0,
+        'next_cursor': page.next_cursor
+    }
     
     if conversation.is_group:
-        return render(request, 'core/group_detail.html', {
-            'conversation': conversation,
-            'messages': messages
-        })
+        return render(request, 'core/group_detail.html', context)
     else:
-        return render(request, 'core/conversation_detail.html', {
-            'conversation': conversation,
-            'messages': messages
-        })
+        return render(request, 'core/conversation_detail.html', context)
 
 @login_required
 def create_group(request):
@@ -208,20 +248,17 @@ def create_group(request):
         group_name = request.POST.get('group_name')
         participant_usernames = request.POST.getlist('participants')
         
-        conversation = Conversation.objects.create(
-            is_group=True,
-            group_name=group_name,
-            admin=request.user
-        )
-        
-        conversation.participants.add(request.user)
-        for username in participant_usernames:
-            try:
-                user = User.objects.get(username=username)
-                conversation.participants.add(user)
-            except User.DoesNotExist:
-                pass
+        users, unknown = conversations.resolve_usernames(participant_usernames)
+        with transaction.atomic():
+            conversation = Conversation.objects.create(
+                is_group=True,
+                group_name=group_name,
+                admin=request.user
+            )
+            conversations.add_members(conversation, [request.user] + [u for u in users if u.id != request.user.id])
         
+        if unknown:
+            messages.warning(request, f"No users found for: {', '.join(unknown)}")
         return redirect('core:conversation_detail', conversation_id=conversation.id)
     
     users = User.objects.exclude(id=request.user.id)
@@ -241,6 +278,7 @@ def settings(request):
             user.phone_number = request.POST.get('phone_number', '')
             user.is_private = request.POST.get('is_private') == 'on'
             
+            previous_picture = user.profile_picture.name
             if 'profile_picture' in request.FILES:
                 # Process profile picture
                 profile_pic = request.FILES['profile_picture']
@@ -249,7 +287,12 @@ def settings(request):
                 else:
                     user.profile_picture = profile_pic
             
-            user.save()
+            user.save(update_fields=[
+                'first_name', 'last_name', 'bio', 'website', 'phone_number', 'is_private', 'profile_picture'
+            ])
+            if user.profile_picture.name != previous_picture:
+                images.generate(user.profile_picture)
+            typeahead.index.update(user)
             messages.success(request, 'Profile updated successfully')
         
         elif action == 'change_password':
@@ -300,29 +343,42 @@ def create_story(request):
                 story.video = video
             
             story.save()
+            images.generate(story.image)
             return redirect('core:home')
         else:
             messages.error(request, 'Please select an image or video')
     
     return render(request, 'core/create_story.html')
 
+def _follow_list(request, user, page, prefix, template):
+    for follow in page.items:
+        follow.account = getattr(follow, prefix)
+    images.attach([(follow.account, 'profile_picture') for follow in page.items])
+    context = {'profile_user': user, 'follows': page.items, 'next_cursor': page.next_cursor, 'prefix': prefix}
+    
+    # Infinite scroll fetches the following pages as JSON
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({
+            'success': True,
+            'html': render_to_string('core/includes/follow_items.html', context, request=request),
+            'users': [
+                {'username': follow.account.username, 'following': follow.viewer_follows} for follow in page.items
+            ],
+            'next_cursor': page.next_cursor
+        })
+    return render(request, template, context)
+
 @login_required
 def followers_list(request, username):
     user = get_object_or_404(User, username=username)
-    followers = Follow.objects.filter(following=user).select_related('follower')
-    return render(request, 'core/followers_list.html', {
-        'profile_user': user,
-        'followers': followers
-    })
+    page = graph.followers_page(user, request.user, request.GET.get('cursor'))
+    return _follow_list(request, user, page, 'follower', 'core/followers_list.html')
 
 @login_required
 def following_list(request, username):
     user = get_object_or_404(User, username=username)
-    following = Follow.objects.filter(follower=user).select_related('following')
-    return render(request, 'core/following_list.html', {
-        'profile_user': user,
-        'following': following
-    })
+    page = graph.following_page(user, request.user, request.GET.get('cursor'))
+    return _follow_list(request, user, page, 'following', 'core/following_list.html')
 
 # AJAX Views
 @csrf_exempt
@@ -330,32 +386,26 @@ def following_list(request, username):
 def like_post(request):
     if request.method == 'POST':
         post_id = request.POST.get('post_id')
-        post = get_object_or_404(Post, id=post_id)
+        post = get_object_or_404(Post, id=post_id, status='ready')
         
         like, created = Like.objects.get_or_create(user=request.user, post=post)
         
         if not created:
-            like.delete()
-            post.likes_count -= 1
+            # Only count the unlike if this request actually removed the row
+            if Like.objects.filter(pk=like.pk).delete()[0]:
+                counters.increment(post, 'likes_count', -1)
             liked = False
         else:
-            post.likes_count += 1
+            counters.increment(post, 'likes_count')
             liked = True
             
             if post.user != request.user:
-                Notification.objects.create(
-                    user=post.user,
-                    from_user=request.user,
-                    notification_type='like',
-                    post=post
-                )
-        
-        post.save()
+                notifications.notify(post.user, request.user, 'like', post=post)
         
         return JsonResponse({
             'success': True,
             'liked': liked,
-            'likes_count': post.likes_count
+            'likes_count': counters.current_value(post, 'likes_count')
         })
 
 @csrf_exempt
@@ -374,28 +424,25 @@ def follow_user(request):
         )
         
         if not created:
-            follow.delete()
-            user_to_follow.followers_count -= 1
-            request.user.following_count -= 1
+            if Follow.objects.filter(pk=follow.pk).delete()[0]:
+                counters.increment(user_to_follow, 'followers_count', -1)
+                counters.increment(request.user, 'following_count', -1)
+            graph.follows.changed(request.user.id, user_to_follow.id)
+            feed.prune_unfollow(request.user, user_to_follow)
             following = False
         else:
-            user_to_follow.followers_count += 1
-            request.user.following_count += 1
+            graph.follows.changed(request.user.id, user_to_follow.id)
+            feed.backfill_follow(request.user, user_to_follow)
+            counters.increment(user_to_follow, 'followers_count')
+            counters.increment(request.user, 'following_count')
             following = True
             
-            Notification.objects.create(
-                user=user_to_follow,
-                from_user=request.user,
-                notification_type='follow'
-            )
-        
-        user_to_follow.save()
-        request.user.save()
+            notifications.notify(user_to_follow, request.user, 'follow')
         
         return JsonResponse({
             'success': True,
             'following': following,
-            'followers_count': user_to_follow.followers_count
+            'followers_count': counters.current_value(user_to_follow, 'followers_count')
         })
 
 @csrf_exempt
@@ -409,19 +456,18 @@ def add_comment(request):
             return JsonResponse({'success': False, 'error': 'Comment cannot be empty'})
         
         post = get_object_or_404(Post, id=post_id)
+        if post.status != 'ready' and post.user != request.user:
+            raise Http404
         comment = Comment.objects.create(user=request.user, post=post, text=text.strip())
         
-        post.comments_count += 1
-        post.save()
+        counters.increment(post, 'comments_count')
         
         if post.user != request.user:
-            Notification.objects.create(
-                user=post.user,
-                from_user=request.user,
-                notification_type='comment',
-                post=post,
-                comment=comment
-            )
+            notifications.notify(post.user, request.user, 'comment', post=post, comment=comment)
+        # Only the author's own comments on a published post can add it to a hashtag page
+        if post.user_id == request.user.id and post.status == 'ready':
+            tags.link_hashtags(post, comment.text)
+        tags.record_mentions(request.user, comment.text, post, comment)
         
         return JsonResponse({
             'success': True,
@@ -439,7 +485,7 @@ def add_comment(request):
 def save_post(request):
     if request.method == 'POST':
         post_id = request.POST.get('post_id')
-        post = get_object_or_404(Post, id=post_id)
+        post = get_object_or_404(Post, id=post_id, status='ready')
         
         saved_post, created = SavedPost.objects.get_or_create(user=request.user, post=post)
         
@@ -454,6 +500,31 @@ def save_post(request):
             'saved': saved
         })
 
+@csrf_exempt
+@login_required
+def batch_actions(request):
+    if request.method == 'POST':
+        # Accepts a JSON body {"actions": [...]} or a form field holding the same list
+        try:
+            if request.content_type == 'application/json':
+                actions = json.loads(request.body).get('actions', [])
+            else:
+                actions = json.loads(request.POST.get('actions', '[]'))
+        except (ValueError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'})
+        
+        if not isinstance(actions, list):
+            return JsonResponse({'success': False, 'error': 'actions must be a list'})
+        
+        results, errors = engagement.apply_batch(request.user, actions)
+        return JsonResponse({
+            'success': True,
+            'results': results,
+            'errors': errors
+        })
+    
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
 @csrf_exempt
 @login_required
 def share_post(request):
@@ -468,19 +539,16 @@ def share_post(request):
         if share_type == 'message' and conversation_id:
             conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
             
-            # Create share record
-            Share.objects.create(
-                user=request.user,
-                post=post,
-                conversation=conversation
-            )
-            
-            # Send message with shared post
-            Message.objects.create(
-                conversation=conversation,
-                sender=request.user,
-                text=f"Shared a post by @{post.user.username}"
-            )
+            with transaction.atomic():
+                # Create share record
+                Share.objects.create(
+                    user=request.user,
+                    post=post,
+                    conversation=conversation
+                )
+                
+                # Send message with shared post
+                conversations.send(conversation, request.user, f"Shared a post by @{post.user.username}")
             
             return JsonResponse({'success': True, 'message': 'Post shared successfully'})
         
@@ -495,16 +563,20 @@ def share_post(request):
 @login_required
 def upload_progress(request):
     if request.method == 'POST':
-        upload_id = request.POST.get('upload_id')
-        # This would typically use a cache or session to track upload progress
-        # For now, we'll return a mock progress
-        progress = min(100, int(request.POST.get('progress', 0)) + 10)
+        upload_id = request.POST.get('upload_id', '')
+        job = MediaJob.objects.filter(id=upload_id, user=request.user).first() if upload_id.isdigit() else None
+        if job is None:
+            return JsonResponse({'success': False, 'error': 'Upload not found'})
         
         return JsonResponse({
             'success': True,
-            'progress': progress,
-            'status': 'uploading' if progress < 100 else 'complete'
+            'progress': job.progress,
+            'status': job.status,
+            'error': job.error,
+            'post_id': job.post_id
         })
+    
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
 
 @csrf_exempt
 @login_required
@@ -516,19 +588,17 @@ def like_comment(request):
         like, created = CommentLike.objects.get_or_create(user=request.user, comment=comment)
         
         if not created:
-            like.delete()
-            comment.likes_count -= 1
+            if CommentLike.objects.filter(pk=like.pk).delete()[0]:
+                counters.increment(comment, 'likes_count', -1)
             liked = False
         else:
-            comment.likes_count += 1
+            counters.increment(comment, 'likes_count')
             liked = True
         
-        comment.save()
-        
         return JsonResponse({
             'success': True,
             'liked': liked,
-            'likes_count': comment.likes_count
+            'likes_count': counters.current_value(comment, 'likes_count')
         })
 
 @csrf_exempt
@@ -540,18 +610,15 @@ def search_users(request):
         if len(query) < 2:
             return JsonResponse({'results': []})
         
-        users = User.objects.filter(
-            Q(username__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query)
-        ).exclude(id=request.user.id)[:10]
+        # Answered from the in-memory index alone, without a database query
+        users = typeahead.index.search(query, 10, exclude={request.user.id})
         
         results = []
-        for user in users:
+        for user in users[:10]:
             results.append({
-                'username': user.username,
-                'full_name': user.get_full_name(),
-                'profile_picture': user.profile_picture.url if user.profile_picture else None
+                'username': user['username'],
+                'full_name': user['full_name'],
+                'profile_picture': user['profile_picture']
             })
         
         return JsonResponse({'results': results})
@@ -567,32 +634,94 @@ def send_message(request):
             return JsonResponse({'success': False, 'error': 'Message cannot be empty'})
         
         conversation = get_object_or_404(Conversation, id=conversation_id, participants=request.user)
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=request.user,
-            text=text.strip()
-        )
-        
-        conversation.save()  # Updates updated_at
-        
-        # Create notifications for other participants
-        for participant in conversation.participants.exclude(id=request.user.id):
-            Notification.objects.create(
-                user=participant,
-                from_user=request.user,
-                notification_type='message'
-            )
+        # Notifications for the other participants are created by the outbox worker
+        message = conversations.send(conversation, request.user, text.strip())
         
         return JsonResponse({
             'success': True,
-            'message': {
-                'id': message.id,
-                'sender': message.sender.username,
-                'text': message.text,
-                'created_at': message.created_at.strftime('%H:%M')
-            }
+            'message': realtime.message_payload(message)
         })
 
+@csrf_exempt
+@login_required
+def mark_conversation_read(request):
+    if request.method == 'POST':
+        try:
+            conversation_id = int(request.POST['conversation_id'])
+        except (KeyError, ValueError):
+            return JsonResponse({'success': False, 'error': 'Invalid conversation id'}, status=400)
+        # Updates only the user's own membership row, so zero rows means not a member
+        if not conversations.mark_read(conversation_id, request.user):
+            return JsonResponse({'success': False, 'error': 'Conversation not found'}, status=404)
+        return JsonResponse({'success': True})
+    
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+@login_required
+def get_messages(request, conversation_id):
+    # ?before=<cursor> pages back through history, ?after=<message id> returns
+    # only what a reconnecting client missed, neither returns the latest page
+    if not Conversation.objects.filter(id=conversation_id, participants=request.user).exists():
+        return JsonResponse({'success': False, 'error': 'Conversation not found'}, status=404)
+    
+    after = request.GET.get('after')
+    if after is not None:
+        try:
+            page = conversations.messages_after(conversation_id, int(after))
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid message id'})
+    else:
+        page = conversations.message_history(conversation_id, request.GET.get('before'))
+    
+    return JsonResponse({
+        'success': True,
+        'messages': [realtime.message_payload(message) for message in page.items],
+        'next_cursor': page.next_cursor,
+        'has_more': page.has_more
+    })
+
+@csrf_exempt
+@login_required
+async def poll_messages(request, conversation_id):
+    # Long-poll fallback for clients without WebSockets: returns messages newer
+    # than ?after=<id> at once, or waits for the broker to announce one. Under
+    # WSGI waiting would hold a worker thread, so it answers at once and tells
+    # the client when to poll again.
+    user = await request.auser()
+    if not await Conversation.objects.filter(id=conversation_id, participants=user).aexists():
+        return JsonResponse({'success': False, 'error': 'Conversation not found'}, status=404)
+    
+    try:
+        after = int(request.GET.get('after', 0))
+    except ValueError:
+        after = 0
+    
+    newer = Message.objects.filter(conversation_id=conversation_id, id__gt=after).select_related('sender').order_by('id')
+    if not isinstance(request, ASGIRequest):
+        messages = [message async for message in newer[:100]]
+        return JsonResponse({
+            'success': True,
+            'messages': [realtime.message_payload(message) for message in messages],
+            'retry_after': 0 if messages else realtime.WSGI_POLL_INTERVAL,
+        })
+    
+    subscription = realtime.get_broker().subscribe(realtime.conversation_channel(conversation_id))
+    try:
+        messages = [message async for message in newer[:100]]
+        if not messages:
+            try:
+                await subscription.get(timeout=realtime.POLL_TIMEOUT)
+                messages = [message async for message in newer[:100]]
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        subscription.close()
+    
+    return JsonResponse({
+        'success': True,
+        'messages': [realtime.message_payload(message) for message in messages]
+    })
+
 @csrf_exempt
 @login_required
 def create_conversation(request):
@@ -602,44 +731,26 @@ def create_conversation(request):
         if not participant_usernames:
             return JsonResponse({'success': False, 'error': 'No participants selected'})
         
-        # Check if conversation already exists for these participants
-        participants = [request.user]
-        for username in participant_usernames:
-            try:
-                user = User.objects.get(username=username)
-                participants.append(user)
-            except User.DoesNotExist:
-                continue
+        users, unknown = conversations.resolve_usernames(participant_usernames)
+        participants = [request.user] + [u for u in users if u.id != request.user.id]
         
         if len(participants) < 2:
-            return JsonResponse({'success': False, 'error': 'Invalid participants'})
+            return JsonResponse({'success': False, 'error': 'Invalid participants', 'unknown_usernames': unknown})
         
-        # For 1-on-1 conversations, check if it already exists
+        # 1-on-1 conversations are unique per pair of users
         if len(participants) == 2:
-            existing_conversation = Conversation.objects.filter(
-                is_group=False,
-                participants__in=participants
-            ).annotate(
-                participant_count=Count('participants')
-            ).filter(participant_count=2).first()
-            
-            if existing_conversation:
-                return JsonResponse({
-                    'success': True,
-                    'conversation_id': existing_conversation.id
-                })
-        
-        # Create new conversation
-        conversation = Conversation.objects.create(
-            is_group=len(participants) > 2
-        )
-        
-        for participant in participants:
-            conversation.participants.add(participant)
+            conversation, _ = conversations.get_or_create_direct(*participants)
+        else:
+            with transaction.atomic():
+                conversation = Conversation.objects.create(
+                    is_group=True
+                )
+                conversations.add_members(conversation, participants)
         
         return JsonResponse({
             'success': True,
-            'conversation_id': conversation.id
+            'conversation_id': conversation.id,
+            'unknown_usernames': unknown
         })
 
 # Group management AJAX views
@@ -666,11 +777,7 @@ def remove_group_member(request):
             conversation.participants.remove(user_to_remove)
             
             # Send system message
-            Message.objects.create(
-                conversation=conversation,
-                sender=request.user,
-                text=f"{user_to_remove.username} was removed from the group"
-            )
+            conversations.send(conversation, request.user, f"{user_to_remove.username} was removed from the group")
             
             return JsonResponse({'success': True})
             
@@ -699,11 +806,7 @@ def leave_group(request):
         conversation.participants.remove(request.user)
         
         # Send system message
-        Message.objects.create(
-            conversation=conversation,
-            sender=request.user,
-            text=f"{request.user.username} left the group"
-        )
+        conversations.send(conversation, request.user, f"{request.user.username} left the group")
         
         return JsonResponse({'success': True})
 
@@ -735,27 +838,20 @@ def add_group_members(request):
         if conversation.admin != request.user:
             return JsonResponse({'success': False, 'error': 'Only admin can add members'})
         
-        added_users = []
-        for username in usernames:
-            try:
-                user = User.objects.get(username=username)
-                if not conversation.participants.filter(id=user.id).exists():
-                    conversation.participants.add(user)
-                    added_users.append(user.username)
-            except User.DoesNotExist:
-                continue
-        
-        if added_users:
-            # Send system message
-            Message.objects.create(
-                conversation=conversation,
-                sender=request.user,
-                text=f"{', '.join(added_users)} {'was' if len(added_users) == 1 else 'were'} added to the group"
-            )
+        users, unknown = conversations.resolve_usernames(usernames)
+        with transaction.atomic():
+            added, present = conversations.add_members(conversation, users)
+            added_users = [user.username for user in added]
+            
+            if added_users:
+                # Send system message
+                conversations.send(conversation, request.user, f"{', '.join(added_users)} {'was' if len(added_users) == 1 else 'were'} added to the group")
         
         return JsonResponse({
             'success': True,
-            'added_users': added_users
+            'added_users': added_users,
+            'unknown_usernames': unknown,
+            'already_members': [user.username for user in present]
         })
 
 @csrf_exempt
@@ -770,20 +866,14 @@ def search_users_for_group(request):
         
         # Get current group members to exclude them
         conversation = get_object_or_404(Conversation, id=conversation_id, is_group=True)
-        current_members = conversation.participants.all()
-        
-        users = User.objects.filter(
-            Q(username__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query)
-        ).exclude(id__in=current_members.values_list('id', flat=True))[:10]
+        current_members = set(conversation.members.values_list('user_id', flat=True))
         
         results = []
-        for user in users:
+        for user in typeahead.index.search(query, 10, exclude=current_members):
             results.append({
-                'username': user.username,
-                'full_name': user.get_full_name(),
-                'profile_picture': user.profile_picture.url if user.profile_picture else None
+                'username': user['username'],
+                'full_name': user['full_name'],
+                'profile_picture': user['profile_picture']
             })
         
         return JsonResponse({'users': results})
@@ -798,35 +888,31 @@ def search_posts(request):
             return JsonResponse({'posts': [], 'users': []})
         
         # Search users
-        users = User.objects.filter(
-            Q(username__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query)
-        ).exclude(id=request.user.id)[:5]
+        users = typeahead.index.search(query, 5, exclude={request.user.id})
+        
+        # Search posts by caption and alt text
+        def find_posts():
+            results = []
+            for post in search.search_posts(query):
+                results.append({
+                    'id': post.id,
+                    'username': post.user.username,
+                    'caption': post.caption[:100] + '...' if len(post.caption) > 100 else post.caption,
+                    'image': post.image.url if post.image else None,
+                    'video': post.video.url if post.video else None,
+                    'likes_count': post.likes_count
+                })
+            return results
         
-        # Search posts by caption
-        posts = Post.objects.filter(
-            caption__icontains=query
-        )[:10]
+        post_results = search.cache.get_or_set('posts', query, find_posts)
         
         user_results = []
-        for user in users:
+        for user in users[:5]:
             user_results.append({
-                'username': user.username,
-                'full_name': user.get_full_name(),
-                'profile_picture': user.profile_picture.url if user.profile_picture else '/static/images/default-avatar.jpg',
-                'followers_count': user.followers_count
-            })
-        
-        post_results = []
-        for post in posts:
-            post_results.append({
-                'id': post.id,
-                'username': post.user.username,
-                'caption': post.caption[:100] + '...' if len(post.caption) > 100 else post.caption,
-                'image': post.image.url if post.image else None,
-                'video': post.video.url if post.video else None,
-                'likes_count': post.likes_count
+                'username': user['username'],
+                'full_name': user['full_name'],
+                'profile_picture': user['profile_picture'] or '/static/images/default-avatar.jpg',
+                'followers_count': user['followers_count']
             })
         
         return JsonResponse({
@@ -834,24 +920,112 @@ def search_posts(request):
             'posts': post_results
         })
 
+@staff_member_required
+def search_cache_stats(request):
+    # Counters of the worker that answers; each process keeps its own
+    return JsonResponse(search.cache.stats())
+
+@csrf_exempt
+@login_required
+def load_posts(request):
+    if request.method == 'POST':
+        source = request.POST.get('source')
+        cursor = request.POST.get('cursor')
+        context = {'source': source}
+        
+        if source == 'home':
+            page = feed.home_feed(request.user, cursor=cursor)
+        elif source == 'explore':
+            page = feed.explore_feed(cursor)
+        elif source == 'tag':
+            hashtag = get_object_or_404(Hashtag, name=request.POST.get('tag', '').lower())
+            page = feed.tag_feed(hashtag, cursor)
+        elif source == 'profile':
+            profile_user = get_object_or_404(User, username=request.POST.get('username'))
+            page = paginate(Post.objects.filter(user=profile_user, status='ready').select_related('user'), cursor)
+            context['profile_user'] = profile_user
+        else:
+            return JsonResponse({'success': False, 'error': 'Invalid source'})
+        
+        feed.annotate_posts(page.items, request.user)
+        context['posts'] = page.items
+        return JsonResponse({
+            'success': True,
+            'html': render_to_string('core/includes/post_page.html', context, request=request),
+            'post_ids': [post.id for post in page.items],
+            'next_cursor': page.next_cursor
+        })
+    
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
 @csrf_exempt
 @login_required
-def suggested_users(request):
+def get_notifications(request):
     if request.method == 'POST':
-        # Get users that the current user is not following
-        following_users = Follow.objects.filter(follower=request.user).values_list('following', flat=True)
+        page = paginate(
+            Notification.objects.filter(user=request.user).select_related('from_user', 'post'),
+            request.POST.get('cursor'),
+            order_field='updated_at'
+        )
+        notifications.attach_actors(page.items)
         
-        suggested_users = User.objects.exclude(
-            Q(id=request.user.id) | 
-            Q(id__in=following_users)
-        ).order_by('-followers_count')[:10]  # Order by popularity
+        results = []
+        for notification in page.items:
+            results.append({
+                'id': notification.id,
+                'type': notification.notification_type,
+                'from_user': notification.from_user.username,
+                'from_user_avatar': notification.from_user.profile_picture.url if notification.from_user.profile_picture else None,
+                'actors': [actor.username for actor in notification.actors],
+                'actor_count': notification.actor_count,
+                'post_id': notification.post_id,
+                'post_image': notification.post.image.url if notification.post and notification.post.image else None,
+                'is_read': notification.is_read,
+                'updated_at': notification.updated_at.strftime('%Y-%m-%d %H:%M')
+            })
+        
+        return JsonResponse({
+            'success': True,
+            'notifications': results,
+            'next_cursor': page.next_cursor,
+            'unread_count': counters.current_value(request.user, 'unread_notifications_count')
+        })
+    
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+@csrf_exempt
+@login_required
+def mark_notifications_read(request):
+    if request.method == 'POST':
+        # Without ids every unread notification is marked read
+        try:
+            notification_ids = [int(value) for value in request.POST.getlist('notification_ids')] or None
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid notification id'}, status=400)
+        marked = notifications.mark_read(request.user, notification_ids)
+        
+        return JsonResponse({
+            'success': True,
+            'marked': marked,
+            'unread_count': counters.current_value(request.user, 'unread_notifications_count')
+        })
+    
+    return JsonResponse({'success': False, 'error': 'Invalid request method'})
+
+@csrf_exempt
+@login_required
+def suggested_users(request):
+    if request.method == 'POST':
+        # Get users that the current user is not following, best friends-of-friends first
+        suggested_users = suggestions.suggested_for(request.user, 10)
         
         results = []
         for user in suggested_users:
             results.append({
                 'username': user.username,
                 'full_name': user.get_full_name(),
-                'profile_picture': user.profile_picture.url if user.profile_picture else '/static/images/default-avatar.jpg'
+                'profile_picture': user.profile_picture.url if user.profile_picture else '/static/images/default-avatar.jpg',
+                'mutual_count': getattr(user, 'mutual_count', 0),
             })
         
         return JsonResponse({
@@ -0,0 +1,18 @@
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'social_media.settings')
+django_application = get_asgi_application()
+
+# Imported after setup so the app registry is ready
+from core import typeahead  # noqa: E402
+from core.realtime import websocket_application  # noqa: E402
+
+# Warm in-process indexes so the first requests do not pay for loading them
+typeahead.warm()
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -55,6 +56,13 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'social_media.wsgi.application'
+ASGI_APPLICATION = 'social_media.asgi.application'
+
+# Pub/sub backend that pushes new messages to WebSocket and long-poll clients.
+# The database broker reaches clients on any process, so messages sent through
+# WSGI workers are pushed by the ASGI ones; core.realtime.InMemoryBroker only
+# reaches clients served by the process that sent the message.
+REALTIME_BROKER = 'core.realtime.DatabaseBroker'
 
 # Database
 DATABASES = {
@@ -96,6 +104,34 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Caches
+# Must be shared by every worker process. The file backend covers all workers
+# on one host; use Redis or Memcached when running on several.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'social-media-cache'),
+    },
+    # Search responses only, so their churn never culls anything else. Entries
+    # are disposable: the generation in their keys is kept in the database.
+    'search': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'social-media-search-cache'),
+        'TIMEOUT': 30,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+
+# Search responses: per-process LRU in front of the shared cache alias above
+# (None keeps cached responses per process; invalidations still reach every
+# worker through the database)
+SEARCH_CACHE_ALIAS = 'search'
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 30
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -3,3 +3,7 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'social_media.settings')
 application = get_wsgi_application()
+
+# Warm in-process indexes so the first requests do not pay for loading them
+from core import typeahead  # noqa: E402
+typeahead.warm()
@@ -48,6 +48,10 @@ document.addEventListener("DOMContentLoaded", () => {
 
   initializeMessaging()
 
+  setupInfiniteScroll()
+
+  setupFollowListScroll()
+
   // Setup new message modal handlers
   const newMessageBtn = document.querySelector(".new-message-btn")
   if (newMessageBtn) {
@@ -106,9 +110,9 @@ document.addEventListener("DOMContentLoaded", () => {
   })
 })
 
-function initializeLikeStates() {
+function initializeLikeStates(root = document) {
   // This would typically fetch from server, but for demo we'll use data attributes
-  const likeBtns = document.querySelectorAll(".like-btn")
+  const likeBtns = root.querySelectorAll(".like-btn")
   likeBtns.forEach((btn) => {
     const postElement = btn.closest("[data-post-id]")
     if (postElement) {
@@ -139,8 +143,8 @@ function initializeFollowStates() {
   })
 }
 
-function setupCommentHandlers() {
-  const commentInputs = document.querySelectorAll(".comment-input")
+function setupCommentHandlers(root = document) {
+  const commentInputs = root.querySelectorAll(".comment-input")
   commentInputs.forEach((input) => {
     const postBtn = input.parentElement.querySelector(".post-comment-btn")
 
@@ -166,8 +170,8 @@ function setupCommentHandlers() {
   })
 }
 
-function setupDoubleTapLike() {
-  const postImages = document.querySelectorAll(".post-image img, .detail-image")
+function setupDoubleTapLike(root = document) {
+  const postImages = root.querySelectorAll(".post-image img, .detail-image")
   postImages.forEach((img) => {
     let tapCount = 0
     let tapTimer = null
@@ -219,6 +223,95 @@ function showLikeAnimation(element) {
   }, 1000)
 }
 
+// Infinite scroll for cursor-paginated post lists (home, explore, profile)
+function setupInfiniteScroll() {
+  const container = document.querySelector("[data-feed-source]")
+  if (!container || !("IntersectionObserver" in window)) return
+
+  const sentinel = document.createElement("div")
+  sentinel.className = "feed-sentinel"
+  container.after(sentinel)
+
+  let loading = false
+  const observer = new IntersectionObserver((entries) => {
+    if (!entries[0].isIntersecting || loading) return
+
+    const cursor = container.dataset.nextCursor
+    if (!cursor) {
+      observer.disconnect()
+      return
+    }
+
+    loading = true
+    const data = { source: container.dataset.feedSource, cursor: cursor }
+    if (container.dataset.profileUsername) {
+      data.username = container.dataset.profileUsername
+    }
+    if (container.dataset.tag) {
+      data.tag = container.dataset.tag
+    }
+
+    makeAjaxRequest("/ajax/load-posts/", data, (response) => {
+      if (response.success) {
+        const page = document.createElement("div")
+        page.innerHTML = response.html
+        initializeLikeStates(page)
+        setupCommentHandlers(page)
+        setupDoubleTapLike(page)
+        container.append(...page.children)
+        container.dataset.nextCursor = response.next_cursor || ""
+      }
+      loading = false
+      // Re-observe so a sentinel that is still on screen triggers the next page
+      observer.unobserve(sentinel)
+      observer.observe(sentinel)
+    })
+  }, { rootMargin: "600px" })
+
+  observer.observe(sentinel)
+}
+
+// Infinite scroll for the cursor-paginated followers and following lists
+function setupFollowListScroll() {
+  const container = document.querySelector("[data-follow-list]")
+  if (!container || !("IntersectionObserver" in window)) return
+
+  const sentinel = document.createElement("div")
+  sentinel.className = "feed-sentinel"
+  container.after(sentinel)
+
+  let loading = false
+  const observer = new IntersectionObserver((entries) => {
+    if (!entries[0].isIntersecting || loading) return
+
+    const cursor = container.dataset.nextCursor
+    if (!cursor) {
+      observer.disconnect()
+      return
+    }
+
+    loading = true
+    fetch(`${container.dataset.followList}?cursor=${encodeURIComponent(cursor)}`, {
+      headers: { "X-Requested-With": "XMLHttpRequest" },
+    })
+      .then((response) => response.json())
+      .then((data) => {
+        if (!data.success) return
+        const page = document.createElement("div")
+        page.innerHTML = data.html
+        container.append(...page.children)
+        container.dataset.nextCursor = data.next_cursor || ""
+      })
+      .finally(() => {
+        loading = false
+        observer.unobserve(sentinel)
+        observer.observe(sentinel)
+      })
+  }, { rootMargin: "600px" })
+
+  observer.observe(sentinel)
+}
+
 // CSRF token helper
 function getCookie(name) {
   let cookieValue = null
@@ -863,6 +956,141 @@ function updateConversationPreview(conversationId, lastMessage) {
   }
 }
 
+// Receive new messages as they are sent: a WebSocket when the server supports it,
+// otherwise long-polling. Each message is passed to onMessage once, in order.
+function subscribeToConversation(conversationId, lastMessageId, onMessage) {
+  let lastId = lastMessageId || 0
+  let polling = false
+
+  const deliver = (message) => {
+    if (message.id <= lastId) return
+    lastId = message.id
+    onMessage(message)
+  }
+
+  // Fetch only what was sent since the last message we have
+  const catchUp = () => {
+    fetch(`/ajax/get-messages/${conversationId}/?after=${lastId}`)
+      .then((response) => response.json())
+      .then((data) => {
+        if (!data.success) return
+        data.messages.forEach(deliver)
+        if (data.has_more) catchUp()
+      })
+  }
+
+  const poll = () => {
+    fetch(`/ajax/poll-messages/${conversationId}/?after=${lastId}`)
+      .then((response) => response.json())
+      .then((data) => {
+        if (data.success) data.messages.forEach(deliver)
+        // Servers that cannot hold the request open say when to ask again
+        setTimeout(poll, data.success ? (data.retry_after || 0) * 1000 : 5000)
+      })
+      .catch(() => setTimeout(poll, 5000))
+  }
+
+  const startPolling = () => {
+    if (polling) return
+    polling = true
+    poll()
+  }
+
+  if (!("WebSocket" in window)) {
+    startPolling()
+    return
+  }
+
+  const scheme = window.location.protocol === "https:" ? "wss" : "ws"
+  const socket = new WebSocket(`${scheme}://${window.location.host}/ws/messages/${conversationId}/`)
+  socket.addEventListener("open", catchUp)
+  socket.addEventListener("message", (e) => deliver(JSON.parse(e.data)))
+  // Also covers servers without WebSocket support, where the handshake fails
+  socket.addEventListener("close", startPolling)
+}
+
+function buildMessageElement(message, sent, showSender) {
+  const element = document.createElement("div")
+  element.className = `message ${sent ? "sent" : "received"}`
+  element.dataset.messageId = message.id
+
+  if (!sent) {
+    const avatar = document.createElement("img")
+    avatar.className = "message-avatar"
+    avatar.src = message.sender_avatar || "/static/images/default-avatar.jpg"
+    avatar.alt = message.sender
+    element.appendChild(avatar)
+  }
+
+  const bubble = document.createElement("div")
+  bubble.className = "message-bubble"
+  if (showSender && !sent) {
+    const sender = document.createElement("div")
+    sender.className = "message-sender"
+    sender.textContent = message.sender
+    bubble.appendChild(sender)
+  }
+  if (message.image) {
+    const image = document.createElement("img")
+    image.className = "message-image"
+    image.src = message.image
+    image.alt = "Shared image"
+    bubble.appendChild(image)
+  }
+  if (message.text) {
+    const text = document.createElement("div")
+    text.className = showSender ? "message-content" : "message-text"
+    text.textContent = message.text
+    bubble.appendChild(text)
+  }
+  const time = document.createElement("div")
+  time.className = "message-time"
+  time.textContent = message.created_at
+  bubble.appendChild(time)
+  element.appendChild(bubble)
+  return element
+}
+
+function appendReceivedMessage(container, message, showSender) {
+  const list = container.querySelector(".messages-list")
+  if (!list || list.querySelector(`[data-message-id="${message.id}"]`)) return
+
+  const noMessages = list.querySelector(".no-messages")
+  if (noMessages) noMessages.remove()
+  list.appendChild(buildMessageElement(message, false, showSender))
+  container.scrollTop = container.scrollHeight
+}
+
+// Load older messages a page at a time when the user scrolls to the top
+function setupMessageHistory(container, conversationId, currentUserId, showSender) {
+  const list = container.querySelector(".messages-list")
+  let loading = false
+
+  container.addEventListener("scroll", () => {
+    const cursor = container.dataset.nextCursor
+    if (loading || !cursor || container.scrollTop > 100) return
+    loading = true
+
+    fetch(`/ajax/get-messages/${conversationId}/?before=${encodeURIComponent(cursor)}`)
+      .then((response) => response.json())
+      .then((data) => {
+        if (!data.success) return
+        const previousHeight = container.scrollHeight
+        const fragment = document.createDocumentFragment()
+        data.messages.forEach((message) => {
+          fragment.appendChild(buildMessageElement(message, message.sender_id === currentUserId, showSender))
+        })
+        list.insertBefore(fragment, list.firstChild)
+        // Keep the messages the user was looking at in place
+        container.scrollTop += container.scrollHeight - previousHeight
+        container.dataset.nextCursor = data.next_cursor || ""
+      })
+      .finally(() => {
+        loading = false
+      })
+  })
+}
+
 function startNewConversation() {
   const modal = document.getElementById("newMessageModal")
   if (modal) {